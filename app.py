@@ -1,23 +1,112 @@
 import os
 import logging
-import csv
-import io
 import json
-import re
-import pandas as pd
 import zipfile
 import tempfile
 import shutil
-from collections import Counter, defaultdict
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
-from utils.html_parser import extract_shipping_info
+import uuid
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, send_file
+from utils.html_parser import extract_shipping_report, classify_page
+from utils.result_cache import ResultCache, content_key
+from utils.batch_extract import (
+    ORDER_TEXT_EXTENSIONS, BatchError, read_uploaded_documents, extract_many, merge_addresses, merge_asin_results,
+    tally_asins_many
+)
+from utils.worker_pool import JobTimeout, PoolBusy, create_parser_pool
+from utils.csv_export import SHIPPING_CSV_COLUMNS, csv_download_headers, iter_csv, shipping_csv_rows
+from utils.db import data_path
+from utils.session_store import SqliteSessionInterface
+from utils.order_store import OrderStore
+from utils.heavy_hitters import SpaceSaving
+from utils.asin_tally import AsinTallyStore
+from utils.asin_catalog import AsinCatalog
+from utils.shopping_lists import ShoppingListConflict, ShoppingListStore, row_change_errors, validate_list_rows
+from utils.shipping_address import AddressJSONProvider, ShippingAddress, session_serializer
+from utils.extraction_jobs import FINISHED_STATES, JOB_CANCELLED, JOB_DONE, ExtractionJobs
+from utils.asin_parser import count_asin_tokens, parse_asin_blocks, read_text_chunks, tally_asin_items
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
 app = Flask(__name__)
+app.json = AddressJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-app.config['SESSION_TYPE'] = 'filesystem'  # Store session data on the filesystem
+
+# Keep session data (addresses, ASIN counts) in a SQLite file shared by all workers;
+# the cookie only carries a signed session ID
+app.session_interface = SqliteSessionInterface(
+    data_path(app, 'sessions.db'),
+    ttl=float(os.environ.get("SESSION_TTL", 24 * 3600)),
+    max_sessions=int(os.environ.get("SESSION_MAX_COUNT", 5000)),
+    max_bytes=int(os.environ.get("SESSION_MAX_BYTES", 256 * 1024 * 1024)),
+    serializer=session_serializer()
+)
+
+# Extraction results keyed by a hash of the pasted HTML, so re-pasting the same page skips the parser
+extraction_cache = ResultCache(
+    max_entries=int(os.environ.get("EXTRACT_CACHE_ENTRIES", 64)),
+    max_bytes=int(os.environ.get("EXTRACT_CACHE_BYTES", 16 * 1024 * 1024)),
+    ttl=float(os.environ.get("EXTRACT_CACHE_TTL", 900))
+)
+
+# Large pastes are parsed in a pre-warmed process pool so one big page doesn't hold the GIL for everyone
+parser_pool = create_parser_pool(
+    max_workers=int(os.environ.get("PARSER_WORKERS", 2)),
+    max_queue=int(os.environ.get("PARSER_QUEUE", 8)),
+    timeout=float(os.environ.get("PARSER_TIMEOUT", 30))
+)
+
+# Every extracted order and when it was exported, to catch orders that show up on two pastes
+order_store = OrderStore(data_path(app, 'orders.db'))
+
+# Written to Ref01 for orders that were already in an earlier CSV
+EXPORTED_ORDER_FLAG = 'ALREADY EXPORTED'
+
+# Very large pastes can be extracted as background jobs in the parser pool that the page polls for progress
+extraction_jobs = ExtractionJobs(
+    data_path(app, 'jobs.db'),
+    parser_pool,
+    ttl=float(os.environ.get("EXTRACT_JOB_TTL", 3600)),
+    time_budget=float(os.environ.get("EXTRACT_JOB_TIME_BUDGET", 300))
+)
+
+# Running ASIN tallies built up paste by paste; kept a week after their last change
+asin_tallies = AsinTallyStore(
+    data_path(app, 'asin_tallies.db'),
+    ttl=float(os.environ.get("ASIN_TALLY_TTL", 7 * 24 * 3600))
+)
+
+# Titles from advanced extractions, looked up for the basic counter and the CSV downloads
+asin_catalog = AsinCatalog(
+    data_path(app, 'asin_catalog.db'),
+    cache_entries=int(os.environ.get("ASIN_CATALOG_CACHE_ENTRIES", 10000)),
+    cache_ttl=float(os.environ.get("ASIN_CATALOG_CACHE_TTL", 300))
+)
+
+# Editable shopping lists from the advanced ASIN counter, edited row by row
+shopping_lists = ShoppingListStore(
+    data_path(app, 'shopping_lists.db'),
+    ttl=float(os.environ.get("SHOPPING_LIST_TTL", 24 * 3600))
+)
+
+# Rows of ASIN results rendered per page, and the most one window request may ask for
+ASIN_PAGE_SIZE = 100
+ASIN_MAX_WINDOW = 500
+
+# Pastes up to this size are cheaper to parse inline than to ship to a worker
+PARSE_INLINE_MAX_BYTES = int(os.environ.get("PARSE_INLINE_MAX_BYTES", 64 * 1024))
+
+# Seconds an extraction may spend in total and in each parser strategy; a strategy
+# that runs out is skipped so one pathological paste can't hold a worker forever
+EXTRACT_TIME_BUDGET = float(os.environ.get("EXTRACT_TIME_BUDGET", 20))
+EXTRACT_STRATEGY_BUDGET = float(os.environ.get("EXTRACT_STRATEGY_BUDGET", 8))
+
+# Seconds a whole batch of uploaded files may take in the parser pool
+BATCH_TIME_BUDGET = float(os.environ.get("BATCH_TIME_BUDGET", 300))
+
+# Top-K mode of the simple ASIN counter: ASINs tracked by default and at most
+ASIN_TOP_K_DEFAULT = 100
+ASIN_TOP_K_MAX = int(os.environ.get("ASIN_TOP_K_MAX", 10000))
 
 # Default ship from details - these stay the same for all orders
 DEFAULT_SHIP_FROM = {
@@ -31,11 +120,133 @@ DEFAULT_SHIP_FROM = {
     "PostalCodeFrom": "89123"
 }
 
+# Address fields the operator can change after extraction
+ADDRESS_PATCH_FIELDS = (
+    'ToName', 'PhoneTo', 'Street1To', 'CompanyTo', 'Street2To', 'CityTo', 'StateTo', 'ZipTo', 'order_id',
+    'Weight', 'length', 'width', 'height', 'description'
+)
+
+def store_dataset(addresses):
+    """
+    Keep extracted addresses in the session so later requests can refer to them by handle,
+    and record their orders in the order store.
+    
+    Args:
+        addresses (iterable): ShippingAddress records or address dicts; the first one becomes
+            the current address. They are stored as ShippingAddress records.
+        
+    Returns:
+        dict: 'dataset_id', the handle the client sends back with patches and CSV requests,
+              and 'previously_exported', the order IDs that already went out in a CSV
+    """
+    addresses = [ShippingAddress(address, current_address='true' if i == 0 else 'false')
+                 for i, address in enumerate(addresses)]
+    dataset_id = uuid.uuid4().hex
+    session['all_addresses'] = addresses
+    session['dataset_id'] = dataset_id
+    
+    # Losing the duplicate check must not lose the extraction
+    try:
+        previously_exported = order_store.record(addresses)
+    except Exception as e:
+        logging.error(f"Error recording orders: {str(e)}")
+        previously_exported = set()
+    
+    return {
+        "dataset_id": dataset_id,
+        "previously_exported": [address['order_id'] for address in addresses
+                                if address.get('order_id') in previously_exported]
+    }
+
+def running_tally_summary():
+    """
+    Returns:
+        dict: The session's running ASIN tally summary, or None if it has no pastes
+    """
+    tally_id = session.get('asin_tally_id')
+    if not tally_id:
+        return None
+    summary = asin_tallies.summary(tally_id)
+    return summary if summary['pastes'] else None
+
+def store_shopping_list(sorted_data, source=None):
+    """
+    Keep an advanced ASIN result for download and as an editable shopping list.
+    
+    Args:
+        sorted_data (list): (asin, {'title', 'qty'}) pairs, in display order
+        source (str): What the list was built from, such as one version of the running
+            tally, so the list can be reused while that is unchanged; None for a one-off paste
+        
+    Returns:
+        dict: The list's first page (see ShoppingListStore.window) plus its 'id' and 'page_size'
+    """
+    session['advanced_asin_data'] = sorted_data
+    list_id = shopping_lists.create(sorted_data)
+    session['shopping_list_id'] = list_id
+    session['shopping_list_source'] = source
+    return {**shopping_lists.window(list_id, 0, ASIN_PAGE_SIZE), 'id': list_id, 'page_size': ASIN_PAGE_SIZE}
+
+def current_shopping_list(source):
+    """
+    Returns:
+        dict: The session's shopping list, like store_shopping_list() returns it, if it was
+              built from source and is still stored; otherwise None
+    """
+    list_id = session.get('shopping_list_id')
+    if not list_id or session.get('shopping_list_source') != source:
+        return None
+    window = shopping_lists.window(list_id, 0, ASIN_PAGE_SIZE)
+    return {**window, 'id': list_id, 'page_size': ASIN_PAGE_SIZE} if window else None
+
+def tally_source(tally_id, summary):
+    """
+    Returns:
+        str: The shopping list source for one version of a running tally
+    """
+    return f"tally:{tally_id}:{summary['version']}"
+
+def read_window_args():
+    """
+    Returns:
+        tuple: (offset, limit) from the query string, or None if they aren't valid
+    """
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', ASIN_PAGE_SIZE, type=int)
+    if offset is None or limit is None or offset < 0 or not 1 <= limit <= ASIN_MAX_WINDOW:
+        return None
+    return offset, limit
+
+def remember_titles(sorted_data):
+    """
+    Add the titles from an advanced extraction to the ASIN catalog.
+    
+    Args:
+        sorted_data (list): (asin, {'title', 'qty'}) pairs
+    """
+    # Losing the catalog update must not lose the extraction
+    try:
+        asin_catalog.record({asin: info['title'] for asin, info in sorted_data})
+    except Exception as e:
+        logging.error(f"Error recording ASIN titles: {str(e)}")
+
+def lookup_titles(asins):
+    """
+    Returns:
+        dict: ASIN -> title from the ASIN catalog; empty if the catalog can't be read
+    """
+    try:
+        return asin_catalog.titles(asins)
+    except Exception as e:
+        logging.error(f"Error looking up ASIN titles: {str(e)}")
+        return {}
+
 @app.route('/')
 def index():
     # Clear any existing session data
     if 'all_addresses' in session:
         session.pop('all_addresses')
+    session.pop('dataset_id', None)
     return render_template('index.html', ship_from=DEFAULT_SHIP_FROM, active_tab='shipping')
 
 @app.route('/asin-counter')
@@ -43,6 +254,19 @@ def asin_extractor():
     # Clear any existing ASIN data
     if 'asin_data' in session:
         session.pop('asin_data')
+    
+    # A running tally outlives single extractions; show it again if there is one.
+    # Its shopping list is built once per tally version, so reloads keep the edits made to it
+    running_tally = running_tally_summary()
+    if running_tally:
+        tally_id = session['asin_tally_id']
+        source = tally_source(tally_id, running_tally)
+        shopping_list = current_shopping_list(source)
+        if shopping_list is None:
+            shopping_list = store_shopping_list(asin_tallies.sorted_tally(tally_id), source)
+        return render_template('asin_counter.html', shopping_list=shopping_list, running_tally=running_tally,
+                               active_tab='asin')
+    
     if 'advanced_asin_data' in session:
         session.pop('advanced_asin_data')
     return render_template('asin_counter.html', active_tab='asin')
@@ -53,15 +277,10 @@ def store_addresses():
         # Get addresses from the request JSON
         addresses = request.json.get('addresses', [])
         
-        # Default the current_address field for the first address
-        if addresses and len(addresses) > 0:
-            for i, addr in enumerate(addresses):
-                addr['current_address'] = 'true' if i == 0 else 'false'
-        
-        # Store addresses in session
-        session['all_addresses'] = addresses
+        # Store addresses in session, the first one being the current address
+        dataset = store_dataset(addresses)
         
-        return jsonify({"success": True, "message": "Addresses stored successfully"})
+        return jsonify({"success": True, "message": "Addresses stored successfully", **dataset})
     except Exception as e:
         logging.error(f"Error storing addresses: {str(e)}")
         return jsonify({"error": f"Error storing addresses: {str(e)}"}), 500
@@ -74,20 +293,187 @@ def extract():
         return jsonify({"error": "No HTML content provided"}), 400
     
     try:
-        shipping_info = extract_shipping_info(html_content)
+        # Reuse the result if this exact page was extracted recently
+        cache_key = content_key(html_content)
+        shipping_info = extraction_cache.get(cache_key)
+        skipped_strategies = []
+        
+        if shipping_info is None:
+            # Reject pasted product pages, carts and the like before paying for a parse
+            page = classify_page(html_content)
+            if page['error']:
+                return jsonify({"error": page['error'], "page_type": page['kind']}), 400
+            
+            budgets = {'time_budget': EXTRACT_TIME_BUDGET, 'strategy_budget': EXTRACT_STRATEGY_BUDGET}
+            if len(html_content) <= PARSE_INLINE_MAX_BYTES:
+                report = extract_shipping_report(html_content, page=page, **budgets)
+            else:
+                report = parser_pool.run(extract_shipping_report, html_content, page=page, **budgets)
+            shipping_info = report['result']
+            skipped_strategies = report['skipped']
+            
+            # A result reached after skipping a strategy may not be the best one; don't keep it
+            if shipping_info and not skipped_strategies:
+                extraction_cache.put(cache_key, shipping_info)
         
         if not shipping_info:
-            return jsonify({"error": "Could not extract shipping information from the HTML"}), 400
+            error = "Could not extract shipping information from the HTML"
+            if skipped_strategies:
+                error += " (some parsing steps ran out of time; try pasting fewer orders at a time)"
+            return jsonify({"error": error, "skipped_strategies": skipped_strategies}), 400
+        
+        # Keep the addresses server-side; the client only sends back changes
+        multiple = isinstance(shipping_info, list)
+        dataset = store_dataset(shipping_info if multiple else [shipping_info])
         
         # Check if we have multiple addresses or a single address
-        if isinstance(shipping_info, list):
-            return jsonify({"success": True, "data": shipping_info, "multiple": True})
-        else:
-            return jsonify({"success": True, "data": shipping_info, "multiple": False})
+        return jsonify({
+            "success": True,
+            "data": shipping_info,
+            "multiple": multiple,
+            "skipped_strategies": skipped_strategies,
+            **dataset
+        })
+    except PoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except JobTimeout as e:
+        logging.warning(f"Extraction timed out: {str(e)}")
+        return jsonify({"error": f"{str(e)}. Try pasting fewer orders at a time."}), 504
     except Exception as e:
         logging.error(f"Error extracting shipping info: {str(e)}")
         return jsonify({"error": f"Error processing HTML: {str(e)}"}), 500
 
+@app.route('/extract/cache-stats')
+def extract_cache_stats():
+    """Hit/miss counters for the extraction result cache"""
+    return jsonify(extraction_cache.stats())
+
+@app.route('/extract/pool-stats')
+def extract_pool_stats():
+    """Job counters for the parser worker pool"""
+    return jsonify(parser_pool.stats())
+
+@app.route('/asin-catalog/stats')
+def asin_catalog_stats():
+    """Size of the ASIN catalog and hit/miss counters for its cache"""
+    return jsonify(asin_catalog.stats())
+
+@app.route('/extract-jobs', methods=['POST'])
+def submit_extraction_job():
+    """Start extracting a large paste in the background and return a job ID to poll"""
+    html_content = request.form.get('html_content', '')
+    
+    if not html_content:
+        return jsonify({"error": "No HTML content provided"}), 400
+    
+    try:
+        # Reject pasted product pages, carts and the like before starting a job
+        page = classify_page(html_content)
+        if page['error']:
+            return jsonify({"error": page['error'], "page_type": page['kind']}), 400
+        
+        job_id = extraction_jobs.submit(html_content, page=page)
+        return jsonify({"success": True, "job_id": job_id, "status_url": url_for('extraction_job', job_id=job_id)}), 202
+    except PoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logging.error(f"Error starting extraction job: {str(e)}")
+        return jsonify({"error": f"Error processing HTML: {str(e)}"}), 500
+
+@app.route('/extract-jobs/<job_id>')
+def extraction_job(job_id):
+    """Progress of an extraction job; once it is done, the same response as /extract"""
+    job = extraction_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Extraction job not found or expired"}), 404
+    
+    progress = {key: job[key] for key in ('status', 'stage', 'rows_scanned', 'rows_total', 'addresses_found',
+                                          'skipped_strategies')}
+    if job['status'] not in FINISHED_STATES:
+        return jsonify(progress)
+    
+    if job['status'] != JOB_DONE:
+        return jsonify(dict(progress, error=job['error'])), 409 if job['status'] == JOB_CANCELLED else 400
+    
+    # Keep the addresses server-side like /extract does
+    shipping_info = job['result']
+    multiple = isinstance(shipping_info, list)
+    return jsonify(dict(
+        progress,
+        success=True,
+        data=shipping_info,
+        multiple=multiple,
+        **store_dataset(shipping_info if multiple else [shipping_info])
+    ))
+
+@app.route('/extract-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_extraction_job(job_id):
+    """Stop a running extraction job"""
+    if not extraction_jobs.cancel(job_id):
+        return jsonify({"error": "Extraction job not found or already finished"}), 404
+    return jsonify({"success": True})
+
+@app.route('/extract-batch', methods=['POST'])
+def extract_batch():
+    """Extract shipping info from many uploaded HTML files (or zips of them) in one request"""
+    try:
+        documents = read_uploaded_documents(request.files.getlist('html_files'))
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if not documents:
+        return jsonify({"error": "No HTML files provided"}), 400
+    
+    try:
+        # Parse the documents in the shared pool, then merge and drop orders seen in an earlier file
+        results = extract_many(documents, parser_pool, timeout=BATCH_TIME_BUDGET,
+                               time_budget=EXTRACT_TIME_BUDGET, strategy_budget=EXTRACT_STRATEGY_BUDGET)
+        addresses, summary, duplicates = merge_addresses(documents, results)
+        
+        if not addresses:
+            return jsonify({"error": "Could not extract shipping information from any of the files",
+                            "documents": summary}), 400
+        
+        return jsonify({
+            "success": True,
+            "data": addresses if len(addresses) > 1 else addresses[0],
+            "multiple": len(addresses) > 1,
+            **store_dataset(addresses),
+            "documents": summary,
+            "duplicates": duplicates
+        })
+    except PoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except JobTimeout as e:
+        logging.warning(f"Batch extraction timed out: {str(e)}")
+        return jsonify({"error": f"{str(e)}. Try uploading fewer files at a time."}), 504
+    except Exception as e:
+        logging.error(f"Error extracting shipping info from batch: {str(e)}")
+        return jsonify({"error": f"Error processing HTML files: {str(e)}"}), 500
+
+@app.route('/addresses/<dataset_id>/<int:index>', methods=['PATCH'])
+def patch_address(dataset_id, index):
+    """Apply the operator's changes (edits, package dimensions) to one stored address"""
+    if session.get('dataset_id') != dataset_id:
+        return jsonify({"error": "These addresses are no longer stored. Please extract them again."}), 404
+    
+    changes = request.get_json(silent=True)
+    if not isinstance(changes, dict):
+        return jsonify({"error": "Expected a JSON object of changed fields"}), 400
+    
+    unknown = set(changes) - set(ADDRESS_PATCH_FIELDS)
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    
+    addresses = session.get('all_addresses', [])
+    if not 0 <= index < len(addresses):
+        return jsonify({"error": f"No address at index {index}"}), 404
+    
+    addresses[index].update({field: str(value) for field, value in changes.items()})
+    session['all_addresses'] = addresses
+    
+    return jsonify({"success": True})
+
 @app.route('/generate-csv', methods=['POST'])
 def generate_csv():
     try:
@@ -97,9 +483,20 @@ def generate_csv():
         # Check if we need to apply same dimensions to all orders
         same_dimensions = request.form.get('same_dimensions') == 'on'
         
+        # Make sure the page is still working on the addresses stored in the session
+        dataset_id = request.form.get('dataset_id')
+        if merge_orders and dataset_id and dataset_id != session.get('dataset_id'):
+            return jsonify({"error": "These addresses are no longer stored. Please extract them again."}), 409
+        
         # Get all addresses from session if merging
         all_addresses = session.get('all_addresses', []) if merge_orders else []
         
+        # The address shown in the form takes the form's dimensions
+        current_index = request.form.get('current_index', type=int)
+        if current_index is not None and 0 <= current_index < len(all_addresses):
+            for i, address in enumerate(all_addresses):
+                address['current_address'] = 'true' if i == current_index else 'false'
+        
         # If not merging or no addresses in session, create a single entry
         if not merge_orders or not all_addresses:
             # Get data from form for a single order
@@ -121,7 +518,7 @@ def generate_csv():
             description = request.form.get('description', 'misc')
             
             # Add the single address to our list
-            all_addresses = [{
+            all_addresses = [ShippingAddress({
                 'ToName': to_name,
                 'PhoneTo': phone_to,
                 'Street1To': street1_to,
@@ -136,37 +533,21 @@ def generate_csv():
                 'width': width,
                 'height': height,
                 'description': description
-            }]
-        
-        # Create CSV data with multiple rows if needed
-        csv_data = {
-            'No': [],
-            'FromName': [],
-            'PhoneFrom': [],
-            'Street1From': [],
-            'CompanyFrom': [],
-            'Street2From': [],
-            'CityFrom': [],
-            'StateFrom': [],
-            'PostalCodeFrom': [],
-            'ToName': [],
-            'PhoneTo': [],
-            'Street1To': [],
-            'CompanyTo': [],
-            'Street2To': [],
-            'CityTo': [],
-            'ZipTo': [],
-            'StateTo': [],
-            'Weight': [],
-            'length': [],
-            'width': [],
-            'height': [],
-            'description': [],
-            'Ref01': [],
-            'Ref02': [],
-            'optional_file_name': [],
-            'optional_amazon_order_id': []
-        }
+            })]
+        
+        # Leave out or flag orders that already went out in an earlier CSV
+        # Building the CSV again from the same extraction is not a second export
+        exported_orders = request.form.get('exported_orders', 'include')
+        export_dataset = dataset_id if dataset_id and dataset_id == session.get('dataset_id') else None
+        exported = set()
+        if exported_orders in ('exclude', 'flag'):
+            exported = order_store.exported_elsewhere(
+                (address.get('order_id', '') for address in all_addresses), export_dataset
+            )
+        if exported_orders == 'exclude' and exported:
+            all_addresses = [address for address in all_addresses if address.get('order_id', '') not in exported]
+            if not all_addresses:
+                return jsonify({"error": "All of these orders were already exported"}), 409
         
         # Get current form dimensions once
         form_weight = request.form.get('Weight', '')
@@ -174,79 +555,32 @@ def generate_csv():
         form_width = request.form.get('width', '')
         form_height = request.form.get('height', '')
         form_description = request.form.get('description', 'misc')
+        form_dimensions = (form_weight, form_length, form_width, form_height, form_description)
         
-        # Loop through all addresses and add to CSV data
-        for address in all_addresses:
+        def dimensions(address):
             # Handle dimensions based on settings
             if same_dimensions and len(all_addresses) > 1:
                 # Use the form values for dimensions when applying same dimensions checkbox is checked
-                weight = form_weight
-                length = form_length
-                width = form_width
-                height = form_height
-                description = form_description
-            else:
-                # For each address, try to get the stored dimensions from packageDimensions field
-                # which contains dimensions that were set via the UI
-                order_id = address.get('order_id', '')
-                
-                # Update values from form if this is the currently active address
-                if address.get('current_address') == 'true':
-                    weight = form_weight
-                    length = form_length
-                    width = form_width
-                    height = form_height
-                    description = form_description
-                    
-                    # Also update these values in the address object for future use
-                    address['Weight'] = weight
-                    address['length'] = length
-                    address['width'] = width
-                    address['height'] = height
-                    address['description'] = description
-                else:
-                    # Use the values from the address that were previously stored
-                    weight = address.get('Weight', form_weight)
-                    length = address.get('length', form_length)
-                    width = address.get('width', form_width)
-                    height = address.get('height', form_height)
-                    description = address.get('description', form_description)
+                return form_dimensions
+            
+            # Update values from form if this is the currently active address
+            if address.get('current_address') == 'true':
+                # Also update these values in the address object for future use
+                address['Weight'] = form_weight
+                address['length'] = form_length
+                address['width'] = form_width
+                address['height'] = form_height
+                address['description'] = form_description
+                return form_dimensions
             
-            # Add this order to the CSV data
-            csv_data['No'].append(address.get('order_id', ''))
-            csv_data['FromName'].append(DEFAULT_SHIP_FROM['FromName'])
-            csv_data['PhoneFrom'].append(DEFAULT_SHIP_FROM['PhoneFrom'])
-            csv_data['Street1From'].append(DEFAULT_SHIP_FROM['Street1From'])
-            csv_data['CompanyFrom'].append(DEFAULT_SHIP_FROM['CompanyFrom'])
-            csv_data['Street2From'].append(DEFAULT_SHIP_FROM['Street2From'])
-            csv_data['CityFrom'].append(DEFAULT_SHIP_FROM['CityFrom'])
-            csv_data['StateFrom'].append(DEFAULT_SHIP_FROM['StateFrom'])
-            csv_data['PostalCodeFrom'].append(DEFAULT_SHIP_FROM['PostalCodeFrom'])
-            csv_data['ToName'].append(address.get('ToName', ''))
-            csv_data['PhoneTo'].append(address.get('PhoneTo', ''))
-            csv_data['Street1To'].append(address.get('Street1To', ''))
-            csv_data['CompanyTo'].append(address.get('CompanyTo', ''))
-            csv_data['Street2To'].append(address.get('Street2To', ''))
-            csv_data['CityTo'].append(address.get('CityTo', ''))
-            csv_data['ZipTo'].append(address.get('ZipTo', ''))
-            csv_data['StateTo'].append(address.get('StateTo', ''))
-            csv_data['Weight'].append(weight)
-            csv_data['length'].append(length)
-            csv_data['width'].append(width)
-            csv_data['height'].append(height)
-            csv_data['description'].append(description)
-            csv_data['Ref01'].append('')
-            csv_data['Ref02'].append('')
-            csv_data['optional_file_name'].append('')
-            csv_data['optional_amazon_order_id'].append('')
-        
-        # Create DataFrame
-        df = pd.DataFrame(csv_data)
-        
-        # Create in-memory CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False, quoting=csv.QUOTE_MINIMAL)
-        output.seek(0)
+            # Use the values from the address that were previously stored
+            return (
+                address.get('Weight', form_weight),
+                address.get('length', form_length),
+                address.get('width', form_width),
+                address.get('height', form_height),
+                address.get('description', form_description)
+            )
         
         # Generate filename
         if merge_orders and len(all_addresses) > 1:
@@ -255,11 +589,16 @@ def generate_csv():
             order_id = all_addresses[0].get('order_id', '')
             filename = f"shipping_order_{order_id}.csv" if order_id else "shipping_order.csv"
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        # Stream the rows out as they are written instead of building the whole file first
+        rows = shipping_csv_rows(all_addresses, DEFAULT_SHIP_FROM, dimensions)
+        if exported_orders == 'flag' and exported:
+            rows = (dict(row, Ref01=EXPORTED_ORDER_FLAG) if row['No'] in exported else row for row in rows)
+        
+        order_store.mark_exported((address.get('order_id', '') for address in all_addresses), export_dataset)
+        return Response(
+            iter_csv(SHIPPING_CSV_COLUMNS, rows),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+            headers=csv_download_headers(filename)
         )
     
     except Exception as e:
@@ -268,28 +607,59 @@ def generate_csv():
 
 @app.route('/extract-asins', methods=['POST'])
 def extract_asins():
-    """Extract ASINs from order text"""
+    """Extract ASINs from order text or an uploaded text file"""
     try:
-        # Get order text from form
-        order_text = request.form.get('order_text', '')
-        
-        if not order_text:
-            return render_template('asin_counter.html', error="Please enter order text to extract ASINs.")
+        # Get order text from the form, or stream it from an uploaded file
+        order_file = request.files.get('order_file')
+        if order_file and order_file.filename:
+            chunks = read_text_chunks(order_file.stream)
+        else:
+            order_text = request.form.get('order_text', '')
+            if not order_text:
+                return render_template('asin_counter.html', error="Please enter order text to extract ASINs.")
+            chunks = [order_text]
         
-        # Use regex to find all ASINs in the text (format: 10 alphanumeric characters)
-        asin_pattern = r'\b[A-Z0-9]{10}\b'
-        asins = re.findall(asin_pattern, order_text)
+        # Exact counts, or the top K in fixed memory however much text comes in
+        top_k = None
+        if request.form.get('mode') == 'top':
+            try:
+                top_k = int(request.form.get('top_k', ASIN_TOP_K_DEFAULT))
+            except ValueError:
+                top_k = 0
+            if not 1 <= top_k <= ASIN_TOP_K_MAX:
+                return render_template('asin_counter.html', error=f"K must be between 1 and {ASIN_TOP_K_MAX}.",
+                                       active_tab='asin')
         
-        # Count occurrences of each ASIN
-        asin_counts = Counter(asins)
+        # Count valid ASINs in one pass, skipping SKUs, order ID pieces and other ten-character codes
+        asin_counts = count_asin_tokens(chunks, tally=SpaceSaving(top_k) if top_k else None)
+        if not asin_counts:
+            return render_template('asin_counter.html', error="No ASINs found in the text.", active_tab='asin')
         
-        # Sort by count (descending)
-        sorted_asin_data = sorted(asin_counts.items(), key=lambda x: x[1], reverse=True)
+        top_k_summary = None
+        if top_k:
+            ranked = asin_counts.most_common()
+            sorted_asin_data = [(asin, count) for asin, count, _ in ranked]
+            top_k_summary = {
+                'k': top_k,
+                'total': asin_counts.total,
+                'max_error': asin_counts.max_error,
+                'errors': {asin: error for asin, _, error in ranked}
+            }
+        else:
+            # Sort by count (descending)
+            sorted_asin_data = sorted(asin_counts.items(), key=lambda x: x[1], reverse=True)
         
         # Store in session for download
         session['asin_data'] = sorted_asin_data
         
-        return render_template('asin_counter.html', asin_data=sorted_asin_data, active_tab='asin')
+        # Render the first page only; the rest is fetched from /asin-data/rows as the user asks for it
+        first_page = sorted_asin_data[:ASIN_PAGE_SIZE]
+        
+        # Show titles for the ASINs an advanced extraction has seen before
+        asin_titles = lookup_titles(asin for asin, _ in first_page)
+        
+        return render_template('asin_counter.html', asin_data=first_page, asin_total=len(sorted_asin_data),
+                               asin_titles=asin_titles, top_k_summary=top_k_summary, active_tab='asin')
         
     except Exception as e:
         logging.error(f"Error extracting ASINs: {str(e)}")
@@ -305,37 +675,37 @@ def extract_asins_advanced():
         if not order_text:
             return render_template('asin_counter.html', error="Please enter order text to extract ASINs with titles.", active_tab='asin')
         
-        # Use regex pattern to extract product titles, ASINs, and quantities
-        pattern = re.compile(
-            r"Sales channel: Amazon\.com(?:\s*Business customer)?\s+(.+?)\s+ASIN:\s+(\w+)\s+.*?Quantity:\s+(\d+)",
-            re.DOTALL
-        )
-        
-        # Store data with defaultdict
-        asin_data = defaultdict(lambda: {"title": "", "qty": 0})
-        
-        # Find all matches in the text
-        matches = list(pattern.finditer(order_text))
-        
-        if not matches:
+        # Split the text into product blocks and parse each one on its own
+        parsed = parse_asin_blocks(order_text)
+        malformed = parsed['malformed']
+        if malformed:
+            logging.warning(f"Skipped {len(malformed)} malformed product blocks")
+
+        if not parsed['items']:
             return render_template('asin_counter.html', 
                                   error="Could not find any products with the expected pattern. Make sure to copy the entire order page text.", 
+                                  malformed_blocks=malformed,
                                   active_tab='asin')
         
-        # Process each match
-        for match in matches:
-            title, asin, qty = match.groups()
-            qty = int(qty)
-            asin_data[asin]["title"] = title.strip()
-            asin_data[asin]["qty"] += qty
-        
-        # Sort by quantity in descending order
-        sorted_data = sorted(asin_data.items(), key=lambda x: x[1]["qty"], reverse=True)
+        running_tally = None
+        source = None
+        if request.form.get('accumulate') == 'on':
+            # Add only this paste's blocks to the running tally, skipping orders already in it
+            tally_id = session.setdefault('asin_tally_id', uuid.uuid4().hex)
+            added = asin_tallies.add_paste(tally_id, parsed['items'])
+            sorted_data = asin_tallies.sorted_tally(tally_id)
+            running_tally = {**asin_tallies.summary(tally_id), **added}
+            source = tally_source(tally_id, running_tally)
+        else:
+            # Add up quantities per ASIN, highest first
+            sorted_data = tally_asin_items(parsed['items'])
         
-        # Store in session for download
-        session['advanced_asin_data'] = sorted_data
+        # Store for download and editing, and keep the titles for the basic counter
+        shopping_list = store_shopping_list(sorted_data, source)
+        remember_titles(sorted_data)
         
-        return render_template('asin_counter.html', advanced_asin_data=sorted_data, active_tab='asin')
+        return render_template('asin_counter.html', shopping_list=shopping_list, malformed_blocks=malformed,
+                               running_tally=running_tally, active_tab='asin')
         
     except Exception as e:
         logging.error(f"Error extracting ASINs with titles: {str(e)}")
@@ -343,6 +713,65 @@ def extract_asins_advanced():
                               error=f"Error extracting ASINs with titles: {str(e)}", 
                               active_tab='asin')
 
+@app.route('/asin-tally/undo', methods=['POST'])
+def undo_asin_paste():
+    """Take the last paste back out of the running ASIN tally"""
+    tally_id = session.get('asin_tally_id')
+    if tally_id:
+        removed = asin_tallies.undo(tally_id)
+        logging.info(f"Removed {removed} product blocks from the running tally")
+    return redirect(url_for('asin_extractor'))
+
+@app.route('/asin-tally/clear', methods=['POST'])
+def clear_asin_tally():
+    """Start the running ASIN tally over"""
+    tally_id = session.pop('asin_tally_id', None)
+    if tally_id:
+        asin_tallies.clear(tally_id)
+    return redirect(url_for('asin_extractor'))
+
+@app.route('/extract-asins-bulk', methods=['POST'])
+def extract_asins_bulk():
+    """Build one shopping list from many uploaded order exports (text, HTML or zips of them)"""
+    try:
+        documents = read_uploaded_documents(request.files.getlist('order_files'), extensions=ORDER_TEXT_EXTENSIONS)
+    except BatchError as e:
+        return render_template('asin_counter.html', error=str(e), active_tab='asin')
+    
+    if not documents:
+        return render_template('asin_counter.html', error="Please upload at least one order export.", active_tab='asin')
+    
+    try:
+        # Tally each file in the shared pool, then add the tallies up in upload order
+        results = tally_asins_many(documents, parser_pool, timeout=BATCH_TIME_BUDGET)
+        sorted_data, summary, malformed = merge_asin_results(documents, results)
+        if malformed:
+            logging.warning(f"Skipped {len(malformed)} malformed product blocks in {len(documents)} files")
+        
+        if not sorted_data:
+            return render_template('asin_counter.html',
+                                   error="Could not find any products with the expected pattern in the uploaded files.",
+                                   malformed_blocks=malformed, bulk_summary=summary, active_tab='asin')
+        
+        # Store for download and editing, and keep the titles for the basic counter
+        shopping_list = store_shopping_list(sorted_data)
+        remember_titles(sorted_data)
+        
+        return render_template('asin_counter.html', shopping_list=shopping_list, malformed_blocks=malformed,
+                               bulk_summary=summary, active_tab='asin')
+    
+    except PoolBusy as e:
+        return render_template('asin_counter.html', error=str(e), active_tab='asin'), 503, {"Retry-After": "5"}
+    except JobTimeout as e:
+        logging.warning(f"Bulk ASIN extraction timed out: {str(e)}")
+        return render_template('asin_counter.html', error=f"{str(e)}. Try uploading fewer files at a time.",
+                               active_tab='asin'), 504
+    except Exception as e:
+        logging.error(f"Error extracting ASINs from uploaded files: {str(e)}")
+        return render_template('asin_counter.html',
+                               error=f"Error extracting ASINs from uploaded files: {str(e)}",
+                               active_tab='asin')
+
 @app.route('/download-asins')
 def download_asins():
     """Download ASIN data as CSV"""
@@ -353,86 +782,147 @@ def download_asins():
         if not asin_data:
             return redirect(url_for('asin_extractor'))
         
-        # Create CSV data
-        csv_data = {
-            'ASIN': [],
-            'Quantity': []
-        }
-        
-        for asin, count in asin_data:
-            csv_data['ASIN'].append(asin)
-            csv_data['Quantity'].append(count)
-        
-        # Create DataFrame
-        df = pd.DataFrame(csv_data)
-        
-        # Create in-memory CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False, quoting=csv.QUOTE_MINIMAL)
-        output.seek(0)
+        # Create CSV rows, with titles from the catalog where it has them (one batched lookup)
+        titles = lookup_titles(asin for asin, _ in asin_data)
+        rows = [{'ASIN': asin, 'Quantity': count, 'Title': titles.get(asin, '')} for asin, count in asin_data]
         
         # Generate filename
         filename = "asin_counts.csv"
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        return Response(
+            iter_csv(['ASIN', 'Quantity', 'Title'], rows),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+            headers=csv_download_headers(filename)
         )
     
     except Exception as e:
         logging.error(f"Error generating ASIN CSV: {str(e)}")
         return jsonify({"error": f"Error generating ASIN CSV: {str(e)}"}), 500
         
+@app.route('/asin-data/rows')
+def asin_data_rows():
+    """One window of the basic ASIN counter's results, with known titles"""
+    window = read_window_args()
+    if window is None:
+        return jsonify({"error": f"offset must be 0 or more and limit between 1 and {ASIN_MAX_WINDOW}"}), 400
+    offset, limit = window
+    
+    asin_data = session.get('asin_data', [])
+    rows = asin_data[offset:offset + limit]
+    titles = lookup_titles(asin for asin, _ in rows)
+    return jsonify({
+        "total": len(asin_data),
+        "offset": offset,
+        "rows": [{"asin": asin, "count": count, "title": titles.get(asin, '')} for asin, count in rows]
+    })
+
+@app.route('/shopping-list/<list_id>/rows')
+def shopping_list_rows(list_id):
+    """One window of a stored shopping list"""
+    window = read_window_args()
+    if window is None:
+        return jsonify({"error": f"offset must be 0 or more and limit between 1 and {ASIN_MAX_WINDOW}"}), 400
+    
+    rows = shopping_lists.window(list_id, *window) if session.get('shopping_list_id') == list_id else None
+    if rows is None:
+        return jsonify({"error": "This shopping list is no longer stored. Please extract it again."}), 404
+    return jsonify(rows)
+
+def shopping_list_csv(rows, headers=None):
+    """
+    Stream (asin, title, qty) rows as the shopping list CSV download.
+    
+    Args:
+        rows (iterable): (asin, title, qty) tuples
+        headers (dict): Extra response headers
+    """
+    return Response(
+        iter_csv(['ASIN', 'Title', 'Quantity'],
+                 ({'ASIN': asin, 'Title': title, 'Quantity': qty} for asin, title, qty in rows)),
+        mimetype='text/csv',
+        headers={**csv_download_headers("shopping_list.csv"), **(headers or {})}
+    )
+
+def save_shopping_list_changes(body):
+    """
+    Patch mode of /save-shopping-list, the way the shopping list page saves its
+    edits: store only the changed rows of the session's shopping list, then
+    download the whole list.
+    
+    Args:
+        body (dict): {'list_id', 'version', 'changes': [[index, {field: value}], ...]}
+    """
+    list_id = body.get('list_id')
+    if not list_id or session.get('shopping_list_id') != list_id:
+        return jsonify({"error": "This shopping list is no longer stored. Please extract it again."}), 404
+    
+    version = body.get('version')
+    changes = body.get('changes', [])
+    if type(version) is not int or not isinstance(changes, list):
+        return jsonify({"error": "version must be a number and changes an array of [index, changes]"}), 400
+    
+    # Check every change before storing any of them, and report all the problems together
+    errors = []
+    for i, change in enumerate(changes):
+        if not isinstance(change, list) or len(change) != 2 or type(change[0]) is not int:
+            errors.append(f"change {i}: expected [index, changes]")
+        else:
+            errors.extend(f"change {i}: {error}" for error in row_change_errors(change[1]))
+    if errors:
+        return jsonify({"error": "Invalid changes", "details": errors}), 400
+    
+    try:
+        version = shopping_lists.apply_changes(list_id, version, changes)
+    except ShoppingListConflict as e:
+        # The client reloads the list and makes its changes again
+        return jsonify({"error": str(e), "version": e.version}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if version is None:
+        return jsonify({"error": "This shopping list is no longer stored. Please extract it again."}), 404
+    
+    return shopping_list_csv(shopping_lists.rows(list_id), headers={'X-Shopping-List-Version': str(version)})
+
 @app.route('/save-shopping-list', methods=['POST'])
 def save_shopping_list():
-    """Save edited shopping list and download as CSV"""
+    """
+    Save edited shopping list and download as CSV.
+    
+    Takes a JSON body in one of two forms:
+    - {'list_id', 'version', 'changes': [[index, {field: value}], ...]}: only
+      the rows changed since version of the list stored at extraction time.
+      This is how the shopping list page saves; it is the only way to edit a
+      stored list
+    - {'rows': [[asin, title, qty], ...]}: a whole list that isn't stored
+    The numbered asin_N/title_N/qty_N form fields of older pages are still accepted.
+    """
     try:
-        # Get the count of items
-        item_count = int(request.form.get('item_count', 0))
-        
-        if item_count == 0:
-            return jsonify({"error": "No items in shopping list"}), 400
-        
-        # Create CSV data
-        csv_data = {
-            'ASIN': [],
-            'Title': [],
-            'Quantity': []
-        }
-        
-        # Process each item from the form
-        for i in range(item_count):
-            asin = request.form.get(f'asin_{i}')
-            title = request.form.get(f'title_{i}')
-            qty = request.form.get(f'qty_{i}')
-            
-            # Skip if any required field is missing
-            if not all([asin, title, qty]):
-                continue
-                
-            csv_data['ASIN'].append(asin)
-            csv_data['Title'].append(title)
-            csv_data['Quantity'].append(int(qty))
-        
-        # Create DataFrame
-        df = pd.DataFrame(csv_data)
-        
-        # Create in-memory CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False, quoting=csv.QUOTE_MINIMAL)
-        output.seek(0)
+        if request.is_json:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                return jsonify({"error": "Expected a JSON object"}), 400
+            if 'changes' in body:
+                return save_shopping_list_changes(body)
+            rows = body.get('rows')
+        else:
+            # Read the form once and turn it into the same rows as the JSON list;
+            # rows with a missing field are skipped, as they always were
+            form = request.form.to_dict()
+            item_count = int(form.get('item_count', 0))
+            rows = []
+            for i in range(item_count):
+                row = [form.get(f'asin_{i}'), form.get(f'title_{i}'), form.get(f'qty_{i}')]
+                if all(row):
+                    row[2] = int(row[2]) if row[2].isdigit() else row[2]
+                    rows.append(row)
+            if not rows:
+                return jsonify({"error": "No items in shopping list"}), 400
         
-        # Generate filename
-        filename = "shopping_list.csv"
+        rows, errors = validate_list_rows(rows)
+        if errors:
+            return jsonify({"error": "Invalid shopping list", "details": errors}), 400
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        return shopping_list_csv(rows)
     
     except Exception as e:
         logging.error(f"Error saving shopping list: {str(e)}")
@@ -448,34 +938,18 @@ def download_asins_advanced():
         if not advanced_asin_data:
             return redirect(url_for('asin_extractor'))
         
-        # Create CSV data
-        csv_data = {
-            'ASIN': [],
-            'Title': [],
-            'Quantity': []
-        }
-        
-        for asin, info in advanced_asin_data:
-            csv_data['ASIN'].append(asin)
-            csv_data['Title'].append(info['title'])
-            csv_data['Quantity'].append(info['qty'])
-        
-        # Create DataFrame
-        df = pd.DataFrame(csv_data)
-        
-        # Create in-memory CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False, quoting=csv.QUOTE_MINIMAL)
-        output.seek(0)
+        # Create CSV rows; fill in missing titles from the catalog
+        titles = lookup_titles(asin for asin, info in advanced_asin_data if not info['title'])
+        rows = [{'ASIN': asin, 'Title': info['title'] or titles.get(asin, ''), 'Quantity': info['qty']}
+                for asin, info in advanced_asin_data]
         
         # Generate filename
         filename = "asin_counts_with_titles.csv"
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        return Response(
+            iter_csv(['ASIN', 'Title', 'Quantity'], rows),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+            headers=csv_download_headers(filename)
         )
     
     except Exception as e:
@@ -512,7 +986,7 @@ def download_app():
             
             # Add requirements.txt
             with open(os.path.join(temp_dir, 'requirements.txt'), 'w') as req_file:
-                req_file.write('flask==2.0.1\nbeautifulsoup4==4.10.0\npandas==1.3.3\n')
+                req_file.write('flask==3.1.3\nbeautifulsoup4==4.10.0\n')
             zipf.write(os.path.join(temp_dir, 'requirements.txt'), 'requirements.txt')
             
             # Add README with instructions
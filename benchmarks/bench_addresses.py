@@ -0,0 +1,77 @@
+"""
+Compare memory and JSON cost of addresses as dicts, ShippingAddress records and an AddressBatch.
+
+Usage:
+    python -m benchmarks.bench_addresses
+    python -m benchmarks.bench_addresses --counts 10000 100000
+"""
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+from utils.shipping_address import AddressBatch, ShippingAddress, to_jsonable
+
+# Fields the parser fills in, plus the ones the app adds for the CSV
+PARSER_FIELDS = ('ToName', 'PhoneTo', 'Street1To', 'CompanyTo', 'Street2To', 'CityTo', 'ZipTo', 'StateTo', 'order_id')
+EXPORT_FIELDS = ('Weight', 'length', 'width', 'height', 'description', 'current_address')
+
+
+def _records(count):
+    # Distinct strings per address, as the parser produces them
+    return [
+        {name: f'{name}-{index}' for name in PARSER_FIELDS + EXPORT_FIELDS}
+        for index in range(count)
+    ]
+
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return value, size
+
+
+def _best_time(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', nargs='+', type=int, default=[10000, 100000])
+    args = parser.parse_args(argv)
+
+    print(f"{'addresses':>9}  {'container':<18} {'container MiB':>13} {'to JSON ms':>10} {'from JSON ms':>12}")
+    for count in args.counts:
+        records = _records(count)
+        encoded = json.dumps(records)
+
+        # Only the containers are measured; the field strings are the same objects in all three
+        candidates = [
+            ('list of dicts', lambda: [dict(record) for record in records], lambda: json.loads(encoded)),
+            ('ShippingAddress', lambda: [ShippingAddress(record) for record in records],
+             lambda: [ShippingAddress(record) for record in json.loads(encoded)]),
+            ('AddressBatch', lambda: AddressBatch(records), lambda: AddressBatch(json.loads(encoded))),
+        ]
+        for name, build, load in candidates:
+            value, size = _measure(build)
+            dump_seconds = _best_time(lambda: json.dumps(value, default=to_jsonable))
+            load_seconds = _best_time(load)
+            print(f"{count:>9}  {name:<18} {size / 1024 / 1024:>13.2f} {dump_seconds * 1000:>10.1f} "
+                  f"{load_seconds * 1000:>12.1f}")
+            del value
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark the ASIN counters on synthetic order list text.
+
+For the advanced counter, times utils/asin_parser.parse_asin_blocks()
+against the single DOTALL regex it replaced, for growing texts in each
+scenario, and prints the time per MB so linear scaling shows up as a flat
+column. The old regex goes quadratic when the end of a paste has blocks
+without a Quantity line, so it is only run up to --legacy-max-kb of text.
+
+For the simple counter, compares re.findall() plus Counter with
+count_asin_tokens() fed in TEXT_CHUNK_SIZE pieces, exactly and in top-K
+mode: time, peak memory on top of the text itself, how many distinct codes
+each keeps and counts in total, and the top-K error bound. Raise --products
+to see memory follow the number of distinct ASINs.
+
+For bulk uploads, times tallying --files exports of each size one after
+the other against tally_asins_many() in a ParserPool like the app's
+(--workers processes), including the reduce step.
+
+Usage:
+    python -m benchmarks.bench_asins
+    python -m benchmarks.bench_asins --blocks 5000 25000 --scenarios truncated_tail
+    python -m benchmarks.bench_asins --counters simple --products 200000 --top-k 1000
+    python -m benchmarks.bench_asins --counters bulk --files 48 --blocks 2000
+"""
+import os
+import re
+import time
+import argparse
+import tracemalloc
+from collections import Counter
+
+from benchmarks.order_text import SCENARIOS, generate_order_text
+from utils.asin_parser import TEXT_CHUNK_SIZE, count_asin_tokens, parse_asin_blocks, tally_asin_document
+from utils.batch_extract import merge_asin_results, tally_asins_many
+from utils.heavy_hitters import SpaceSaving
+from utils.worker_pool import ParserPool
+
+# The pattern /extract-asins-advanced used before parse_asin_blocks()
+LEGACY_PATTERN = re.compile(
+    r"Sales channel: Amazon\.com(?:\s*Business customer)?\s+(.+?)\s+ASIN:\s+(\w+)\s+.*?Quantity:\s+(\d+)",
+    re.DOTALL
+)
+
+# The pattern /extract-asins used before count_asin_tokens()
+LEGACY_TOKEN_PATTERN = re.compile(r'\b[A-Z0-9]{10}\b')
+
+
+def _best_time(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def _peak_memory(function):
+    tracemalloc.start()
+    try:
+        value = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, value
+
+
+def bench_advanced(args):
+    print(f"{'scenario':<15} {'blocks':>7} {'MB':>6} {'items':>7} {'malformed':>9} "
+          f"{'blocks ms':>10} {'ms/MB':>7} {'regex ms':>10} {'regex items':>11}")
+    for scenario in args.scenarios:
+        for blocks in args.blocks:
+            text = generate_order_text(blocks, scenario)
+            megabytes = len(text) / 1024 / 1024
+            seconds, parsed = _best_time(lambda: parse_asin_blocks(text))
+
+            legacy = '-'
+            legacy_items = '-'
+            if scenario != 'truncated_tail' or len(text) <= args.legacy_max_kb * 1024:
+                legacy_seconds, matches = _best_time(lambda: LEGACY_PATTERN.findall(text), repeat=1)
+                legacy = f'{legacy_seconds * 1000:.1f}'
+                legacy_items = len(matches)
+
+            print(f"{scenario:<15} {blocks:>7} {megabytes:>6.2f} {len(parsed['items']):>7} "
+                  f"{len(parsed['malformed']):>9} {seconds * 1000:>10.1f} {seconds * 1000 / megabytes:>7.1f} "
+                  f"{legacy:>10} {legacy_items:>11}")
+
+
+def _chunks(text):
+    return (text[start:start + TEXT_CHUNK_SIZE] for start in range(0, len(text), TEXT_CHUNK_SIZE))
+
+
+def bench_simple(args):
+    counters = (
+        ('findall + Counter', lambda text: Counter(LEGACY_TOKEN_PATTERN.findall(text))),
+        ('count_asin_tokens', lambda text: count_asin_tokens(_chunks(text))),
+        (f'top {args.top_k}', lambda text: count_asin_tokens(_chunks(text), tally=SpaceSaving(args.top_k))),
+    )
+    print(f"{'blocks':>7} {'MB':>6}  {'counter':<18} {'ms':>8} {'peak MiB':>9} {'tracked':>9} {'total':>8} "
+          f"{'max err':>7}")
+    for blocks in args.blocks:
+        text = generate_order_text(blocks, products=args.products)
+        for name, count in counters:
+            seconds, tally = _best_time(lambda: count(text))
+            peak, _ = _peak_memory(lambda: count(text))
+            total, max_error = (tally.total, tally.max_error) if isinstance(tally, SpaceSaving) else \
+                (sum(tally.values()), 0)
+            print(f"{blocks:>7} {len(text) / 1024 / 1024:>6.2f}  {name:<18} {seconds * 1000:>8.1f} "
+                  f"{peak / 1024 / 1024:>9.2f} {len(tally):>9} {total:>8} {max_error:>7}")
+
+
+def bench_bulk(args):
+    print(f"{'files':>5} {'blocks':>7} {'MB':>7}  {'serial ms':>10} {'pool ms':>9} {'speed-up':>8}")
+    for blocks in args.blocks:
+        documents = [(f'report-{seed}.txt', generate_order_text(blocks, seed=seed).encode('utf-8'))
+                     for seed in range(args.files)]
+        megabytes = sum(len(content) for _, content in documents) / 1024 / 1024
+        serial, expected = _best_time(
+            lambda: merge_asin_results(documents, [tally_asin_document(content) for _, content in documents]),
+            repeat=1)
+        pool = ParserPool(max_workers=args.workers, timeout=600)
+        try:
+            pool.warm()
+            pooled, merged = _best_time(lambda: merge_asin_results(documents, tally_asins_many(documents, pool)),
+                                        repeat=1)
+        finally:
+            pool.shutdown()
+        assert merged == expected
+        print(f"{args.files:>5} {blocks:>7} {megabytes:>7.1f}  {serial * 1000:>10.1f} {pooled * 1000:>9.1f} "
+              f"{serial / pooled:>7.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counters', nargs='+', choices=('advanced', 'simple', 'bulk'),
+                        default=['advanced', 'simple', 'bulk'])
+    parser.add_argument('--blocks', nargs='+', type=int, default=[1000, 5000, 10000, 25000])
+    parser.add_argument('--products', type=int, default=200, help="Distinct ASINs in the generated text")
+    parser.add_argument('--top-k', type=int, default=100, help="K for the top-K counter")
+    parser.add_argument('--files', type=int, default=24, help="Exports per bulk upload")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Pool processes for bulk uploads")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--legacy-max-kb', type=int, default=256,
+                        help="Largest text the old regex is timed on in the truncated_tail scenario")
+    args = parser.parse_args(argv)
+
+    benches = {'advanced': bench_advanced, 'simple': bench_simple, 'bulk': bench_bulk}
+    for index, name in enumerate(args.counters):
+        if index:
+            print()
+        benches[name](args)
+
+if __name__ == '__main__':
+    main()
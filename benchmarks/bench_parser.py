@@ -0,0 +1,146 @@
+"""
+Benchmark utils/html_parser.py on synthetic order pages.
+
+For every layout and page size this reports, per stage of the parser, the
+best wall time over a few runs and, from a separate run under tracemalloc,
+the memory still allocated after the stage and the peak reached during it.
+The stages are the BeautifulSoup parse, the single candidate-collecting
+walk, each strategy on its own, the region-limited row path, and the whole
+extract_shipping_report() call.
+
+Usage:
+    python -m benchmarks.bench_parser
+    python -m benchmarks.bench_parser --layouts buyer_spans text --sizes 100 1000 --noise 5
+    python -m benchmarks.bench_parser --json > before.json
+    python -m benchmarks.bench_parser --sizes 10000 --no-memory
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from benchmarks.order_pages import LAYOUTS, SIZES, generate_order_page
+from utils.html_parser import (
+    STRATEGIES, collect_candidates, extract_order_rows, extract_shipping_report, find_order_regions, row_cache
+)
+
+
+def _stages(html_content):
+    """
+    The parser stages to measure for one page.
+
+    Returns:
+        list: (name, setup, run) tuples; setup() builds the stage's input and is
+              not measured, run(input) is
+    """
+    def parsed():
+        return BeautifulSoup(html_content, 'html.parser')
+
+    def collected():
+        return collect_candidates(parsed())
+
+    def fresh_rows():
+        # The row cache would turn every run after the first into lookups
+        row_cache.clear()
+        return find_order_regions(html_content)
+
+    stages = [
+        ('parse', lambda: None, lambda _: parsed()),
+        ('collect', parsed, collect_candidates),
+    ]
+    stages += [(f'strategy:{name}', collected, strategy) for name, strategy in STRATEGIES]
+    if find_order_regions(html_content):
+        stages.append(('order_rows', fresh_rows, lambda regions: extract_order_rows(html_content, regions)))
+    stages.append(('total', row_cache.clear, lambda _: extract_shipping_report(html_content)))
+    return stages
+
+
+def _time(setup, run, repeat):
+    best = None
+    for _ in range(repeat):
+        stage_input = setup()
+        gc.collect()
+        started = time.perf_counter()
+        run(stage_input)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _memory(setup, run):
+    # The input is built before tracing starts so only the stage itself is counted
+    stage_input = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = run(stage_input)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current - baseline, peak - baseline
+
+
+def benchmark(layouts=LAYOUTS, sizes=SIZES, noise=2, repeat=3, seed=0, memory=True):
+    """
+    Run the benchmark.
+
+    Args:
+        layouts (list): Page layouts from benchmarks.order_pages.LAYOUTS
+        sizes (list): Order counts per page
+        noise (int): Unrelated markup blocks per order
+        repeat (int): Timed runs per stage; the fastest is kept
+        seed (int): Seed for the page generator
+        memory (bool): Also measure memory; tracemalloc makes this the slow part
+
+    Yields:
+        dict: One row per (layout, orders, stage) with seconds, allocated and peak bytes
+    """
+    for layout in layouts:
+        for orders in sizes:
+            html_content = generate_order_page(layout, orders, noise=noise, seed=seed)
+            for stage, setup, run in _stages(html_content):
+                allocated, peak = _memory(setup, run) if memory else (0, 0)
+                yield {
+                    'layout': layout,
+                    'orders': orders,
+                    'page_bytes': len(html_content),
+                    'stage': stage,
+                    'seconds': _time(setup, run, repeat),
+                    'allocated_bytes': allocated,
+                    'peak_bytes': peak
+                }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--noise', type=int, default=2, help='unrelated markup blocks per order')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (best is reported)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per line')
+    args = parser.parse_args(argv)
+
+    rows = benchmark(args.layouts, args.sizes, noise=args.noise, repeat=args.repeat, seed=args.seed,
+                     memory=not args.no_memory)
+    if not args.json:
+        print(f"{'layout':<13} {'orders':>6} {'page KiB':>9}  {'stage':<22} {'ms':>10} {'alloc KiB':>10} {'peak KiB':>10}")
+
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            print(f"{row['layout']:<13} {row['orders']:>6} {row['page_bytes'] / 1024:>9.1f}  {row['stage']:<22} "
+                  f"{row['seconds'] * 1000:>10.2f} {row['allocated_bytes'] / 1024:>10.1f} {row['peak_bytes'] / 1024:>10.1f}")
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure how long a fresh worker takes to import the app and how much memory it holds.
+
+Each run starts a new interpreter, imports app.py the way gunicorn and main.py
+do, and reports the import wall time and the process's peak RSS afterwards.
+--preload imports extra modules first (e.g. --preload pandas) to show what a
+dependency would add to every worker boot.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --preload pandas
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Runs in the child interpreter; prints the import time and peak RSS as JSON
+CHILD_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+for module in sys.argv[1:]:
+    __import__(module)
+import app
+elapsed = time.perf_counter() - started
+rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kib //= 1024
+print(json.dumps({'seconds': elapsed, 'rss_kib': rss_kib}))
+"""
+
+
+def measure(runs=5, preload=()):
+    """
+    Import the app in fresh interpreters.
+
+    Args:
+        runs (int): Interpreters to start
+        preload (list): Modules imported before app
+
+    Returns:
+        dict: Median and minimum import seconds and median peak RSS in KiB
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT, *preload],
+            check=True, capture_output=True, text=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {
+        'preload': list(preload),
+        'runs': runs,
+        'median_seconds': statistics.median(sample['seconds'] for sample in samples),
+        'min_seconds': min(sample['seconds'] for sample in samples),
+        'median_rss_kib': statistics.median(sample['rss_kib'] for sample in samples)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--preload', nargs='*', default=[], help='modules to import before app')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs, args.preload)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        label = 'app' + ''.join(f' + {module}' for module in args.preload)
+        print(f"{label}: import {result['median_seconds'] * 1000:.0f} ms median "
+              f"({result['min_seconds'] * 1000:.0f} ms best of {result['runs']}), "
+              f"peak RSS {result['median_rss_kib'] / 1024:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
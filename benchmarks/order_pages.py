@@ -0,0 +1,126 @@
+"""
+Synthetic Amazon order pages for benchmarking utils/html_parser.py.
+
+Each layout mirrors one of the markups the parser has a strategy for, and
+pages are deterministic for a given (layout, orders, noise, seed) so runs can
+be compared against each other.
+"""
+import random
+
+# Layouts in the order the parser tries their strategies
+LAYOUTS = ('buyer_spans', 'table_rows', 'form_fields', 'address_divs', 'text')
+
+# Order counts the benchmark covers by default
+SIZES = (1, 10, 100, 1000, 10000)
+
+FIRST_NAMES = ('James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Susan')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Lopez', 'Wilson')
+STREET_NAMES = ('Main', 'Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Washington', 'Lake', 'Hill', 'Sunset')
+STREET_SUFFIXES = ('St', 'Street', 'Ave', 'Rd', 'Dr', 'Ln', 'Blvd', 'Way', 'Ct', 'Pkwy')
+CITIES = (
+    ('Denver', 'CO', '80202'), ('Austin', 'TX', '78701'), ('Salt Lake City', 'UT', '84101'),
+    ('Portland', 'OR', '97201'), ('Columbus', 'OH', '43215'), ('Raleigh', 'NC', '27601'),
+    ('Las Vegas', 'NV', '89123'), ('Boise', 'ID', '83702'), ('Tampa', 'FL', '33602'), ('Omaha', 'NE', '68102'),
+)
+
+
+def _order(rng, index):
+    """Random but plausible order details."""
+    city, state, zip_code = rng.choice(CITIES)
+    return {
+        'order_id': f'{rng.randint(100, 999)}-{index:07d}-{rng.randint(0, 9999999):07d}',
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        'street': f'{rng.randint(1, 9999)} {rng.choice(STREET_NAMES)} {rng.choice(STREET_SUFFIXES)}',
+        'city_state_zip': f'{city}, {state} {zip_code}',
+    }
+
+
+def _noise(rng, amount):
+    """Markup the parser has to wade through but never extracts anything from."""
+    blocks = []
+    for _ in range(amount):
+        kind = rng.randrange(4)
+        if kind == 0:
+            blocks.append('<script>window.csm = {"t": %d, "tags": ["a", "b"]};</script>' % rng.randint(0, 10 ** 9))
+        elif kind == 1:
+            blocks.append('<div class="a-row a-spacing-mini"><span class="a-size-small">Ship by: Mon, Oct 12</span>'
+                          '<a class="a-link-normal" href="/help">Help</a></div>')
+        elif kind == 2:
+            blocks.append('<!-- %s -->' % ('x' * rng.randint(20, 200)))
+        else:
+            blocks.append('<ul class="a-unordered-list">%s</ul>'
+                          % ''.join('<li><span>Item %d</span></li>' % i for i in range(rng.randint(1, 5))))
+    return ''.join(blocks)
+
+
+def _address_div(order, span_class=None):
+    span = '<span class="%s">' % span_class if span_class is not None else '<span>'
+    return (
+        f'<div data-test-id="shipping-section-buyer-address">'
+        f'{span}{order["name"]}</span><br>{span}{order["street"]}</span><br>'
+        f'{span}{order["city_state_zip"]}</span></div>'
+    )
+
+
+def _order_row(rng, order, noise, buyer_span):
+    address = _address_div(order)
+    if buyer_span:
+        address = f'<span data-test-id="shipping-section-buyer-po">{address}</span>'
+    return (
+        f'<tr><td><a href="/orders-v3/order/{order["order_id"]}">{order["order_id"]}</a>{_noise(rng, noise)}</td>'
+        f'<td><div class="cell-body">{address}</div></td></tr>'
+    )
+
+
+def _form_block(order):
+    return (
+        f'<fieldset><input id="order-id" value="{order["order_id"]}"><input id="ToName" value="{order["name"]}">'
+        f'<input id="Street1To" value="{order["street"]}"><input id="CityTo" value="{order["city_state_zip"].split(",")[0]}">'
+        f'<input id="StateTo" value="{order["city_state_zip"].split()[-2]}">'
+        f'<input id="ZipTo" value="{order["city_state_zip"].split()[-1]}"></fieldset>'
+    )
+
+
+def generate_order_page(layout, orders, noise=2, seed=0):
+    """
+    Build a synthetic order page.
+
+    Args:
+        layout (str): One of LAYOUTS
+        orders (int): Number of orders on the page
+        noise (int): Unrelated markup blocks per order (scripts, comments, menus)
+        seed (int): Seed for the random order details
+
+    Returns:
+        str: The page HTML
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+
+    rng = random.Random(seed)
+    details = [_order(rng, index) for index in range(orders)]
+
+    if layout in ('buyer_spans', 'table_rows'):
+        rows = ''.join(_order_row(rng, order, noise, layout == 'buyer_spans') for order in details)
+        body = f'<table id="orders-table"><tbody>{rows}</tbody></table>'
+    elif layout == 'form_fields':
+        body = '<form id="ship-form">%s</form>' % ''.join(_form_block(order) + _noise(rng, noise) for order in details)
+    elif layout == 'address_divs':
+        body = ''.join(
+            f'<div class="order"><a href="/order/{order["order_id"]}">{order["order_id"]}</a>'
+            f'<ul><li>{_address_div(order, span_class="")}</li></ul>{_noise(rng, noise)}</div>'
+            for order in details
+        )
+    else:
+        body = ''.join(
+            f'<section><p>Ship to</p><p>{order["name"]}</p><p>{order["street"]}</p>'
+            f'<p>{order["city_state_zip"]}</p><p>Phone: (312) 555-{rng.randint(0, 9999):04d}</p>'
+            f'{_noise(rng, noise)}</section>'
+            for order in details
+        )
+
+    return (
+        '<!DOCTYPE html><html><head><title>Manage Orders</title>'
+        '<style>.a-row{margin:0}.cell-body{padding:4px}</style></head>'
+        f'<body><div id="nav">{_noise(rng, noise)}</div>{body}</body></html>'
+    )
@@ -0,0 +1,72 @@
+"""
+Synthetic order list text, as pasted into the ASIN counter, for benchmarking utils/asin_parser.py.
+
+Text is deterministic for a given set of arguments so runs can be compared
+against each other.
+"""
+import random
+
+from benchmarks.order_pages import FIRST_NAMES, LAST_NAMES
+
+# How broken blocks are spread through the text
+SCENARIOS = ('clean', 'scattered', 'truncated_tail')
+
+ADJECTIVES = ('Stainless', 'Organic', 'Wireless', 'Compact', 'Heavy Duty', 'Premium', 'Portable', 'Classic')
+PRODUCTS = ('Water Bottle', 'Coffee Beans 2lb', 'Phone Charger', 'Desk Lamp', 'Yoga Mat', 'Notebook Set',
+            'Kitchen Scale', 'Bluetooth Speaker', 'Garden Hose 50ft', 'Dog Leash')
+
+
+def _catalog(rng, products):
+    return [
+        (f'B0{rng.randrange(36 ** 8):08X}'[:10], f'{rng.choice(ADJECTIVES)} {rng.choice(PRODUCTS)}, Pack of {i % 6 + 1}')
+        for i in range(products)
+    ]
+
+
+def _block(rng, index, asin, title, with_quantity):
+    lines = [
+        f'Order date: Oct {index % 28 + 1}, 2024',
+        f'{rng.randint(100, 999)}-{index:07d}-{rng.randint(0, 9999999):07d}',
+        f'Buyer name: {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        f'Buyer phone: {rng.randint(200, 999)}{rng.randrange(10 ** 7):07d}',
+        'Sales channel: Amazon.com',
+        title,
+        f'ASIN: {asin}',
+        f'SKU: {rng.choice(("WB", "CB", "LM", "YM"))}{rng.randrange(10 ** 8):08d}',
+    ]
+    if with_quantity:
+        lines.append(f'Quantity: {rng.randint(1, 5)}')
+    lines += [f'Item subtotal: ${rng.randint(5, 200)}.{rng.randrange(100):02d}', 'Ship by: Oct 28, 2024', '']
+    return '\n'.join(lines)
+
+
+def generate_order_text(blocks, scenario='clean', products=200, seed=0):
+    """
+    Build the text of an order list page.
+
+    Args:
+        blocks (int): Number of product blocks
+        scenario (str): One of SCENARIOS; 'scattered' drops the Quantity line
+                        from every 20th block, 'truncated_tail' from the last tenth
+        products (int): Distinct ASINs the blocks are drawn from
+        seed (int): Seed for the random details
+
+    Returns:
+        str: The text
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario {scenario!r}, expected one of {', '.join(SCENARIOS)}")
+
+    rng = random.Random(seed)
+    catalog = _catalog(rng, products)
+    parts = ['Manage Orders\nSearch orders\n']
+    for index in range(blocks):
+        if scenario == 'scattered':
+            with_quantity = index % 20 != 19
+        elif scenario == 'truncated_tail':
+            with_quantity = index < blocks - blocks // 10
+        else:
+            with_quantity = True
+        asin, title = rng.choice(catalog)
+        parts.append(_block(rng, index, asin, title, with_quantity))
+    return '\n'.join(parts)
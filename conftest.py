@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep the session database and other data files the app creates out of the checkout
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="amazon-helper-test-"))
@@ -3,7 +3,6 @@ import csv
 import io
 import json
 import logging
-import pandas as pd
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, send_from_directory
 from bs4 import BeautifulSoup
 
@@ -342,12 +341,11 @@ def generate_csv():
             csv_data['optional_file_name'].append('')
             csv_data['optional_amazon_order_id'].append('')
         
-        # Create DataFrame
-        df = pd.DataFrame(csv_data)
-        
-        # Create in-memory CSV
+        # Create in-memory CSV, one row per address in column order
         output = io.StringIO()
-        df.to_csv(output, index=False, quoting=csv.QUOTE_MINIMAL)
+        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+        writer.writerow(csv_data.keys())
+        writer.writerows(zip(*csv_data.values()))
         output.seek(0)
         
         # Generate filename
@@ -394,7 +392,7 @@ def download_app():
             
             # Add requirements.txt
             with open(os.path.join(temp_dir, 'requirements.txt'), 'w') as req_file:
-                req_file.write('flask==2.0.1\nbeautifulsoup4==4.10.0\npandas==1.3.3\n')
+                req_file.write('flask==2.0.1\nbeautifulsoup4==4.10.0\n')
             zipf.write(os.path.join(temp_dir, 'requirements.txt'), 'requirements.txt')
             
             # Add README with instructions
@@ -0,0 +1,226 @@
+// DOM Elements
+const shoppingListData = document.getElementById('shoppingListData');
+const shoppingListBody = document.getElementById('shoppingListBody');
+const shoppingListPrev = document.getElementById('shoppingListPrev');
+const shoppingListNext = document.getElementById('shoppingListNext');
+const shoppingListRange = document.getElementById('shoppingListRange');
+const shoppingListPending = document.getElementById('shoppingListPending');
+const downloadShoppingListBtn = document.getElementById('downloadShoppingList');
+const showMoreAsinsBtn = document.getElementById('showMoreAsins');
+
+// The page of the shopping list on screen, as sent by the server
+let shoppingList = null;
+
+// Edits not yet saved, by row index; they are sent together with the list's version on download
+const pendingChanges = new Map();
+
+// Event Listeners
+document.addEventListener('DOMContentLoaded', () => {
+    if (shoppingListData) {
+        shoppingList = JSON.parse(shoppingListData.textContent);
+        renderShoppingList();
+        shoppingListPrev.addEventListener('click', () => loadShoppingListPage(shoppingList.offset - shoppingList.page_size));
+        shoppingListNext.addEventListener('click', () => loadShoppingListPage(shoppingList.offset + shoppingList.page_size));
+        downloadShoppingListBtn.addEventListener('click', downloadShoppingList);
+        window.addEventListener('beforeunload', event => {
+            if (pendingChanges.size) {
+                event.preventDefault();
+                event.returnValue = '';
+            }
+        });
+    }
+    if (showMoreAsinsBtn) {
+        showMoreAsinsBtn.addEventListener('click', showMoreAsins);
+    }
+});
+
+// Draw the rows of the current page, with the unsaved edits on top
+function renderShoppingList() {
+    shoppingListBody.replaceChildren(...shoppingList.rows.map(row =>
+        createShoppingListRow({ ...row, ...pendingChanges.get(row.index) })));
+
+    const first = shoppingList.rows.length ? shoppingList.offset + 1 : 0;
+    const last = shoppingList.offset + shoppingList.rows.length;
+    shoppingListRange.textContent = `Rows ${first}–${last} of ${shoppingList.total}`;
+    shoppingListPrev.disabled = shoppingList.offset === 0;
+    shoppingListNext.disabled = last >= shoppingList.total;
+    renderPendingCount();
+}
+
+function renderPendingCount() {
+    const count = pendingChanges.size;
+    shoppingListPending.textContent = count ? `${count} row${count === 1 ? '' : 's'} with unsaved changes` : '';
+}
+
+function createShoppingListRow(row) {
+    const tr = document.createElement('tr');
+    tr.dataset.asin = row.asin;
+    if (row.removed) {
+        tr.classList.add('text-decoration-line-through', 'opacity-50');
+    }
+
+    const asinCell = document.createElement('td');
+    asinCell.textContent = row.asin;
+
+    const titleInput = document.createElement('input');
+    titleInput.type = 'text';
+    titleInput.className = 'form-control bg-dark text-light';
+    titleInput.value = row.title;
+    titleInput.disabled = Boolean(row.removed);
+    titleInput.addEventListener('change', () => {
+        changeShoppingListRow(row.index, { title: titleInput.value });
+    });
+
+    const qtyInput = document.createElement('input');
+    qtyInput.type = 'number';
+    qtyInput.className = 'form-control bg-dark text-light';
+    qtyInput.min = 1;
+    qtyInput.required = true;
+    qtyInput.value = row.qty;
+    qtyInput.disabled = Boolean(row.removed);
+    qtyInput.addEventListener('change', () => {
+        const qty = parseInt(qtyInput.value, 10);
+        if (!(qty >= 1)) {
+            // Not a quantity the server would take; put the last one back
+            qtyInput.value = row.qty;
+            return;
+        }
+        row.qty = qty;
+        changeShoppingListRow(row.index, { qty: qty });
+    });
+
+    // Removed rows stay on screen, struck through, until the changes are saved
+    const removeBtn = document.createElement('button');
+    removeBtn.type = 'button';
+    removeBtn.className = row.removed ? 'btn btn-sm btn-outline-light' : 'btn btn-sm btn-danger remove-item';
+    removeBtn.textContent = row.removed ? 'Restore' : 'Remove';
+    removeBtn.addEventListener('click', () => {
+        changeShoppingListRow(row.index, { removed: !row.removed });
+        renderShoppingList();
+    });
+
+    tr.appendChild(asinCell);
+    [titleInput, qtyInput, removeBtn].forEach(content => {
+        const td = document.createElement('td');
+        td.appendChild(content);
+        tr.appendChild(td);
+    });
+    return tr;
+}
+
+// Remember a change to one row until the list is saved
+function changeShoppingListRow(index, changes) {
+    pendingChanges.set(index, { ...pendingChanges.get(index), ...changes });
+    renderPendingCount();
+}
+
+// Fetch and show the page starting at offset
+function loadShoppingListPage(offset) {
+    offset = Math.max(0, offset);
+    return fetch(`/shopping-list/${shoppingList.id}/rows?offset=${offset}&limit=${shoppingList.page_size}`)
+        .then(response => response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error);
+            }
+            // Saving removals can leave the last page empty; step back a page
+            if (data.rows.length === 0 && offset > 0) {
+                return loadShoppingListPage(offset - shoppingList.page_size);
+            }
+            shoppingList = { ...data, id: shoppingList.id, page_size: shoppingList.page_size };
+            renderShoppingList();
+        }))
+        .catch(error => {
+            console.error('Could not load shopping list page:', error);
+            alert(error.message || 'There was an error loading the shopping list.');
+        });
+}
+
+// Save every unsaved edit against the list's version in one request, and download the list it returns
+function downloadShoppingList() {
+    downloadShoppingListBtn.disabled = true;
+    fetch('/save-shopping-list', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            list_id: shoppingList.id,
+            version: shoppingList.version,
+            changes: Array.from(pendingChanges)
+        })
+    })
+        .then(response => {
+            if (response.status === 409) {
+                // The list was saved from another tab; keep these edits and show the list as it is now
+                return response.json().then(data => {
+                    shoppingList.version = data.version;
+                    alert('This shopping list was changed in another window. Your unsaved changes were kept; check them and download again.');
+                    return loadShoppingListPage(shoppingList.offset);
+                });
+            }
+            if (!response.ok) {
+                return response.json().then(data => {
+                    throw new Error([data.error, ...(data.details || [])].join('\n'));
+                });
+            }
+            shoppingList.version = parseInt(response.headers.get('X-Shopping-List-Version'), 10);
+            pendingChanges.clear();
+            return response.blob().then(blob => {
+                const link = document.createElement('a');
+                link.href = URL.createObjectURL(blob);
+                link.download = 'shopping_list.csv';
+                link.click();
+                setTimeout(() => URL.revokeObjectURL(link.href), 0);
+                return loadShoppingListPage(shoppingList.offset);
+            });
+        })
+        .catch(error => {
+            console.error('Could not save shopping list:', error);
+            alert(error.message || 'There was an error saving the shopping list.');
+        })
+        .finally(() => {
+            downloadShoppingListBtn.disabled = false;
+        });
+}
+
+// Append the next page of the basic counter's results
+function showMoreAsins() {
+    const offset = parseInt(showMoreAsinsBtn.dataset.offset, 10);
+    const total = parseInt(showMoreAsinsBtn.dataset.total, 10);
+    showMoreAsinsBtn.disabled = true;
+
+    fetch(`/asin-data/rows?offset=${offset}`)
+        .then(response => response.json())
+        .then(data => {
+            const results = document.querySelector('.asin-results');
+            data.rows.forEach(row => {
+                const div = document.createElement('div');
+                div.className = 'mb-1';
+                const asin = document.createElement('span');
+                asin.className = 'asin-item';
+                asin.textContent = row.asin;
+                const count = document.createElement('span');
+                count.className = 'asin-count';
+                count.textContent = row.count;
+                div.append(asin, ': ', count);
+                if (row.title) {
+                    const title = document.createElement('span');
+                    title.className = 'text-muted small';
+                    title.textContent = ' ' + row.title;
+                    div.appendChild(title);
+                }
+                results.appendChild(div);
+            });
+
+            const next = offset + data.rows.length;
+            showMoreAsinsBtn.dataset.offset = next;
+            showMoreAsinsBtn.disabled = false;
+            if (next >= total || data.rows.length === 0) {
+                showMoreAsinsBtn.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Could not load more ASINs:', error);
+            showMoreAsinsBtn.disabled = false;
+        });
+}
@@ -15,6 +15,14 @@ const sameDimensionsCheckbox = document.getElementById('sameDimensionsCheckbox')
 const prevAddressBtn = document.getElementById('prevAddressBtn');
 const nextAddressBtn = document.getElementById('nextAddressBtn');
 const orderCount = document.getElementById('orderCount');
+const htmlFilesInput = document.getElementById('htmlFilesInput');
+const extractFilesBtn = document.getElementById('extractFilesBtn');
+const loadingMessage = document.getElementById('loadingMessage');
+const cancelExtractBtn = document.getElementById('cancelExtractBtn');
+
+// Pastes this long are extracted as a background job with progress updates
+const JOB_MODE_MIN_LENGTH = 2 * 1024 * 1024;
+const JOB_POLL_INTERVAL_MS = 500;
 
 // Store extracted addresses
 let extractedAddresses = [];
@@ -23,9 +31,27 @@ let currentAddressIndex = 0;
 // Store package dimensions for each order
 let packageDimensions = {};
 
+// Handle of the addresses the server stored at extraction time
+let datasetId = null;
+
+// Order IDs that already went out in an earlier CSV
+let previouslyExported = new Set();
+
+// Address changes are sent one at a time so a later patch never overtakes an earlier one
+let patchQueue = Promise.resolve();
+
+// Form fields whose changes are sent to the server
+const PATCH_FIELDS = [
+    'ToName', 'PhoneTo', 'Street1To', 'CompanyTo', 'Street2To', 'CityTo', 'StateTo', 'ZipTo', 'order_id',
+    'Weight', 'length', 'width', 'height', 'description'
+];
+
 // Event Listeners
 document.addEventListener('DOMContentLoaded', () => {
     extractBtn.addEventListener('click', extractShippingInfo);
+    if (extractFilesBtn) {
+        extractFilesBtn.addEventListener('click', extractShippingInfoFromFiles);
+    }
     resetBtn.addEventListener('click', resetForm);
     csvForm.addEventListener('submit', validateForm);
     
@@ -34,6 +60,9 @@ document.addEventListener('DOMContentLoaded', () => {
         addressSelector.addEventListener('change', function() {
             const index = parseInt(this.value);
             if (index >= 0 && index < extractedAddresses.length) {
+                // Save current dimensions before switching
+                saveCurrentDimensions();
+                
                 currentAddressIndex = index;
                 populateShippingForm(extractedAddresses[index]);
             }
@@ -105,25 +134,71 @@ function saveCurrentDimensions() {
             height,
             description
         };
+        
+        patchCurrentAddress();
+    }
+}
+
+// Send the fields the operator changed on the current address to the server
+function patchCurrentAddress() {
+    if (!datasetId || currentAddressIndex >= extractedAddresses.length) {
+        return patchQueue;
+    }
+    
+    const address = extractedAddresses[currentAddressIndex];
+    const changes = {};
+    PATCH_FIELDS.forEach(field => {
+        const value = document.getElementById(field).value;
+        if ((address[field] || '') !== value) {
+            changes[field] = value;
+            address[field] = value;
+        }
+    });
+    
+    if (Object.keys(changes).length === 0) {
+        return patchQueue;
+    }
+    
+    const url = `/addresses/${datasetId}/${currentAddressIndex}`;
+    patchQueue = patchQueue
+        .then(() => fetch(url, {
+            method: 'PATCH',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(changes)
+        }))
+        .catch(error => console.error('Could not save address changes:', error));
+    return patchQueue;
+}
+
+// Set a hidden field on a form, reusing it if it was added by an earlier submit
+function setHiddenField(form, name, value) {
+    let field = form.querySelector(`input[type="hidden"][name="${name}"]`);
+    if (!field) {
+        field = document.createElement('input');
+        field.type = 'hidden';
+        field.name = name;
+        form.appendChild(field);
     }
+    field.value = value;
 }
 
 // Extract shipping information from HTML
 async function extractShippingInfo() {
-    // Show loading state
-    inputSection.classList.add('d-none');
-    loadingSection.classList.remove('d-none');
-    errorSection.classList.add('d-none');
-    
-    try {
+    await runExtraction(async () => {
         const htmlContent = htmlInput.value.trim();
         
         if (!htmlContent) {
             throw new Error('Please enter HTML content to extract shipping information.');
         }
         
+        if (htmlContent.length >= JOB_MODE_MIN_LENGTH) {
+            return runExtractionJob(htmlContent);
+        }
+        
         // Send HTML content to server for extraction
-        const response = await fetch('/extract', {
+        return fetch('/extract', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/x-www-form-urlencoded',
@@ -132,9 +207,102 @@ async function extractShippingInfo() {
                 'html_content': htmlContent
             })
         });
+    });
+}
+
+// Extract a large paste as a background job, showing its progress until it finishes
+async function runExtractionJob(htmlContent) {
+    const submitResponse = await fetch('/extract-jobs', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/x-www-form-urlencoded',
+        },
+        body: new URLSearchParams({
+            'html_content': htmlContent
+        })
+    });
+    if (!submitResponse.ok) {
+        return submitResponse;
+    }
+    
+    const job = await submitResponse.json();
+    const cancelJob = () => fetch(`/extract-jobs/${job.job_id}/cancel`, { method: 'POST' });
+    if (cancelExtractBtn) {
+        cancelExtractBtn.classList.remove('d-none');
+        cancelExtractBtn.addEventListener('click', cancelJob);
+    }
+    
+    try {
+        while (true) {
+            const response = await fetch(job.status_url);
+            const progress = await response.clone().json();
+            
+            // A finished job answers like /extract does
+            if (progress.status !== 'queued' && progress.status !== 'running') {
+                return response;
+            }
+            
+            if (loadingMessage) {
+                loadingMessage.textContent = describeJobProgress(progress);
+            }
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        }
+    } finally {
+        if (cancelExtractBtn) {
+            cancelExtractBtn.classList.add('d-none');
+            cancelExtractBtn.removeEventListener('click', cancelJob);
+        }
+    }
+}
+
+// Describe an extraction job's progress for the loading message
+function describeJobProgress(progress) {
+    if (progress.rows_total) {
+        return `Scanned ${progress.rows_scanned} of ${progress.rows_total} orders...`;
+    }
+    if (progress.stage === 'parsing') {
+        return 'Reading the page...';
+    }
+    if (progress.stage) {
+        return `Looking for addresses (${progress.stage.replace('_', ' ')})...`;
+    }
+    return 'Waiting for a free worker...';
+}
+
+// Extract shipping information from saved HTML files or zip archives in one request
+async function extractShippingInfoFromFiles() {
+    await runExtraction(async () => {
+        if (!htmlFilesInput || !htmlFilesInput.files.length) {
+            throw new Error('Please choose one or more HTML files or a zip archive.');
+        }
+        
+        const formData = new FormData();
+        for (const file of htmlFilesInput.files) {
+            formData.append('html_files', file);
+        }
         
+        return fetch('/extract-batch', {
+            method: 'POST',
+            body: formData
+        });
+    });
+}
+
+// Send an extraction request and show the addresses it returns
+async function runExtraction(sendRequest) {
+    // Show loading state
+    inputSection.classList.add('d-none');
+    loadingSection.classList.remove('d-none');
+    errorSection.classList.add('d-none');
+    
+    try {
+        const response = await sendRequest();
         const data = await response.json();
         
+        if (loadingMessage) {
+            loadingMessage.textContent = 'Extracting shipping information...';
+        }
+        
         if (!response.ok) {
             throw new Error(data.error || 'Failed to extract shipping information.');
         }
@@ -143,8 +311,11 @@ async function extractShippingInfo() {
         shippingForm.classList.remove('d-none');
         loadingSection.classList.add('d-none');
         
-        // Reset package dimensions
+        // Reset package dimensions and remember where the server stored the addresses
         packageDimensions = {};
+        datasetId = data.dataset_id || null;
+        currentAddressIndex = 0;
+        previouslyExported = new Set(data.previously_exported || []);
         
         // Handle multiple addresses or single address
         if (data.multiple === true) {
@@ -152,21 +323,10 @@ async function extractShippingInfo() {
             
             // Update order count display
             if (orderCount) {
-                orderCount.textContent = `${extractedAddresses.length} orders found`;
+                orderCount.textContent = `${extractedAddresses.length} orders found` + describeExported();
                 orderCount.classList.remove('d-none');
             }
             
-            // Send all addresses to server to store in session
-            await fetch('/store-addresses', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    addresses: extractedAddresses
-                })
-            });
-            
             setupAddressSelector(extractedAddresses);
             populateShippingForm(extractedAddresses[0]);
             
@@ -185,21 +345,10 @@ async function extractShippingInfo() {
             
             // Update order count display
             if (orderCount) {
-                orderCount.textContent = '1 order found';
+                orderCount.textContent = '1 order found' + describeExported();
                 orderCount.classList.remove('d-none');
             }
             
-            // Send all addresses to server to store in session
-            await fetch('/store-addresses', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    addresses: extractedAddresses
-                })
-            });
-            
             // Hide address selector and navigation for single address
             if (addressSelectorContainer) {
                 addressSelectorContainer.classList.add('d-none');
@@ -223,6 +372,11 @@ async function extractShippingInfo() {
     }
 }
 
+// Note how many of the extracted orders were exported before
+function describeExported() {
+    return previouslyExported.size ? ` (${previouslyExported.size} already exported)` : '';
+}
+
 // Set up address selector dropdown for multiple addresses
 function setupAddressSelector(addresses) {
     // Show address selector container
@@ -244,8 +398,9 @@ function setupAddressSelector(addresses) {
             const city = address.CityTo || '';
             const state = address.StateTo || '';
             const orderId = address.order_id ? `(Order: ${address.order_id})` : '';
+            const exported = previouslyExported.has(address.order_id) ? ' [already exported]' : '';
             
-            option.textContent = `${name} - ${city}, ${state} ${orderId}`;
+            option.textContent = `${name} - ${city}, ${state} ${orderId}${exported}`;
             addressSelector.appendChild(option);
         });
     }
@@ -305,6 +460,7 @@ function resetForm() {
     extractedAddresses = [];
     currentAddressIndex = 0;
     packageDimensions = {};
+    datasetId = null;
     
     // Scroll to the top
     window.scrollTo({ top: 0, behavior: 'smooth' });
@@ -339,15 +495,9 @@ function validateForm(event) {
     // Save current dimensions for the current address
     saveCurrentDimensions();
     
-    // Add the current address flag to each address
-    extractedAddresses.forEach((addr, idx) => {
-        // Create hidden field for current address status
-        const currentAddrField = document.createElement('input');
-        currentAddrField.type = 'hidden';
-        currentAddrField.name = `address[${idx}][current_address]`;
-        currentAddrField.value = addr.current_address || 'false';
-        event.target.appendChild(currentAddrField);
-    });
+    // Tell the server which stored addresses to use and which one is on screen
+    setHiddenField(event.target, 'dataset_id', datasetId || '');
+    setHiddenField(event.target, 'current_index', currentAddressIndex);
     
     // If user is merging orders and applying same dimensions to all
     if (mergeOrdersCheckbox && mergeOrdersCheckbox.checked && 
@@ -359,6 +509,13 @@ function validateForm(event) {
         sameDimensionsField.value = 'on';
         event.target.appendChild(sameDimensionsField);
     }
+    
+    // Let the last address changes reach the server before it builds the CSV
+    if (datasetId) {
+        event.preventDefault();
+        const form = event.target;
+        patchQueue.then(() => form.submit());
+    }
 }
 
 // Add visual feedback while fields are being completed
@@ -0,0 +1,59 @@
+"""
+Tests for the dataset handle /extract returns and the per-address PATCH endpoint.
+"""
+import io
+import csv
+
+from app import app
+from test_parser_parity import order_row
+
+PAGE = '<table>' + ''.join(
+    order_row(f'111-{i:07d}-1111111', f'Patch Buyer {i}', f'{i + 1} Elm St', 'Boise, ID 83702') for i in range(3)
+) + '</table>'
+
+
+def extract(client):
+    data = client.post('/extract', data={'html_content': PAGE}).get_json()
+    assert data['success'] and data['multiple']
+    return data['dataset_id']
+
+
+def csv_rows(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_patches_reach_the_merged_csv():
+    client = app.test_client()
+    dataset_id = extract(client)
+
+    assert client.patch(f'/addresses/{dataset_id}/1', json={'Weight': '12', 'ToName': 'Edited Name'}).status_code == 200
+    assert client.patch(f'/addresses/{dataset_id}/2', json={'Weight': 3.5}).status_code == 200
+
+    rows = csv_rows(client.post('/generate-csv', data={
+        'merge_orders': 'on', 'dataset_id': dataset_id, 'current_index': '0', 'Weight': '7'
+    }))
+    assert [row['Weight'] for row in rows] == ['7', '12', '3.5']
+    assert rows[1]['ToName'] == 'Edited Name'
+
+
+def test_current_index_takes_the_form_dimensions():
+    client = app.test_client()
+    dataset_id = extract(client)
+    client.patch(f'/addresses/{dataset_id}/0', json={'Weight': '1'})
+
+    rows = csv_rows(client.post('/generate-csv', data={
+        'merge_orders': 'on', 'dataset_id': dataset_id, 'current_index': '2', 'Weight': '9'
+    }))
+    assert [row['Weight'] for row in rows][::2] == ['1', '9']
+
+
+def test_stale_or_bad_patches_are_rejected():
+    client = app.test_client()
+    dataset_id = extract(client)
+    new_dataset_id = extract(client)
+
+    assert client.patch(f'/addresses/{dataset_id}/0', json={'Weight': '1'}).status_code == 404
+    assert client.patch(f'/addresses/{new_dataset_id}/9', json={'Weight': '1'}).status_code == 404
+    assert client.patch(f'/addresses/{new_dataset_id}/0', json={'current_address': 'true'}).status_code == 400
+    assert client.post('/generate-csv', data={'merge_orders': 'on', 'dataset_id': dataset_id}).status_code == 409
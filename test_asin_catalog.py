@@ -0,0 +1,50 @@
+"""
+Tests for utils.asin_catalog and the titles it adds to the basic ASIN counter.
+"""
+import io
+import csv
+import random
+
+from app import app
+from utils.asin_catalog import LOOKUP_CHUNK_SIZE, AsinCatalog
+
+
+def test_record_and_lookup(tmp_path):
+    catalog = AsinCatalog(str(tmp_path / 'catalog.db'))
+    catalog.record({'B000000001': 'Mug', 'B000000002': '', '': 'No ASIN'})
+    catalog.record({'B000000001': 'Mug, large'})
+
+    assert catalog.titles(['B000000001', 'B000000002', 'B000000001', 'missing']) == {'B000000001': 'Mug, large'}
+    assert catalog.stats()['asins'] == 1
+    row = catalog._connection().execute("SELECT times_seen FROM asin_catalog").fetchone()
+    assert row == (2,)
+
+
+def test_lookups_are_batched_and_cached(tmp_path):
+    catalog = AsinCatalog(str(tmp_path / 'catalog.db'), cache_entries=10)
+    asins = [f'B{i:09d}' for i in range(LOOKUP_CHUNK_SIZE * 2 + 3)]
+    catalog.record({asin: f'Title {asin}' for asin in asins})
+
+    # A fresh process has an empty cache and reads everything from disk in chunks
+    fresh = AsinCatalog(catalog.path, cache_entries=10)
+    assert len(fresh.lookup(asins)) == len(asins)
+
+    # Recently used entries keep being served from the cache
+    catalog._connection().execute("DELETE FROM asin_catalog WHERE asin = ?", (asins[-1],))
+    assert fresh.titles([asins[-1]]) == {asins[-1]: f'Title {asins[-1]}'}
+    assert fresh.stats()['cache']['hits'] >= 1
+
+
+def test_basic_counter_and_downloads_use_advanced_titles():
+    client = app.test_client()
+    asin = f'B0{random.randrange(10 ** 8):08d}'
+    client.post('/extract-asins-advanced', data={
+        'order_text': f"Sales channel: Amazon.com\nGarden Hose 50ft\nASIN: {asin}\nQuantity: 2\n"
+    })
+
+    page = client.post('/extract-asins', data={'order_text': f'{asin} {asin} B0ZZZZZZZZ'}).get_data(as_text=True)
+    assert 'Garden Hose 50ft' in page
+
+    rows = list(csv.DictReader(io.StringIO(client.get('/download-asins').get_data(as_text=True))))
+    assert rows == [{'ASIN': asin, 'Quantity': '2', 'Title': 'Garden Hose 50ft'},
+                    {'ASIN': 'B0ZZZZZZZZ', 'Quantity': '1', 'Title': ''}]
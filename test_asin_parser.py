@@ -0,0 +1,204 @@
+"""
+Tests for utils.asin_parser and /extract-asins-advanced.
+"""
+import io
+import re
+import time
+import random
+import zipfile
+from collections import Counter, defaultdict
+
+import app as app_module
+from app import app
+from benchmarks.order_text import generate_order_text
+from utils.asin_parser import (
+    count_asin_tokens, is_valid_asin, parse_asin_blocks, read_text_chunks, tally_asin_document, tally_asin_items
+)
+from utils.batch_extract import merge_asin_results, tally_asins_many
+from utils.worker_pool import ParserPool
+
+LEGACY_PATTERN = re.compile(
+    r"Sales channel: Amazon\.com(?:\s*Business customer)?\s+(.+?)\s+ASIN:\s+(\w+)\s+.*?Quantity:\s+(\d+)",
+    re.DOTALL
+)
+
+
+def legacy_tally(text):
+    asin_data = defaultdict(lambda: {"title": "", "qty": 0})
+    for title, asin, qty in LEGACY_PATTERN.findall(text):
+        asin_data[asin]["title"] = title.strip()
+        asin_data[asin]["qty"] += int(qty)
+    return sorted(asin_data.items(), key=lambda x: x[1]["qty"], reverse=True)
+
+
+def test_matches_the_old_regex_on_well_formed_text():
+    text = generate_order_text(500, products=40)
+    parsed = parse_asin_blocks(text)
+    assert parsed['malformed'] == []
+    assert tally_asin_items(parsed['items']) == legacy_tally(text)
+
+
+def test_blocks_keep_their_order_id_and_channel_variants():
+    text = (
+        "111-1111111-1111111\nSales channel: Amazon.com Business customer\nBig Mug\nASIN: B000000001\nQuantity: 2\n"
+        "222-2222222-2222222\nSales channel: Non-Amazon\nOther shop item\nASIN: B000000009\nQuantity: 7\n"
+        "333-3333333-3333333\nSales channel: Amazon.com\n  Lamp,\n  white  \nASIN: B000000002\nSKU: x\nQuantity: 1\n"
+    )
+    parsed = parse_asin_blocks(text)
+    assert parsed['malformed'] == []
+    assert parsed['items'] == [
+        {'order_id': '111-1111111-1111111', 'title': 'Big Mug', 'asin': 'B000000001', 'qty': 2},
+        {'order_id': '333-3333333-3333333', 'title': 'Lamp,\n  white', 'asin': 'B000000002', 'qty': 1},
+    ]
+
+
+def test_malformed_blocks_are_reported_not_merged():
+    text = (
+        "Sales channel: Amazon.com\nMug\nASIN: B000000001\nQty: 2\n"
+        "Sales channel: Amazon.com\nASIN: B000000003\nQuantity: 4\n"
+        "Sales channel: Amazon.com\nLamp\nQuantity: 3\n"
+        "Sales channel: Amazon.com\nDesk\nASIN: B000000002\nQuantity: 5\n"
+    )
+    parsed = parse_asin_blocks(text)
+    assert [item['asin'] for item in parsed['items']] == ['B000000002']
+    assert [(block['line'], block['reason']) for block in parsed['malformed']] == [
+        (1, "No Quantity found"), (5, "No product title before the ASIN"), (8, "No ASIN found")
+    ]
+    assert parsed['malformed'][0]['excerpt'].startswith('Sales channel: Amazon.com Mug ASIN: B000000001')
+
+
+def test_titles_containing_the_asin_label():
+    text = (
+        "Sales channel: Amazon.com\nLabel maker, prints ASIN:barcodes\nASIN: B000000001\nQuantity: 2\n"
+        "Sales channel: Amazon.com\nSticker (ASIN: B000000009 compatible)\nASIN: B000000002\nQuantity: 3\n"
+    )
+    parsed = parse_asin_blocks(text)
+    assert parsed['malformed'] == []
+    assert [(item['title'], item['asin'], item['qty']) for item in parsed['items']] == [
+        ('Label maker, prints ASIN:barcodes', 'B000000001', 2),
+        ('Sticker (ASIN: B000000009 compatible)', 'B000000002', 3),
+    ]
+    # The old regex got the first block right too
+    assert [asin for _, asin, _ in LEGACY_PATTERN.findall(text)][0] == 'B000000001'
+
+
+def test_truncated_paste_stays_linear():
+    # The old regex takes tens of seconds on this; it rescans to the end from every block without a Quantity
+    text = generate_order_text(5000, 'truncated_tail')
+    started = time.perf_counter()
+    parsed = parse_asin_blocks(text)
+    assert time.perf_counter() - started < 2
+    assert len(parsed['items']) == 4500 and len(parsed['malformed']) == 500
+
+
+def test_route_shows_malformed_blocks():
+    client = app.test_client()
+    text = "Sales channel: Amazon.com\nMug\nASIN: B000000001\nQuantity: 2\nSales channel: Amazon.com\nLamp\n"
+    page = client.post('/extract-asins-advanced', data={'order_text': text}).get_data(as_text=True)
+    assert 'B000000001' in page
+    assert 'could not be read' in page and 'No ASIN found' in page
+
+    page = client.post('/extract-asins-advanced', data={'order_text': "Sales channel: Amazon.com\nLamp\n"})
+    assert 'Could not find any products' in page.get_data(as_text=True)
+
+
+def test_asin_validation():
+    assert is_valid_asin('B07957030E')
+    assert is_valid_asin('0306406152') and is_valid_asin('080442957X')
+    assert not is_valid_asin('0306406153')
+    assert not is_valid_asin('WB12345678')
+    assert not is_valid_asin('X306406152')
+
+
+def test_counting_does_not_depend_on_how_text_is_split():
+    text = generate_order_text(300) + ' B0AAAAAAAA1 B0BBBBBBBB_ xB0CCCCCCCC B0DDDDDDDD'
+    expected = Counter(token for token in re.findall(r'\b[A-Z0-9]{10}\b', text) if is_valid_asin(token))
+    assert expected['B0DDDDDDDD'] == 1 and 'B0CCCCCCCC' not in expected
+
+    rng = random.Random(1)
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(len(text)), 50))
+        chunks = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        assert count_asin_tokens(chunks) == expected
+
+    # A long word split across many chunks never counts
+    assert count_asin_tokens(['B0', 'AAAA', 'AAAA', 'AAAA', ' B0EEEEEEEE']) == {'B0EEEEEEEE': 1}
+
+
+def test_file_chunks_join_split_characters():
+    data = 'Café B0AAAAAAAA ünïcode B0AAAAAAAA'.encode('utf-8')
+    assert ''.join(read_text_chunks(io.BytesIO(data), chunk_size=3)) == data.decode('utf-8')
+
+
+def test_route_counts_uploaded_file():
+    client = app.test_client()
+    upload = (io.BytesIO(b'B0AAAAAAAA WB12345678\nB0AAAAAAAA 0306406152\n'), 'orders.txt')
+    page = client.post('/extract-asins', data={'order_file': upload}, content_type='multipart/form-data')
+    text = page.get_data(as_text=True)
+    assert 'B0AAAAAAAA' in text and '0306406152' in text and 'WB12345678' not in text
+
+    page = client.post('/extract-asins', data={'order_text': 'nothing here WB12345678'})
+    assert 'No ASINs found' in page.get_data(as_text=True)
+
+
+def test_merged_files_match_one_concatenated_paste():
+    texts = [generate_order_text(200, scenario, products=30, seed=seed)
+             for seed, scenario in enumerate(['clean', 'scattered', 'clean'])]
+    documents = [(f'report-{i}.txt', text.encode('utf-8')) for i, text in enumerate(texts)]
+
+    pool = ParserPool(max_workers=2, max_queue=0)
+    try:
+        sorted_data, summary, malformed = merge_asin_results(documents, tally_asins_many(documents, pool))
+    finally:
+        pool.shutdown()
+
+    assert sorted_data == tally_asin_items(parse_asin_blocks('\n'.join(texts))['items'])
+    assert [file['malformed'] for file in summary] == [0, 10, 0]
+    assert {block['file'] for block in malformed} == {'report-1.txt'}
+
+
+def test_saved_html_pages_are_read_as_text():
+    page = (
+        '<!DOCTYPE html><html><body><div>111-1111111-1111111</div><div><span>Sales channel: Amazon.com</span>'
+        '<a>Big Mug</a><div>ASIN: B000000001</div><div>Quantity: <b>3</b></div></div></body></html>'
+    )
+    result = tally_asin_document(page.encode('utf-8'))
+    assert result['tally'] == {'B000000001': {'title': 'Big Mug', 'qty': 3}}
+
+
+def test_bulk_route_combines_files_and_zips():
+    client = app.test_client()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zipped:
+        zipped.writestr('week2/orders.txt', "Sales channel: Amazon.com\nMug v2\nASIN: B000000001\nQuantity: 2\n")
+        zipped.writestr('week2/notes.pdf', "ignored")
+    archive.seek(0)
+    files = [
+        (io.BytesIO(b"Sales channel: Amazon.com\nMug\nASIN: B000000001\nQuantity: 1\n"
+                    b"Sales channel: Amazon.com\nLamp\nASIN: B000000002\nQuantity: 2\n"), 'week1.txt'),
+        (archive, 'week2.zip'),
+    ]
+    page = client.post('/extract-asins-bulk', data={'order_files': files}, content_type='multipart/form-data')
+    text = page.get_data(as_text=True)
+    assert 'week2.zip/week2/orders.txt' in text and 'notes.pdf' not in text
+
+    with client.session_transaction() as session:
+        assert session['advanced_asin_data'] == [
+            ('B000000001', {'title': 'Mug v2', 'qty': 3}), ('B000000002', {'title': 'Lamp', 'qty': 2})
+        ]
+
+    page = client.post('/extract-asins-bulk', data={}, content_type='multipart/form-data')
+    assert 'Please upload at least one order export' in page.get_data(as_text=True)
+
+
+def test_bulk_route_waits_its_turn_in_the_parser_pool(monkeypatch):
+    pool = ParserPool(max_workers=1, max_queue=0)
+    monkeypatch.setattr(app_module, 'parser_pool', pool)
+    try:
+        pool.submit(time.sleep, 0.5)
+        files = [(io.BytesIO(b"Sales channel: Amazon.com\nMug\nASIN: B000000001\nQuantity: 1\n"), 'a.txt')]
+        page = app.test_client().post('/extract-asins-bulk', data={'order_files': files},
+                                      content_type='multipart/form-data')
+        assert page.status_code == 503 and 'The server is busy' in page.get_data(as_text=True)
+    finally:
+        pool.shutdown()
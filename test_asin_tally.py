@@ -0,0 +1,128 @@
+"""
+Tests for utils.asin_tally and the running tally in the advanced ASIN counter.
+"""
+import time
+
+from app import app
+from benchmarks.order_text import generate_order_text
+from utils.asin_parser import parse_asin_blocks, tally_asin_items
+from utils.asin_tally import AsinTallyStore
+
+
+def block(order_id, title, asin, qty):
+    return f"{order_id}\nSales channel: Amazon.com\n{title}\nASIN: {asin}\nQuantity: {qty}\n"
+
+
+def test_pastes_add_up_like_one_paste(tmp_path):
+    store = AsinTallyStore(str(tmp_path / 'tallies.db'))
+    texts = [generate_order_text(150, products=20, seed=seed) for seed in range(3)]
+    for text in texts:
+        store.add_paste('t', parse_asin_blocks(text)['items'])
+
+    assert store.sorted_tally('t') == tally_asin_items(parse_asin_blocks('\n'.join(texts))['items'])
+    assert store.summary('t') == {'pastes': 3, 'blocks': 450, 'version': 3}
+    assert store.sorted_tally('other') == []
+
+    # Undoing a paste leaves the totals as if it never happened
+    store.undo('t')
+    assert store.sorted_tally('t') == tally_asin_items(parse_asin_blocks('\n'.join(texts[:2]))['items'])
+    assert store.summary('t')['version'] == 4
+
+
+def test_repeated_orders_are_skipped_and_undo_takes_back_one_paste(tmp_path):
+    store = AsinTallyStore(str(tmp_path / 'tallies.db'))
+    first = block('111-1111111-1111111', 'Mug', 'B000000001', 2) + block('', 'Loose', 'B000000003', 1)
+    second = block('111-1111111-1111111', 'Mug', 'B000000001', 2) + block('222-2222222-2222222', 'Mug v2', 'B000000001', 1)
+
+    assert store.add_paste('t', parse_asin_blocks(first)['items']) == {'paste': 1, 'added': 2, 'duplicates': 0}
+    assert store.add_paste('t', parse_asin_blocks(second)['items']) == {'paste': 2, 'added': 1, 'duplicates': 1}
+    assert store.sorted_tally('t') == [('B000000001', {'title': 'Mug v2', 'qty': 3}),
+                                       ('B000000003', {'title': 'Loose', 'qty': 1})]
+
+    assert store.undo('t') == 1
+    assert store.sorted_tally('t')[0] == ('B000000001', {'title': 'Mug', 'qty': 2})
+    # Blocks without an order ID can't be told apart, so they always count
+    assert store.add_paste('t', parse_asin_blocks(first)['items'])['added'] == 1
+
+    store.clear('t')
+    assert store.summary('t') == {'pastes': 0, 'blocks': 0, 'version': 0}
+    assert store.undo('t') == 0
+    assert store.sorted_tally('t') == []
+
+
+def test_an_order_repeated_within_one_paste_counts_every_time(tmp_path):
+    store = AsinTallyStore(str(tmp_path / 'tallies.db'))
+    text = block('111-1111111-1111111', 'Mug', 'B000000001', 2) * 2 + block('111-1111111-1111111', 'Lamp', 'B000000002', 1)
+
+    assert store.add_paste('t', parse_asin_blocks(text)['items']) == {'paste': 1, 'added': 3, 'duplicates': 0}
+    assert store.sorted_tally('t') == tally_asin_items(parse_asin_blocks(text)['items'])
+    # The same paste again is all repeats of earlier blocks
+    assert store.add_paste('t', parse_asin_blocks(text)['items']) == {'paste': 2, 'added': 0, 'duplicates': 3}
+    assert store.sorted_tally('t')[0] == ('B000000001', {'title': 'Mug', 'qty': 4})
+
+
+def test_untouched_tallies_expire(tmp_path):
+    store = AsinTallyStore(str(tmp_path / 'tallies.db'), ttl=60)
+    store.add_paste('old', parse_asin_blocks(block('', 'Mug', 'B000000001', 1))['items'])
+    store._connection().execute("UPDATE asin_tallies SET updated_at = ?", (time.time() - 120,))
+    store.add_paste('new', parse_asin_blocks(block('', 'Mug', 'B000000001', 1))['items'])
+    assert store.summary('old')['blocks'] == 0 and store.summary('new')['blocks'] == 1
+
+
+def test_running_tally_routes():
+    client = app.test_client()
+    first = block('111-1111111-1111111', 'Mug', 'B000000001', 2)
+    second = first + block('222-2222222-2222222', 'Lamp', 'B000000002', 5)
+
+    client.post('/extract-asins-advanced', data={'order_text': first, 'accumulate': 'on'})
+    page = client.post('/extract-asins-advanced', data={'order_text': second, 'accumulate': 'on'}).get_data(as_text=True)
+    assert 'from 2 pastes' in page and 'skipped 1 already in the tally' in page
+
+    # Leaving and coming back keeps the tally
+    page = client.get('/asin-counter').get_data(as_text=True)
+    assert 'Running tally' in page and 'B000000002' in page
+    with client.session_transaction() as session:
+        assert session['advanced_asin_data'] == [('B000000002', {'title': 'Lamp', 'qty': 5}),
+                                                 ('B000000001', {'title': 'Mug', 'qty': 2})]
+
+    client.post('/asin-tally/undo', follow_redirects=True)
+    with client.session_transaction() as session:
+        assert session['advanced_asin_data'] == [('B000000001', {'title': 'Mug', 'qty': 2})]
+
+    # A paste without the box ticked leaves the tally alone
+    page = client.post('/extract-asins-advanced', data={'order_text': second}).get_data(as_text=True)
+    assert 'Running tally' not in page
+    assert 'from 1 paste ' in client.get('/asin-counter').get_data(as_text=True)
+
+    client.post('/asin-tally/clear')
+    assert 'Running tally' not in client.get('/asin-counter').get_data(as_text=True)
+
+
+def test_tally_page_reuses_its_shopping_list_until_the_tally_changes():
+    client = app.test_client()
+    client.post('/extract-asins-advanced', data={'order_text': block('111-1111111-1111111', 'Mug', 'B000000001', 2),
+                                                 'accumulate': 'on'})
+    with client.session_transaction() as session:
+        list_id = session['shopping_list_id']
+    assert client.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': 1, 'changes': [[0, {'qty': 9}]]}).status_code == 200
+
+    # Reloading the page keeps the list and the edit made to it
+    for _ in range(2):
+        page = client.get('/asin-counter').get_data(as_text=True)
+        with client.session_transaction() as session:
+            assert session['shopping_list_id'] == list_id
+    assert client.get(f'/shopping-list/{list_id}/rows').get_json()['rows'][0]['qty'] == 9
+    assert 'B000000001' in page
+
+    # A new paste makes a new list, and so does undoing it; reloads after the undo keep that one
+    client.post('/extract-asins-advanced', data={'order_text': block('222-2222222-2222222', 'Lamp', 'B000000002', 1),
+                                                 'accumulate': 'on'})
+    client.post('/asin-tally/undo')
+    client.get('/asin-counter')
+    with client.session_transaction() as session:
+        after_undo = session['shopping_list_id']
+    assert after_undo != list_id
+    client.get('/asin-counter')
+    with client.session_transaction() as session:
+        assert session['shopping_list_id'] == after_undo
@@ -0,0 +1,114 @@
+"""
+Tests for utils.batch_extract and /extract-batch.
+"""
+import io
+import time
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app as app_module
+from app import app
+from test_parser_parity import order_row
+from utils import batch_extract
+from utils.batch_extract import BatchError, extract_many, merge_addresses, read_uploaded_documents
+from utils.worker_pool import ParserPool, PoolBusy
+
+
+def page(*orders):
+    return ('<table>' + ''.join(order_row(order_id, name, '1 Elm St', 'Boise, ID 83702') for order_id, name in orders)
+            + '</table>').encode('utf-8')
+
+
+def zip_of(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def upload(name, content):
+    return FileStorage(io.BytesIO(content), filename=name)
+
+
+def test_zips_are_expanded_and_other_files_skipped():
+    archive = zip_of({'a.html': b'<p>a</p>', 'notes.txt': b'skip me', 'dir/b.HTM': b'<p>b</p>'})
+    documents = read_uploaded_documents([upload('one.html', b'<p>1</p>'), upload('week.zip', archive),
+                                         upload('empty.html', b'  \n')])
+    assert [name for name, _ in documents] == ['one.html', 'week.zip/a.html', 'week.zip/dir/b.HTM']
+
+
+def test_batch_limits(monkeypatch):
+    monkeypatch.setattr(batch_extract, 'MAX_BATCH_DOCUMENTS', 2)
+    with pytest.raises(BatchError, match='Too many documents'):
+        read_uploaded_documents([upload(f'{i}.html', b'<p></p>') for i in range(3)])
+
+    monkeypatch.setattr(batch_extract, 'MAX_BATCH_DOCUMENTS', 500)
+    monkeypatch.setattr(batch_extract, 'MAX_BATCH_BYTES', 1000)
+    with pytest.raises(BatchError, match='too large'):
+        read_uploaded_documents([upload('big.html', b'x' * 1001)])
+    # A zip member's declared size is checked before it is inflated
+    with pytest.raises(BatchError, match='too large'):
+        read_uploaded_documents([upload('bomb.zip', zip_of({'a.html': b'0' * 5000}))])
+
+    with pytest.raises(BatchError, match='not a valid zip'):
+        read_uploaded_documents([upload('broken.zip', b'PK\x03\x04 not really')])
+
+
+def test_orders_repeated_across_documents_are_dropped():
+    documents = [('a.html', b''), ('b.html', b''), ('c.html', b'')]
+    results = [
+        [{'order_id': '111-1111111-1111111', 'ToName': 'A'}, {'order_id': '', 'ToName': 'No ID'}],
+        {'order_id': '111-1111111-1111111', 'ToName': 'A again'},
+        [{'order_id': '222-2222222-2222222', 'ToName': 'B'}, {'order_id': '', 'ToName': 'No ID'}],
+    ]
+    addresses, summary, duplicates = merge_addresses(documents, results)
+    assert [address['ToName'] for address in addresses] == ['A', 'No ID', 'B', 'No ID']
+    assert duplicates == 1
+    assert summary == [{'name': 'a.html', 'found': 2, 'added': 2}, {'name': 'b.html', 'found': 1, 'added': 0},
+                       {'name': 'c.html', 'found': 2, 'added': 2}]
+
+
+def test_documents_run_in_the_shared_pool():
+    pool = ParserPool(max_workers=1, max_queue=0, timeout=30)
+    try:
+        documents = [(f'{i}.html', page((f'111-{i:07d}-1111111', f'Buyer {i}'))) for i in range(3)]
+        results = extract_many(documents, pool)
+        assert [result['ToName'] for result in results] == ['Buyer 0', 'Buyer 1', 'Buyer 2']
+        assert pool.stats()['completed'] == 3
+
+        # The batch counts against the pool's limit like any other job
+        pool.submit(time.sleep, 0.5)
+        with pytest.raises(PoolBusy):
+            extract_many(documents, pool)
+    finally:
+        pool.shutdown()
+
+
+def test_extract_batch_route(monkeypatch):
+    client = app.test_client()
+    files = [
+        (io.BytesIO(page(('111-5555555-1111111', 'Batch A'))), 'a.html'),
+        (io.BytesIO(zip_of({'b.html': page(('111-5555555-1111111', 'Batch A'), ('111-6666666-1111111', 'Batch B'))})),
+         'more.zip'),
+    ]
+    data = client.post('/extract-batch', data={'html_files': files}, content_type='multipart/form-data').get_json()
+    assert data['success'] and data['multiple'] and data['duplicates'] == 1
+    assert [address['ToName'] for address in data['data']] == ['Batch A', 'Batch B']
+    assert [document['name'] for document in data['documents']] == ['a.html', 'more.zip/b.html']
+
+    response = client.post('/extract-batch', data={'html_files': [(io.BytesIO(b'PK\x03\x04'), 'x.zip')]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+
+    pool = ParserPool(max_workers=1, max_queue=0)
+    monkeypatch.setattr(app_module, 'parser_pool', pool)
+    try:
+        pool.submit(time.sleep, 0.5)
+        response = client.post('/extract-batch', data={'html_files': [(io.BytesIO(page(('1', 'x'))), 'a.html')]},
+                               content_type='multipart/form-data')
+        assert response.status_code == 503
+    finally:
+        pool.shutdown()
@@ -0,0 +1,65 @@
+"""
+Tests for utils.csv_export and the streamed /generate-csv download.
+"""
+import io
+import csv
+
+import pytest
+
+from app import app, DEFAULT_SHIP_FROM
+from utils.csv_export import SHIPPING_CSV_COLUMNS, iter_csv
+
+TRICKY_VALUES = ['plain', 'comma, inside', 'quote " inside', 'line\nbreak', '', ' padded ', 'Ünïcode', '12345-6789']
+
+
+def test_matches_pandas_to_csv():
+    pd = pytest.importorskip('pandas')
+    rows = [{column: TRICKY_VALUES[(i + j) % len(TRICKY_VALUES)] for j, column in enumerate(SHIPPING_CSV_COLUMNS)}
+            for i in range(50)]
+
+    output = io.StringIO()
+    pd.DataFrame({column: [row[column] for row in rows] for column in SHIPPING_CSV_COLUMNS}).to_csv(
+        output, index=False, quoting=csv.QUOTE_MINIMAL)
+
+    assert b''.join(iter_csv(SHIPPING_CSV_COLUMNS, rows)) == output.getvalue().encode('utf-8')
+
+
+def test_streams_in_chunks():
+    rows = [{'a': 'x' * 100, 'b': i} for i in range(100)]
+    chunks = list(iter_csv(['a', 'b'], rows, chunk_size=1000))
+    assert len(chunks) > 5
+    assert b''.join(chunks).decode('utf-8').splitlines()[1:] == [f"{'x' * 100},{i}" for i in range(100)]
+
+
+def test_generate_csv_merged_download():
+    addresses = [
+        {'ToName': f'Buyer {i}', 'Street1To': f'{i} Main St', 'CityTo': 'Denver', 'StateTo': 'CO', 'ZipTo': '80202',
+         'order_id': f'111-{i:07d}-1111111', 'Weight': str(i)}
+        for i in range(3)
+    ]
+    client = app.test_client()
+    client.post('/store-addresses', json={'addresses': addresses})
+
+    response = client.post('/generate-csv', data={'merge_orders': 'on', 'Weight': '9', 'length': '1'})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename=shipping_orders_merged.csv'
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['No'] for row in rows] == [address['order_id'] for address in addresses]
+    # The first address is the current one, so it takes the form's dimensions
+    assert [row['Weight'] for row in rows] == ['9', '1', '2']
+    assert [row['length'] for row in rows] == ['1', '1', '1']
+    assert all(row['FromName'] == DEFAULT_SHIP_FROM['FromName'] for row in rows)
+    assert list(rows[0]) == SHIPPING_CSV_COLUMNS
+
+
+def test_save_shopping_list_download():
+    client = app.test_client()
+    response = client.post('/save-shopping-list', data={
+        'item_count': '3',
+        'asin_0': 'B000000001', 'title_0': 'Mug, large', 'qty_0': '2',
+        'asin_1': 'B000000002', 'title_1': '', 'qty_1': '1',
+        'asin_2': 'B000000003', 'title_2': 'Lamp', 'qty_2': '5',
+    })
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'ASIN,Title,Quantity\nB000000001,"Mug, large",2\nB000000003,Lamp,5\n'
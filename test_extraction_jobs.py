@@ -0,0 +1,113 @@
+"""
+Tests for utils.extraction_jobs and the /extract-jobs routes.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import app
+from benchmarks.order_pages import generate_order_page
+from utils import html_parser
+from utils.extraction_jobs import JOB_CANCELLED, JOB_DONE, FINISHED_STATES, PROGRESS_INTERVAL, ExtractionJobs
+from utils.html_parser import TEXT_STRATEGY, extract_shipping_info, row_cache
+from utils.worker_pool import ParserPool, PoolBusy
+
+
+def wait_for(jobs, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] in FINISHED_STATES:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def pool():
+    pool = ParserPool(max_workers=1, max_queue=0, timeout=30)
+    yield pool
+    pool.shutdown()
+
+
+def stuck_in_strategy(candidates, deadline):
+    # A strategy that never reports progress and only stops when its deadline does
+    while True:
+        deadline.check()
+        time.sleep(0.001)
+
+
+def test_job_reports_rows_and_result(tmp_path, pool):
+    jobs = ExtractionJobs(str(tmp_path / 'jobs.db'), pool)
+    page = generate_order_page('buyer_spans', 50, seed=15)
+    row_cache.clear()
+
+    job = wait_for(jobs, jobs.submit(page))
+    assert job['status'] == JOB_DONE
+    assert (job['rows_scanned'], job['rows_total'], job['addresses_found']) == (50, 50, 50)
+    assert job['result'] == extract_shipping_info(page)
+
+
+def test_cancelled_job_stops(tmp_path, pool):
+    jobs = ExtractionJobs(str(tmp_path / 'jobs.db'), pool)
+    page = generate_order_page('address_divs', 300, seed=16)
+
+    job_id = jobs.submit(page)
+    assert jobs.cancel(job_id)
+    job = wait_for(jobs, job_id)
+    assert job['status'] == JOB_CANCELLED and job['result'] is None
+    assert not jobs.cancel(job_id)
+
+
+def test_jobs_share_the_pool_limit(tmp_path, pool):
+    jobs = ExtractionJobs(str(tmp_path / 'jobs.db'), pool)
+    busy = pool.submit(time.sleep, 0.5)
+    with pytest.raises(PoolBusy):
+        jobs.submit(generate_order_page('text', 1))
+    busy.result()
+    assert wait_for(jobs, jobs.submit(generate_order_page('text', 1)))['status'] == JOB_DONE
+
+
+def test_cancel_reaches_a_job_in_the_middle_of_a_strategy(tmp_path, monkeypatch):
+    # A thread stands in for the pool so the job sees the patched strategy; pool workers are spawned fresh
+    monkeypatch.setattr(html_parser, 'STRATEGIES', [(TEXT_STRATEGY, stuck_in_strategy)])
+    with ThreadPoolExecutor(max_workers=1) as threads:
+        jobs = ExtractionJobs(str(tmp_path / 'jobs.db'), threads, strategy_budget=60)
+        job_id = jobs.submit(generate_order_page('text', 3))
+        deadline = time.monotonic() + 10
+        while jobs.get(job_id)['stage'] != TEXT_STRATEGY:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+
+        cancelled_at = time.monotonic()
+        assert jobs.cancel(job_id)
+        job = wait_for(jobs, job_id, timeout=5)
+        assert job['status'] == JOB_CANCELLED and job['stage'] == TEXT_STRATEGY
+        assert time.monotonic() - cancelled_at < PROGRESS_INTERVAL + 0.5
+
+
+def test_expired_jobs_are_gone(tmp_path, pool):
+    jobs = ExtractionJobs(str(tmp_path / 'jobs.db'), pool, ttl=0.5)
+    job_id = jobs.submit(generate_order_page('text', 1))
+    wait_for(jobs, job_id)
+    time.sleep(0.6)
+    assert jobs.get(job_id) is None
+
+
+def test_job_routes():
+    client = app.test_client()
+    response = client.post('/extract-jobs', data={'html_content': generate_order_page('table_rows', 5, seed=17)})
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        data = client.get(status_url).get_json()
+        if data['status'] in FINISHED_STATES:
+            break
+        time.sleep(0.02)
+
+    assert data['success'] and data['multiple'] and len(data['data']) == 5
+    assert client.patch(f"/addresses/{data['dataset_id']}/0", json={'Weight': '2'}).status_code == 200
+    assert client.get('/extract-jobs/unknown').status_code == 404
@@ -0,0 +1,56 @@
+"""
+Tests for utils.heavy_hitters and the top-K mode of /extract-asins.
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from app import app
+from utils.heavy_hitters import SpaceSaving
+
+
+@pytest.mark.parametrize('capacity', [1, 3, 50])
+def test_counts_stay_within_their_error_bounds(capacity):
+    rng = random.Random(capacity)
+    items = [int(rng.paretovariate(1.1)) for _ in range(20000)]
+    exact = Counter(items)
+    summary = SpaceSaving(capacity)
+    summary.update(items)
+
+    assert len(summary) <= capacity and summary.total == len(items)
+    for item, count, error in summary.most_common():
+        assert count - error <= exact[item] <= count
+        assert error <= summary.max_error <= len(items) // capacity
+
+    # Anything more frequent than the bound (itself at most total / capacity) is always kept
+    tracked = {item for item, _, _ in summary.most_common()}
+    assert all(count <= summary.max_error for item, count in exact.items() if item not in tracked)
+    assert {item for item, count in exact.items() if count > len(items) / capacity} <= tracked
+
+
+def test_exact_until_capacity_is_reached():
+    summary = SpaceSaving(5)
+    summary.update('abracadabra')
+    assert summary.max_error == 0 and summary.evictions == 0
+    assert summary.most_common(2) == [('a', 5, 0), ('b', 2, 0)]
+
+    summary.add('z')
+    assert summary.evictions == 1 and summary.max_error == 1 and len(summary) == 5
+    with pytest.raises(ValueError):
+        SpaceSaving(0)
+
+
+def test_route_top_k_mode():
+    client = app.test_client()
+    # B0AAAAAAAA occurs more than total / K times, so it must come out on top
+    text = ' '.join([f'B0C{i:07d}' for i in range(10)] + ['B0AAAAAAAA'] * 20 + ['B0BBBBBBBB'] * 5)
+
+    page = client.post('/extract-asins', data={'order_text': text, 'mode': 'top', 'top_k': '2'}).get_data(as_text=True)
+    assert 'Top <strong>2</strong> of 35 ASINs' in page and 'counts are upper bounds' in page
+    with client.session_transaction() as session:
+        assert [asin for asin, _ in session['asin_data']][0] == 'B0AAAAAAAA'
+        assert len(session['asin_data']) == 2
+
+    page = client.post('/extract-asins', data={'order_text': text, 'mode': 'top', 'top_k': 'lots'})
+    assert 'K must be between 1 and' in page.get_data(as_text=True)
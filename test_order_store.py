@@ -0,0 +1,93 @@
+"""
+Tests for utils.order_store and the exported-order handling in /generate-csv.
+"""
+import io
+import csv
+import random
+
+from app import app
+from test_parser_parity import order_row
+from utils.order_store import LOOKUP_CHUNK_SIZE, OrderStore
+
+
+def test_record_reports_only_exported_orders(tmp_path):
+    store = OrderStore(str(tmp_path / 'orders.db'))
+    addresses = [{'order_id': f'111-{i:07d}-1111111', 'ToName': f'Buyer {i}'} for i in range(3)] + [{'ToName': 'No ID'}]
+
+    assert store.record(addresses) == set()
+    store.mark_exported(['111-0000001-1111111', ''])
+    assert store.record(addresses) == {'111-0000001-1111111'}
+    assert store.stats() == {'orders': 3, 'exported': 1}
+
+    store.mark_exported(['111-0000001-1111111', '999-typed-in'])
+    found = store.lookup(['111-0000001-1111111', '999-typed-in', '111-0000002-1111111', 'missing'])
+    assert found['111-0000001-1111111']['export_count'] == 2
+    assert found['999-typed-in']['export_count'] == 1
+    assert found['111-0000002-1111111']['exported_at'] is None
+    assert 'missing' not in found
+
+
+def test_exports_from_the_same_dataset_do_not_count(tmp_path):
+    store = OrderStore(str(tmp_path / 'orders.db'))
+    store.mark_exported(['a', 'b'], 'dataset-1')
+    store.mark_exported(['a'], 'dataset-1')
+    assert store.exported_elsewhere(['a', 'b', 'c'], 'dataset-1') == set()
+    assert store.exported_elsewhere(['a', 'b', 'c'], 'dataset-2') == {'a', 'b'}
+
+    # Orders typed in by hand have no dataset, so they count everywhere
+    store.mark_exported(['b'])
+    assert store.exported_elsewhere(['a', 'b'], 'dataset-1') == {'b'}
+    assert store.exported_elsewhere(['a', 'b']) == {'a', 'b'}
+    store.mark_exported(['typed'])
+    assert store.exported_elsewhere(['typed']) == {'typed'}
+
+
+def test_lookup_spans_chunks(tmp_path):
+    store = OrderStore(str(tmp_path / 'orders.db'))
+    order_ids = [f'order-{i}' for i in range(LOOKUP_CHUNK_SIZE * 2 + 7)]
+    store.record([{'order_id': order_id} for order_id in order_ids])
+    assert len(store.lookup(order_ids + ['missing'])) == len(order_ids)
+
+
+def test_generate_csv_flags_and_excludes_exported_orders():
+    client = app.test_client()
+    prefix = f'{random.randrange(1000):03d}-{random.randrange(10 ** 7):07d}'
+    page = '<table>' + ''.join(
+        order_row(f'{prefix}-000000{i}', f'Store Buyer {i}', f'{i + 1} Oak Rd', 'Omaha, NE 68102') for i in range(3)
+    ) + '</table>'
+
+    first = client.post('/extract', data={'html_content': page}).get_json()
+    assert first['previously_exported'] == []
+    form = {'merge_orders': 'on', 'dataset_id': first['dataset_id'], 'Weight': '1'}
+    client.post('/generate-csv', data=form)
+
+    # Building the CSV again from the same extraction is not a repeat export
+    response = client.post('/generate-csv', data=dict(form, exported_orders='flag'))
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['Ref01'] for row in rows] == [''] * 3
+    assert client.post('/generate-csv', data=dict(form, exported_orders='exclude')).status_code == 200
+
+    second = client.post('/extract', data={'html_content': page}).get_json()
+    assert second['previously_exported'] == [f'{prefix}-000000{i}' for i in range(3)]
+
+    form['dataset_id'] = second['dataset_id']
+    response = client.post('/generate-csv', data=dict(form, exported_orders='flag'))
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['Ref01'] for row in rows] == ['ALREADY EXPORTED'] * 3
+
+    response = client.post('/generate-csv', data=dict(form, exported_orders='exclude'))
+    assert response.status_code == 409
+
+
+def test_generate_csv_catches_a_typed_in_order_exported_twice():
+    client = app.test_client()
+    order_id = f'{random.randrange(1000):03d}-{random.randrange(10 ** 7):07d}-7777777'
+    form = {'ToName': 'Typed Buyer', 'Street1To': '5 Pine St', 'CityTo': 'Omaha', 'StateTo': 'NE',
+            'ZipTo': '68102', 'order_id': order_id, 'Weight': '1'}
+
+    first = client.post('/generate-csv', data=dict(form, exported_orders='flag'))
+    assert list(csv.DictReader(io.StringIO(first.get_data(as_text=True))))[0]['Ref01'] == ''
+
+    again = client.post('/generate-csv', data=dict(form, exported_orders='flag'))
+    assert list(csv.DictReader(io.StringIO(again.get_data(as_text=True))))[0]['Ref01'] == 'ALREADY EXPORTED'
+    assert client.post('/generate-csv', data=dict(form, exported_orders='exclude')).status_code == 409
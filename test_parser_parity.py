@@ -0,0 +1,594 @@
+"""
+Parity tests for utils.html_parser.extract_shipping_info.
+
+legacy_extract_shipping_info below is the multi-pass implementation the
+single-pass engine replaced, kept verbatim as the reference. Every fixture
+must produce exactly the same result from both.
+"""
+import re
+import time
+import random
+import logging
+import threading
+
+import pytest
+from bs4 import BeautifulSoup
+
+from utils.html_parser import (
+    CITY_STATE_ZIP_PATTERN, PAGE_ADDRESS_TEXT, PAGE_FORM, PAGE_ORDER_ROWS, PAGE_PRODUCT, PAGE_UNKNOWN,
+    classify_page, extract_shipping_info, extract_shipping_report, find_order_regions, row_cache,
+    search_city_state_zip, parse_combined_field, extract_address_components
+)
+
+
+def order_row(order_id, name, street, city_state_zip, wrap_in_buyer_span=True):
+    address = (
+        f'<div data-test-id="shipping-section-buyer-address">'
+        f'<span>{name}</span><br><span>{street}</span><br><span>{city_state_zip}</span>'
+        f'</div>'
+    )
+    if wrap_in_buyer_span:
+        address = f'<span data-test-id="shipping-section-buyer-po">{address}</span>'
+    return (
+        f'<tr><td><a href="/orders-v3/order/{order_id}">{order_id}</a></td>'
+        f'<td><div class="cell"><div>{address}</div></div></td></tr>'
+    )
+
+
+FIXTURES = {
+    'empty': '',
+    'no_markup': 'just some words without an address',
+    'buyer_spans_single': '<table>' + order_row('111-1111111-1111111', 'Jane Doe', '12 Main St', 'Springfield, IL 62704') + '</table>',
+    'buyer_spans_many': '<table>' + ''.join(
+        order_row(f'111-{i:07d}-1111111', f'Buyer {i}', f'{i} Oak Ave', 'Austin, TX 78701-1234')
+        for i in range(1, 6)) + '</table>',
+    'buyer_spans_incomplete_falls_to_rows': (
+        '<table><tr><td><a href="/order/222-2222222-2222222">222-2222222-2222222</a></td><td>'
+        '<span data-test-id="shipping-section-buyer-po">no address here</span>'
+        '<div data-test-id="shipping-section-buyer-address"><span>Sam Roe</span><span>9 Elm Rd</span>'
+        '<span>Reno,</span><span>NV 89501</span></div></td></tr></table>'
+    ),
+    'table_rows_only': '<table>' + ''.join(
+        order_row(f'333-{i:07d}-3333333', f'Row Buyer {i}', f'{i}0 Pine Dr', 'Boise, ID 83702', wrap_in_buyer_span=False)
+        for i in range(3)) + '</table>',
+    'nested_rows': (
+        '<table><tr><td><table>' + order_row('444-4444444-4444444', 'Nested Person', '5 Deep Ln', 'Dover, DE 19901',
+                                             wrap_in_buyer_span=False)
+        + '</table></td></tr></table>'
+    ),
+    'first_order_link_without_id': (
+        '<table><tr><td><a href="/order/help">Order help</a><a href="/order/303-3030303-3030303">303-3030303-3030303</a>'
+        '</td><td><span data-test-id="shipping-section-buyer-po"><div data-test-id="shipping-section-buyer-address">'
+        '<span>Two Links</span><span>7 Fork Rd</span><span>Butte, MT 59701</span></div></span></td></tr></table>'
+    ),
+    'order_link_beyond_search_depth': (
+        '<div><a href="/order/404-4040404-4040404">404-4040404-4040404</a><div><div><div><div><div>'
+        '<div data-test-id="shipping-section-buyer-address"><span class="">Far Away</span><span class="">5 Long Rd</span>'
+        'Fargo, ND 58102</div></div></div></div></div></div></div>'
+    ),
+    'row_without_order_link': (
+        '<table><tr><td><div data-test-id="shipping-section-buyer-address"><span>No Link</span>'
+        '<span>1 Way</span><span>Miami, FL 33101</span></div></td></tr></table>'
+    ),
+    'form_fields': (
+        '<form><input id="ToName" value="Form Person"><input id="Street1To" value="77 Sunset Blvd">'
+        '<input id="CityTo" value="Los Angeles"><input id="StateTo" value="CA"><input id="ZipTo" value="90001">'
+        '<input id="order-id" value="555-5555555-5555555"></form>'
+    ),
+    'form_fields_combined': (
+        '<form><textarea id="receiver_name" value="John Smith 100 Main Street, Denver, CO 80202"></textarea></form>'
+    ),
+    'form_fields_without_name_or_street': '<form><input id="city" value="Nowhere"></form>',
+    'address_divs_outside_table': (
+        '<div><a href="/order/666-6666666-6666666">Order 666-6666666-6666666</a><section>'
+        '<div data-test-id="shipping-section-buyer-address"><span>Loose Div</span><span>3 Hill Ct</span>'
+        'Tampa, FL 33602</div></section></div>'
+    ),
+    'address_divs_empty_class_spans': (
+        '<div><a href="/order/777-7777777-7777777">777-7777777-7777777</a><ul><li>'
+        '<div data-test-id="shipping-section-buyer-address"><span class="">Empty Class</span><br>'
+        '<span class="">4 Rock Rd</span><br><span class="">Provo, UT 84601</span></div></li></ul></div>'
+    ),
+    'address_divs_with_classes': (
+        '<div data-test-id="shipping-section-buyer-address"><span class="name">Classy Name</span>'
+        '<span>8 Bay Rd</span><span>Salem, OR 97301</span></div>'
+    ),
+    'text_fallback': '<html><body><p>Ship to</p><p>Mary Major</p><p>400 Lake Shore Drive</p><p>Chicago, IL 60611</p>'
+                     '<p>Phone: (312) 555-0100</p></body></html>',
+    'text_with_comments_and_scripts': (
+        '<html><head><script>var a = "Ignored Name 1 Script St";</script></head><body><!-- Comment Person 9 Way -->'
+        '<div>Peter Parker</div><div>20 Ingram Street</div><div>Queens, NY 11375</div></body></html>'
+    ),
+    'layout_table_around_orders': (
+        '<table class="layout"><tr><td><nav>menu</nav></td></tr><tr><td><table>'
+        + order_row('888-8888888-8888888', 'Wrapped Buyer', '6 Gate St', 'Albany, NY 12207', wrap_in_buyer_span=False)
+        + '</table></td></tr></table>'
+    ),
+    'marker_outside_rows': (
+        '<table>' + order_row('999-9999999-9999999', 'In Row', '1 Row Rd', 'Mesa, AZ 85201') + '</table>'
+        '<div data-test-id="shipping-section-buyer-address"><span class="">Out Row</span>'
+        '<span class="">2 Free St</span>Mesa, AZ 85202</div>'
+    ),
+    'unclosed_row': (
+        '<table><tr><td><table>' + order_row('123-1234567-1234567', 'Open Row', '3 Ajar Ave', 'Erie, PA 16501')
+        + '</table>'
+    ),
+    'scripts_and_noise_around_orders': (
+        '<html><head><script>var rows = "<tr><td>not a row</td></tr>";</script></head><body>'
+        '<div id="nav">' + 'x' * 500 + '</div><table>'
+        + order_row('101-0000001-0000001', 'Noisy Page', '10 Quiet Way', 'Ogden, UT 84401')
+        + '</table></body></html>'
+    ),
+    'row_tags_in_comments_and_scripts': (
+        '<div><!-- <tr> --></div><div data-test-id="shipping-section-buyer-address"><span>Hidden Loose</span>'
+        '<span>2 Free St</span><span>Mesa, AZ 85202</span></div><script>var row = "<tr></tr>";</script><table>'
+        + order_row('919-9191919-9191919', 'Real Row', '1 Row Rd', 'Mesa, AZ 85201', wrap_in_buyer_span=False)
+        + '</table><style>/* <tr></tr> */</style><!-- </tr> -->'
+    ),
+    'product_page': '<html><body><span id="productTitle">Widget</span><input id="add-to-cart-button"></body></html>',
+}
+
+
+@pytest.mark.parametrize('region_limited', [True, False])
+@pytest.mark.parametrize('name', sorted(FIXTURES))
+def test_matches_legacy_parser(name, region_limited):
+    html_content = FIXTURES[name]
+    expected = legacy_extract_shipping_info(html_content)
+    assert extract_shipping_info(html_content, region_limited=region_limited) == expected
+
+
+@pytest.mark.parametrize('name', sorted(FIXTURES))
+def test_bytes_input_matches_str_input(name):
+    html_content = '<meta charset="utf-8">' + FIXTURES[name]
+    assert extract_shipping_info(html_content.encode('utf-8')) == extract_shipping_info(html_content)
+
+
+def test_region_finder_skips_noise():
+    html_content = FIXTURES['scripts_and_noise_around_orders']
+    regions = find_order_regions(html_content)
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert html_content[start:end].startswith('<tr><td><a href=')
+    assert html_content[start:end].endswith('</tr>')
+
+
+def test_region_finder_gives_up_on_markers_outside_rows():
+    assert find_order_regions(FIXTURES['marker_outside_rows']) is None
+    assert find_order_regions(FIXTURES['unclosed_row']) is None
+    assert find_order_regions(FIXTURES['text_fallback']) is None
+    assert find_order_regions('<table>' + order_row('1', 'A', '1 Elm St', 'Boise, ID 83702') + '</table><!-- open') is None
+
+
+def test_region_finder_skips_comments_and_scripts():
+    # The commented-out row tags no longer wrap the loose address, so it is a marker outside every row
+    assert find_order_regions(FIXTURES['row_tags_in_comments_and_scripts']) is None
+
+    html_content = (
+        '<!-- <tr> --><p>header</p><script>var open = "<TR>";</script><table>'
+        + order_row('919-9191919-9191919', 'Real Row', '1 Row Rd', 'Mesa, AZ 85201')
+        + '</table><!-- </tr> data-test-id="shipping-section-buyer-po" -->'
+    )
+    regions = find_order_regions(html_content)
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert html_content[start:end].startswith('<tr><td><a href=') and html_content[start:end].endswith('</tr>')
+    assert find_order_regions(html_content.encode('utf-8')) == regions
+
+
+def test_buyer_spans_keep_order_ids():
+    result = extract_shipping_info(FIXTURES['buyer_spans_many'])
+    assert [address['order_id'] for address in result] == [f'111-{i:07d}-1111111' for i in range(1, 6)]
+
+
+def test_overlapping_paste_only_parses_new_rows():
+    rows = [order_row(f'202-{i:07d}-2020202', f'Repeat Buyer {i}', f'{i} Loop Rd', 'Tulsa, OK 74103') for i in range(8)]
+    first_page = '<table>' + ''.join(rows[3:]) + '</table>'
+    second_page = '<table>' + ''.join(rows) + '</table>'
+
+    assert extract_shipping_info(first_page) == legacy_extract_shipping_info(first_page)
+    hits_before = row_cache.hits
+    assert extract_shipping_info(second_page) == legacy_extract_shipping_info(second_page)
+    assert row_cache.hits - hits_before == 5
+
+@pytest.mark.parametrize('name, kind', [
+    ('buyer_spans_many', PAGE_ORDER_ROWS),
+    ('form_fields', PAGE_FORM),
+    ('text_fallback', PAGE_ADDRESS_TEXT),
+    ('product_page', PAGE_PRODUCT),
+    ('no_markup', PAGE_UNKNOWN),
+])
+def test_classify_page(name, kind):
+    page = classify_page(FIXTURES[name])
+    assert page['kind'] == kind
+    assert (page['error'] is None) == (kind not in (PAGE_PRODUCT, PAGE_UNKNOWN))
+
+
+def test_classify_page_skips_strategies_without_markers():
+    assert classify_page(FIXTURES['form_fields'])['strategies'] == ['form_fields', 'text']
+    assert classify_page(FIXTURES['text_fallback'].encode('utf-8'))['strategies'] == ['text']
+
+
+def test_search_city_state_zip_matches_pattern():
+    rng = random.Random(9)
+    pieces = ['Salt Lake City', ' ', ',', ', ', 'UT', 'ut', '84101', '84101-1234', '12', '\n', 'x', '9']
+    for _ in range(2000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        expected = CITY_STATE_ZIP_PATTERN.search(text)
+        match = search_city_state_zip(text)
+        if expected is None:
+            assert match is None, text
+        else:
+            assert (match.start(), match.groups()) == (expected.start(), expected.groups()), text
+
+
+def test_long_city_runs_match_pattern():
+    # Runs longer than the first window read back from the comma are still read to their start
+    for length in (255, 256, 257, 317, 5000):
+        text = '123 ' + 'a' * (length - 1) + ' , UT 84101'
+        expected = CITY_STATE_ZIP_PATTERN.search(text)
+        match = search_city_state_zip(text)
+        assert len(expected.group(1)) == length + 1
+        assert (match.start(), match.groups()) == (expected.start(), expected.groups())
+
+
+def test_pathological_text_is_linear():
+    # Long runs of words and digits with no address in them used to backtrack quadratically
+    text = ('word ' * 40000) + ',' + ('1' * 40000) + ' '
+    started = time.monotonic()
+    assert extract_address_components(text)['CityTo'] == ''
+    assert parse_combined_field(text)['city'] == ''
+    # Many addresses after one long run: the run is read back once, for the first of them
+    text = ('word ' * 40000) + ', UT 84101 ' * 20000
+    assert search_city_state_zip(text).end() == 200010
+    assert time.monotonic() - started < 1
+
+
+def test_strategy_budget_skips_strategy():
+    report = extract_shipping_report(FIXTURES['buyer_spans_many'], region_limited=False, strategy_budget=0)
+    assert report['result'] is None
+    assert report['skipped'] == ['buyer_spans', 'table_rows', 'address_divs', 'text']
+    assert not report['cancelled']
+
+
+def test_cancelled_extraction_reports_every_strategy():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    report = extract_shipping_report(FIXTURES['form_fields'], cancel_event=cancel_event)
+    assert report == {'result': None, 'strategy': None, 'skipped': ['form_fields', 'text'], 'cancelled': True}
+
+
+def test_report_names_winning_strategy():
+    report = extract_shipping_report(FIXTURES['form_fields'], time_budget=60, strategy_budget=30)
+    assert report['result'] == legacy_extract_shipping_info(FIXTURES['form_fields'])
+    assert (report['strategy'], report['skipped']) == ('form_fields', [])
+
+
+def legacy_extract_shipping_info(html_content):
+    """
+    Extract customer shipping information from the HTML content.
+    
+    Args:
+        html_content (str): The HTML content containing shipping information
+        
+    Returns:
+        dict or list: A dictionary with extracted shipping details or a list of dictionaries 
+                     if multiple addresses are found
+    """
+    try:
+        # Parse HTML with BeautifulSoup
+        soup = BeautifulSoup(html_content, 'html.parser')
+        
+        # Initialize shipping addresses list
+        shipping_addresses = []
+        
+        # First look for all shipping-section-buyer-po spans which contain the address
+        # This is the specific format you mentioned in your example
+        buyer_spans = soup.find_all('span', attrs={'data-test-id': 'shipping-section-buyer-po'})
+        
+        if buyer_spans:
+            # For each buyer span, try to find the address div and order ID
+            for span_index, buyer_span in enumerate(buyer_spans):
+                # Find the parent row to get the order ID
+                current = buyer_span
+                order_id = ""
+                
+                # Go up the DOM tree to find the parent row which contains the order link
+                for _ in range(8):  # Limit the depth of parent search
+                    if not current or current.name == 'tr':
+                        break
+                    current = current.parent
+                
+                if current and current.name == 'tr':
+                    # Try to find the order link
+                    order_links = current.find_all('a', href=lambda href: href and '/order/' in href)
+                    if order_links:
+                        order_id_match = re.search(r'(\d{3}-\d{7}-\d{7})', order_links[0].text.strip())
+                        if order_id_match:
+                            order_id = order_id_match.group(1)
+                
+                # Find the address div within this buyer span
+                address_div = buyer_span.find('div', attrs={'data-test-id': 'shipping-section-buyer-address'})
+                
+                if address_div:
+                    shipping_info = {
+                        'ToName': '',
+                        'PhoneTo': '',
+                        'Street1To': '',
+                        'CompanyTo': '',
+                        'Street2To': '',
+                        'CityTo': '',
+                        'ZipTo': '',
+                        'StateTo': '',
+                        'order_id': order_id
+                    }
+                    
+                    # Find all spans in the address div (name, street, city, state, zip)
+                    spans = address_div.find_all('span')
+                    
+                    # Get text from each span
+                    span_texts = []
+                    for span in spans:
+                        text = span.get_text().strip()
+                        if text:
+                            # Remove <br> tag
+                            text = text.replace('<br>', '')
+                            span_texts.append(text)
+                    
+                    # First span is usually the name
+                    if len(span_texts) >= 1:
+                        shipping_info['ToName'] = span_texts[0]
+                    
+                    # Second span is usually the street address
+                    if len(span_texts) >= 2:
+                        shipping_info['Street1To'] = span_texts[1]
+                    
+                    # Check remaining spans for city, state, zip
+                    city_state_zip_text = " ".join(span_texts[2:]) if len(span_texts) > 2 else ""
+                    
+                    # Extract city, state, zip from combined text
+                    city_state_zip_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
+                    city_state_zip_match = re.search(city_state_zip_pattern, city_state_zip_text)
+                    
+                    if city_state_zip_match:
+                        shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
+                        shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
+                        shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
+                    
+                    # Only add if we have all the essential shipping info
+                    if all([shipping_info['ToName'], shipping_info['Street1To'], 
+                          shipping_info['CityTo'], shipping_info['StateTo'], shipping_info['ZipTo']]):
+                        shipping_addresses.append(shipping_info)
+        
+        # If we found addresses from the spans, return them
+        if shipping_addresses:
+            return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
+            
+        # If no spans found, try with table row approach
+        shipping_rows = soup.find_all('tr')
+        
+        for row in shipping_rows:
+            # Look for the order ID in this row
+            order_id = ""
+            order_links = row.find_all('a', href=lambda href: href and '/order/' in href)
+            if order_links:
+                order_id_match = re.search(r'(\d{3}-\d{7}-\d{7})', order_links[0].text.strip())
+                if order_id_match:
+                    order_id = order_id_match.group(1)
+            
+            # Look for address div in this row
+            address_div = row.find('div', attrs={'data-test-id': 'shipping-section-buyer-address'})
+            
+            if address_div:
+                shipping_info = {
+                    'ToName': '',
+                    'PhoneTo': '',
+                    'Street1To': '',
+                    'CompanyTo': '',
+                    'Street2To': '',
+                    'CityTo': '',
+                    'ZipTo': '',
+                    'StateTo': '',
+                    'order_id': order_id
+                }
+                
+                # Find all spans in the address div (name, street, city, state, zip)
+                spans = address_div.find_all('span')
+                span_texts = []
+                
+                # Extract text from each span
+                for span in spans:
+                    text = span.get_text().strip()
+                    if text:
+                        span_texts.append(text.replace('<br>', ''))
+                
+                # First span is usually the name
+                if len(span_texts) >= 1:
+                    shipping_info['ToName'] = span_texts[0]
+                
+                # Second span is usually the street address
+                if len(span_texts) >= 2:
+                    shipping_info['Street1To'] = span_texts[1]
+                
+                # Last spans usually have city, state, zip
+                city_state_zip_text = ""
+                if len(span_texts) >= 3:
+                    # Combine the remaining spans which might have city, state, zip
+                    city_state_zip_text = " ".join(span_texts[2:])
+                
+                # Extract city, state, zip from combined text
+                city_state_zip_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
+                city_state_zip_match = re.search(city_state_zip_pattern, city_state_zip_text)
+                
+                if city_state_zip_match:
+                    shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
+                    shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
+                    shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
+                
+                # Only add if we have all the essential shipping info
+                if all([shipping_info['ToName'], shipping_info['Street1To'], 
+                       shipping_info['CityTo'], shipping_info['StateTo'], shipping_info['ZipTo']]):
+                    shipping_addresses.append(shipping_info)
+        
+        # If we found addresses from any method, return them
+        if shipping_addresses:
+            return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
+        
+        # If we couldn't find addresses in the table format, try other methods
+        
+        # Try to find form fields with labels like "To Name", "Street 1", etc.
+        form_fields = {
+            'ToName': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'ToName|to[-_]?name|receiver[-_]?name', re.IGNORECASE)}),
+            'Street1To': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'Street1To|street[-_]?1|address[-_]?1', re.IGNORECASE)}),
+            'CityTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'CityTo|city', re.IGNORECASE)}),
+            'StateTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'StateTo|state', re.IGNORECASE)}),
+            'ZipTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'ZipTo|zip|postal[-_]?code', re.IGNORECASE)}),
+            'PhoneTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'PhoneTo|phone|tel', re.IGNORECASE)}),
+            'CompanyTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'CompanyTo|company', re.IGNORECASE)}),
+            'Street2To': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'Street2To|street[-_]?2|address[-_]?2', re.IGNORECASE)}),
+            'order_id': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'order[-_]?id|orderId', re.IGNORECASE)})
+        }
+        
+        # Check if we found form fields
+        if any(field for field in form_fields.values()):
+            address_info = {
+                'ToName': '',
+                'PhoneTo': '',
+                'Street1To': '',
+                'CompanyTo': '',
+                'Street2To': '',
+                'CityTo': '',
+                'ZipTo': '',
+                'StateTo': '',
+                'order_id': ''
+            }
+            
+            # Extract values from form fields
+            for field_name, field_element in form_fields.items():
+                if field_element:
+                    value = field_element.get('value', '')
+                    if value:
+                        # Special handling for fields that might contain combined information
+                        if field_name == 'ToName' and (re.search(r'\d+\s+[A-Za-z]+', value) or ',' in value):
+                            # This looks like it contains address info, not just a name
+                            parts = parse_combined_field(value)
+                            if parts.get('name'):
+                                address_info['ToName'] = parts['name']
+                            if parts.get('street'):
+                                address_info['Street1To'] = parts['street']
+                            if parts.get('city'):
+                                address_info['CityTo'] = parts['city']
+                            if parts.get('state'):
+                                address_info['StateTo'] = parts['state']
+                            if parts.get('zip'):
+                                address_info['ZipTo'] = parts['zip']
+                        elif field_name == 'Street1To' and (re.search(r'[A-Z][a-z]+\s+[A-Z][a-z]+', value) or ',' in value):
+                            # This might contain name and street combined
+                            parts = parse_combined_field(value)
+                            if parts.get('name') and not address_info['ToName']:
+                                address_info['ToName'] = parts['name']
+                            if parts.get('street'):
+                                address_info['Street1To'] = parts['street']
+                            if parts.get('city'):
+                                address_info['CityTo'] = parts['city']
+                            if parts.get('state'):
+                                address_info['StateTo'] = parts['state']
+                            if parts.get('zip'):
+                                address_info['ZipTo'] = parts['zip']
+                        else:
+                            # Regular field
+                            address_info[field_name] = value
+            
+            # Check if we have the essential info and add to addresses
+            if address_info['ToName'] or address_info['Street1To']:
+                shipping_addresses.append(address_info)
+            
+            # Return form field addresses if found
+            if shipping_addresses:
+                return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
+        
+        # Look for general Amazon-specific address elements (if not in table format)
+        amazon_addresses = soup.find_all('div', attrs={'data-test-id': 'shipping-section-buyer-address'})
+        
+        # If we found Amazon address format but not in the table format we tried earlier
+        if amazon_addresses and not shipping_addresses:
+            for address_div in amazon_addresses:
+                shipping_info = {
+                    'ToName': '',
+                    'PhoneTo': '',
+                    'Street1To': '',
+                    'CompanyTo': '',
+                    'Street2To': '',
+                    'CityTo': '',
+                    'ZipTo': '',
+                    'StateTo': '',
+                    'order_id': ''
+                }
+                
+                # Extract text content from the address div
+                address_text = address_div.get_text()
+                
+                # Find the name (first line) and street address (second line)
+                try:
+                    spans = address_div.find_all('span', class_='')
+                    if spans and len(spans) >= 1:
+                        shipping_info['ToName'] = spans[0].get_text().strip().rstrip('<br>')
+                    
+                    if spans and len(spans) >= 2:
+                        shipping_info['Street1To'] = spans[1].get_text().strip().rstrip('<br>')
+                except (AttributeError, TypeError):
+                    logging.warning("Could not extract spans from address div")
+                
+                # Extract city, state, zip from the last part
+                city_state_zip_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
+                city_state_zip_match = re.search(city_state_zip_pattern, address_text)
+                
+                if city_state_zip_match:
+                    shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
+                    shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
+                    shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
+                
+                # Try to find order ID near this address
+                order_element = None
+                current = address_div
+                
+                # Look for order ID in parent elements
+                for _ in range(5):  # limit the search depth
+                    if not current.parent:
+                        break
+                    current = current.parent
+                    try:
+                        order_links = current.find_all('a', href=re.compile(r'/order/'))
+                        if order_links:
+                            order_element = order_links[0]
+                            break
+                    except (AttributeError, TypeError):
+                        continue
+                
+                # Extract order ID if found
+                if order_element:
+                    order_id_match = re.search(r'(\d{3}-\d{7}-\d{7})', order_element.get_text())
+                    if order_id_match:
+                        shipping_info['order_id'] = order_id_match.group(1)
+                
+                # Only add if we have the essential shipping info
+                if shipping_info['ToName'] and shipping_info['Street1To'] and shipping_info['CityTo'] and shipping_info['StateTo'] and shipping_info['ZipTo']:
+                    shipping_addresses.append(shipping_info)
+        
+        # Return addresses if found through any method
+        if shipping_addresses:
+            return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
+        
+        # If no structured addresses found, try to extract from text content as last resort
+        full_text = soup.get_text()
+        addr_components = extract_address_components(full_text)
+        
+        if addr_components and addr_components['ToName'] and addr_components['Street1To']:
+            return addr_components
+        
+        # If we still couldn't find any addresses, return None
+        return None
+        
+    except Exception as e:
+        logging.error(f"Error parsing HTML: {str(e)}")
+        return None
+
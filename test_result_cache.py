@@ -0,0 +1,79 @@
+"""
+Tests for utils.result_cache and the /extract result cache.
+"""
+import app as app_module
+from app import app, extraction_cache
+from test_parser_parity import order_row
+from utils import result_cache
+from utils.result_cache import ResultCache, content_key
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1 and len(cache) == 2
+
+
+def test_size_bound_evicts_and_skips_oversized_values():
+    cache = ResultCache(max_entries=100, max_bytes=30)
+    cache.put('a', 'x' * 10)
+    cache.put('b', 'y' * 10)
+    cache.put('c', 'z' * 10)
+    assert cache.get('a') is None and cache.get('c') == 'z' * 10
+    assert cache.stats()['bytes'] <= 30
+
+    # A value bigger than the whole cache is not stored and evicts nothing
+    cache.put('huge', 'w' * 100)
+    assert cache.get('huge') is None and cache.get('b') == 'y' * 10
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache = ResultCache(ttl=10)
+    cache.put('a', 1)
+    now[0] += 9
+    assert cache.get('a') == 1
+    now[0] += 2
+    assert cache.get('a') is None and len(cache) == 0
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_values_are_copied_in_and_out():
+    cache = ResultCache()
+    value = {'ToName': 'A'}
+    cache.put('a', value)
+    value['ToName'] = 'B'
+    cache.get('a')['ToName'] = 'C'
+    assert cache.get('a') == {'ToName': 'A'}
+
+
+def test_content_key_ignores_surrounding_whitespace_and_line_endings():
+    assert content_key('<p>a</p>\r\n<p>b</p>\n') == content_key(b'  <p>a</p>\n<p>b</p>')
+    assert content_key('<p>a</p>') != content_key('<p>b</p>')
+
+
+def test_repeated_extract_is_served_from_the_cache(monkeypatch):
+    page = '<table>' + order_row('111-7777777-1111111', 'Cache Buyer', '9 Oak St', 'Boise, ID 83702') + '</table>'
+    calls = []
+    parse = app_module.extract_shipping_report
+
+    def counting_parse(*args, **kwargs):
+        calls.append(1)
+        return parse(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, 'extract_shipping_report', counting_parse)
+    client = app.test_client()
+    hits = extraction_cache.stats()['hits']
+
+    first = client.post('/extract', data={'html_content': page}).get_json()
+    second = client.post('/extract', data={'html_content': page + '\r\n'}).get_json()
+    assert first['data'] == second['data'] and second['data']['ToName'] == 'Cache Buyer'
+    assert len(calls) == 1
+    assert client.get('/extract/cache-stats').get_json()['hits'] == hits + 1
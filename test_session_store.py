@@ -0,0 +1,89 @@
+"""
+Tests for utils.session_store.SqliteSessionInterface.
+"""
+import time
+
+from flask import Flask, session
+
+from utils.session_store import SqliteSessionInterface
+
+
+def make_app(tmp_path, **kwargs):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = SqliteSessionInterface(str(tmp_path / 'sessions.db'), **kwargs)
+
+    @app.route('/put/<int:count>')
+    def put(count):
+        session['asin_data'] = [(f'B{i:09d}', i) for i in range(count)]
+        return 'ok'
+
+    @app.route('/get')
+    def get():
+        return {'asin_data': session.get('asin_data')}
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+def test_large_session_stays_out_of_the_cookie(tmp_path):
+    client = make_app(tmp_path).test_client()
+    response = client.get('/put/2000')
+    assert len(response.headers['Set-Cookie']) < 200
+
+    data = client.get('/get').get_json()['asin_data']
+    assert len(data) == 2000 and data[1] == ['B000000001', 1]
+
+
+def test_tuples_survive_a_round_trip(tmp_path):
+    app = make_app(tmp_path)
+
+    @app.route('/check')
+    def check():
+        return {'is_tuple': isinstance(session['asin_data'][0], tuple)}
+
+    client = app.test_client()
+    client.get('/put/1')
+    assert client.get('/check').get_json() == {'is_tuple': True}
+
+
+def test_tampered_cookie_gets_a_new_session(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    client.get('/put/3')
+
+    cookie = client.get_cookie('session')
+    client.set_cookie('session', cookie.value[:-2] + 'xx')
+    assert client.get('/get').get_json() == {'asin_data': None}
+
+
+def test_expired_sessions_are_gone(tmp_path):
+    client = make_app(tmp_path, ttl=0.2).test_client()
+    client.get('/put/3')
+    time.sleep(0.3)
+    assert client.get('/get').get_json() == {'asin_data': None}
+
+
+def test_prune_drops_least_recently_used(tmp_path):
+    app = make_app(tmp_path, max_sessions=3, prune_every=1000)
+    clients = [app.test_client() for _ in range(5)]
+    for client in clients:
+        client.get('/put/2')
+        time.sleep(0.01)
+
+    assert app.session_interface.prune() == 2
+    assert app.session_interface.stats()['sessions'] == 3
+    assert clients[0].get('/get').get_json() == {'asin_data': None}
+    assert clients[-1].get('/get').get_json()['asin_data'] == [['B000000000', 0], ['B000000001', 1]]
+
+
+def test_clearing_the_session_deletes_it(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    client.get('/put/3')
+    client.get('/clear')
+    assert app.session_interface.stats() == {'sessions': 0, 'bytes': 0}
@@ -0,0 +1,82 @@
+"""
+Tests for utils.shipping_address.
+"""
+import copy
+import json
+import pickle
+
+import pytest
+
+from app import app
+from test_parser_parity import order_row
+from utils.shipping_address import AddressBatch, ShippingAddress, session_serializer, to_jsonable
+
+
+def test_record_behaves_like_the_old_dict():
+    address = ShippingAddress(ToName='Ann', ZipTo='12345')
+
+    assert address == {'ToName': 'Ann', 'ZipTo': '12345'}
+    assert 'CityTo' not in address and address.get('CityTo', '') == ''
+    assert list(address) == ['ToName', 'ZipTo'] and len(address) == 2
+
+    address['CityTo'] = 'Springfield'
+    del address['ZipTo']
+    assert address.to_dict() == {'ToName': 'Ann', 'CityTo': 'Springfield'}
+    assert {**address, 'Weight': '2'} == {'ToName': 'Ann', 'CityTo': 'Springfield', 'Weight': '2'}
+
+    with pytest.raises(KeyError):
+        address['ZipTo']
+    with pytest.raises(KeyError):
+        address['unknown'] = 'x'
+    with pytest.raises(KeyError):
+        ShippingAddress.from_dict({'ToName': 'Ann', 'unknown': 'x'})
+
+
+def test_record_survives_pickle_and_deepcopy():
+    address = ShippingAddress(ToName='Ann', order_id='111-2223334-5556667')
+    assert pickle.loads(pickle.dumps(address)) == address
+    clone = copy.deepcopy(address)
+    clone['ToName'] = 'Bob'
+    assert address['ToName'] == 'Ann'
+
+
+def test_batch_round_trips_records():
+    records = [{'ToName': 'Ann', 'ZipTo': '12345'}, {'ToName': 'Bob', 'order_id': '1'}]
+    batch = AddressBatch(records)
+
+    assert len(batch) == 2
+    assert batch[-1] == records[1] and isinstance(batch[0], ShippingAddress)
+    assert list(batch) == records
+    assert batch.to_records() == records
+    assert batch.column('ZipTo') == ['12345', '']
+    with pytest.raises(IndexError):
+        batch[2]
+
+
+def test_addresses_serialize_to_json():
+    batch = AddressBatch([{'ToName': 'Ann'}])
+    payload = {'data': ShippingAddress(ToName='Ann'), 'batch': batch}
+    assert json.loads(json.dumps(payload, default=to_jsonable)) == {'data': {'ToName': 'Ann'}, 'batch': [{'ToName': 'Ann'}]}
+
+    with app.app_context():
+        assert json.loads(app.json.dumps(payload)) == {'data': {'ToName': 'Ann'}, 'batch': [{'ToName': 'Ann'}]}
+    with pytest.raises(TypeError):
+        json.dumps(object(), default=to_jsonable)
+
+
+def test_session_keeps_records_through_to_the_csv():
+    serializer = session_serializer()
+    data = {'all_addresses': [ShippingAddress(ToName='Ann', ZipTo='12345'), {'ToName': 'Old session'}]}
+    loaded = serializer.loads(serializer.dumps(data))
+    assert loaded == data and isinstance(loaded['all_addresses'][0], ShippingAddress)
+    assert type(loaded['all_addresses'][1]) is dict
+
+    client = app.test_client()
+    page = '<table>' + order_row('111-4444444-1111111', 'Record Buyer', '2 Elm St', 'Boise, ID 83702') + '</table>'
+    dataset_id = client.post('/extract', data={'html_content': page}).get_json()['dataset_id']
+    with client.session_transaction() as session:
+        stored = session['all_addresses']
+        assert isinstance(stored[0], ShippingAddress) and stored[0]['current_address'] == 'true'
+
+    response = client.post('/generate-csv', data={'merge_orders': 'on', 'dataset_id': dataset_id, 'Weight': '1'})
+    assert 'Record Buyer' in response.get_data(as_text=True)
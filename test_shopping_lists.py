@@ -0,0 +1,173 @@
+"""
+Tests for utils.shopping_lists and the paged shopping list editor.
+"""
+import csv
+import io
+import time
+
+import pytest
+
+from app import app
+from utils.shopping_lists import ShoppingListConflict, ShoppingListStore, validate_list_rows
+
+
+def sorted_data(n):
+    return [(f"B{i:09d}", {'title': f"Item {i}", 'qty': n - i}) for i in range(n)]
+
+
+def block(title, asin, qty):
+    return f"Sales channel: Amazon.com\n{title}\nASIN: {asin}\nQuantity: {qty}\n"
+
+
+def test_windows_skip_removed_rows(tmp_path):
+    store = ShoppingListStore(str(tmp_path / 'lists.db'))
+    list_id = store.create(sorted_data(5))
+
+    window = store.window(list_id, 1, 2)
+    assert window == {'version': 1, 'total': 5, 'offset': 1, 'rows': [
+        {'index': 1, 'asin': 'B000000001', 'title': 'Item 1', 'qty': 4},
+        {'index': 2, 'asin': 'B000000002', 'title': 'Item 2', 'qty': 3},
+    ]}
+
+    assert store.apply_changes(list_id, 1, [(1, {'title': 'Renamed', 'qty': 9}), (2, {'removed': True})]) == 2
+
+    # Removed rows drop out and later rows keep their index
+    window = store.window(list_id, 1, 2)
+    assert window['version'] == 2 and window['total'] == 4
+    assert [(row['index'], row['title'], row['qty']) for row in window['rows']] == [(1, 'Renamed', 9), (3, 'Item 3', 2)]
+    assert list(store.rows(list_id)) == [('B000000000', 'Item 0', 5), ('B000000001', 'Renamed', 9),
+                                         ('B000000003', 'Item 3', 2), ('B000000004', 'Item 4', 1)]
+    assert store.window('missing') is None
+
+
+def test_changes_apply_together_against_a_version(tmp_path):
+    store = ShoppingListStore(str(tmp_path / 'lists.db'))
+    list_id = store.create(sorted_data(3))
+
+    assert store.apply_changes(list_id, 1, [(0, {'qty': 7}), (2, {'title': 'Renamed', 'removed': True})]) == 2
+    assert list(store.rows(list_id)) == [('B000000000', 'Item 0', 7), ('B000000001', 'Item 1', 2)]
+
+    with pytest.raises(ShoppingListConflict) as conflict:
+        store.apply_changes(list_id, 1, [(1, {'qty': 1})])
+    assert conflict.value.version == 2
+
+    # A missing row stores none of the changes
+    with pytest.raises(ValueError):
+        store.apply_changes(list_id, 2, [(1, {'qty': 1}), (99, {'qty': 1})])
+    assert store.window(list_id)['version'] == 2 and list(store.rows(list_id))[1][2] == 2
+
+    assert store.apply_changes(list_id, 2, []) == 2
+    assert store.apply_changes('missing', 1, [(0, {'qty': 1})]) is None
+
+
+def test_list_rows_are_validated_in_one_pass():
+    rows, errors = validate_list_rows([['B000000001', 'Mug', 2], ['', 'No ASIN', 1], ['B000000002', 'Lamp', 0],
+                                       ['B000000003', 'Pen'], ['B000000004', 'Cup', True]])
+    assert rows == [('B000000001', 'Mug', 2)]
+    assert errors == ["row 1: asin must be a non-empty string", "row 2: qty must be a whole number of at least 1",
+                      "row 3: expected [asin, title, qty]", "row 4: qty must be a whole number of at least 1"]
+    assert validate_list_rows([])[1] and validate_list_rows({'rows': 1})[1]
+
+
+def test_untouched_lists_expire(tmp_path):
+    store = ShoppingListStore(str(tmp_path / 'lists.db'), ttl=60)
+    old = store.create(sorted_data(2))
+    store._connection().execute("UPDATE shopping_lists SET updated_at = ?", (time.time() - 120,))
+    new = store.create(sorted_data(2))
+    assert store.window(old) is None and store.window(new)['total'] == 2
+
+
+def test_page_renders_one_window_and_saves_only_the_changed_rows():
+    client = app.test_client()
+    text = ''.join(block(f"Item {i}", f"B{i:09d}", 1000 - i) for i in range(250))
+    page = client.post('/extract-asins-advanced', data={'order_text': text}).get_data(as_text=True)
+
+    # Only the first page goes out with the HTML
+    assert 'B000000099' in page and 'B000000100' not in page
+    assert '<strong>250</strong> unique products' in page
+    with client.session_transaction() as session:
+        list_id = session['shopping_list_id']
+
+    window = client.get(f'/shopping-list/{list_id}/rows?offset=200&limit=100').get_json()
+    assert window['total'] == 250 and len(window['rows']) == 50 and window['rows'][0]['asin'] == 'B000000200'
+
+    # Edits made on different pages go out together, as the page sends them
+    response = client.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': window['version'],
+        'changes': [[200, {'title': 'Renamed', 'qty': 3}], [0, {'removed': True}]]})
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 249 and rows[0]['ASIN'] == 'B000000001'
+    assert rows[199] == {'ASIN': 'B000000200', 'Title': 'Renamed', 'Quantity': '3'}
+    assert client.get(f'/shopping-list/{list_id}/rows').get_json()['version'] == 2
+
+    # Rows are only edited through the versioned save
+    assert client.patch(f'/shopping-list/{list_id}/rows/0', json={'qty': 1}).status_code == 404
+    assert client.get(f'/shopping-list/{list_id}/rows?limit=100000').status_code == 400
+
+
+def test_lists_belong_to_their_session():
+    owner = app.test_client()
+    owner.post('/extract-asins-advanced', data={'order_text': block('Mug', 'B000000001', 2)})
+    with owner.session_transaction() as session:
+        list_id = session['shopping_list_id']
+
+    other = app.test_client()
+    assert other.get(f'/shopping-list/{list_id}/rows').status_code == 404
+    assert other.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': 1, 'changes': [[0, {'qty': 5}]]}).status_code == 404
+    assert owner.get(f'/shopping-list/{list_id}/rows').get_json()['rows'][0]['qty'] == 2
+
+
+def test_basic_counter_pages_its_results():
+    client = app.test_client()
+    text = ' '.join(f"B{i:09d}" for i in range(150))
+    page = client.post('/extract-asins', data={'order_text': text}).get_data(as_text=True)
+    assert 'B000000099' in page and 'B000000100' not in page and 'id="showMoreAsins"' in page
+
+    rows = client.get('/asin-data/rows?offset=100').get_json()
+    assert rows['total'] == 150 and len(rows['rows']) == 50 and rows['rows'][0]['count'] == 1
+
+
+def test_save_shopping_list_takes_a_json_list():
+    client = app.test_client()
+    response = client.post('/save-shopping-list', json={'rows': [['B000000001', 'Mug, "large"', 2], ['B000000002', '', 1]]})
+    assert response.mimetype == 'text/csv'
+    assert list(csv.reader(io.StringIO(response.get_data(as_text=True)))) == [
+        ['ASIN', 'Title', 'Quantity'], ['B000000001', 'Mug, "large"', '2'], ['B000000002', '', '1']]
+
+    response = client.post('/save-shopping-list', json={'rows': [['B000000001', 'Mug', 'two'], ['B000000002']]})
+    assert response.status_code == 400 and len(response.get_json()['details']) == 2
+
+    # The numbered form fields of older pages still work
+    response = client.post('/save-shopping-list', data={
+        'item_count': 2, 'asin_0': 'B000000001', 'title_0': 'Mug', 'qty_0': '3', 'asin_1': 'B000000002'})
+    assert response.get_data(as_text=True).splitlines() == ['ASIN,Title,Quantity', 'B000000001,Mug,3']
+
+
+def test_save_shopping_list_patches_the_stored_list():
+    client = app.test_client()
+    text = ''.join(block(f"Item {i}", f"B{i:09d}", 10 - i) for i in range(5))
+    client.post('/extract-asins-advanced', data={'order_text': text})
+    with client.session_transaction() as session:
+        list_id = session['shopping_list_id']
+
+    response = client.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': 1, 'changes': [[1, {'qty': 20}], [3, {'removed': True}]]})
+    assert response.headers['X-Shopping-List-Version'] == '2'
+    assert response.get_data(as_text=True).splitlines() == [
+        'ASIN,Title,Quantity', 'B000000000,Item 0,10', 'B000000001,Item 1,20', 'B000000002,Item 2,8',
+        'B000000004,Item 4,6']
+
+    # Changes made against the old version are refused, with the version to reload
+    stale = client.post('/save-shopping-list', json={'list_id': list_id, 'version': 1, 'changes': [[0, {'qty': 1}]]})
+    assert stale.status_code == 409 and stale.get_json()['version'] == 2
+
+    invalid = client.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': 2, 'changes': [[0, {'qty': 0}], ['x', {}], [1, {'price': 2}]]})
+    assert invalid.status_code == 400 and len(invalid.get_json()['details']) == 3
+    assert client.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': 2, 'changes': [[99, {'qty': 1}]]}).status_code == 400
+
+    other = app.test_client()
+    assert other.post('/save-shopping-list', json={
+        'list_id': list_id, 'version': 2, 'changes': []}).status_code == 404
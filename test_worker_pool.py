@@ -0,0 +1,86 @@
+"""
+Tests for utils.worker_pool and how /extract answers when the parser pool is full or slow.
+"""
+import time
+
+import pytest
+
+import app as app_module
+from app import app
+from test_parser_parity import order_row
+from utils.worker_pool import JobTimeout, ParserPool, PoolBusy
+
+PAGE = '<table>' + order_row('111-8888888-1111111', 'Pool Buyer', '4 Ash St', 'Boise, ID 83702') + '</table>'
+
+
+def slow_report(html_content, **kwargs):
+    # Stands in for extract_shipping_report; module-level so workers can unpickle it
+    time.sleep(2)
+    return {'result': None, 'skipped': []}
+
+
+@pytest.fixture
+def tiny_pool():
+    pool = ParserPool(max_workers=1, max_queue=0, timeout=0.3)
+    yield pool
+    pool.shutdown()
+
+
+def test_full_pool_rejects_jobs(tiny_pool):
+    running = tiny_pool.submit(time.sleep, 0.5)
+    with pytest.raises(PoolBusy):
+        tiny_pool.submit(time.sleep, 0)
+    assert tiny_pool.stats()['rejected'] == 1
+
+    running.result()
+    assert tiny_pool.run(sum, [1, 2]) == 3
+    assert tiny_pool.stats()['completed'] == 2
+
+
+def test_stuck_job_times_out_and_the_pool_is_recycled():
+    pool = ParserPool(max_workers=1, max_queue=1, timeout=0.3)
+    try:
+        with pytest.raises(JobTimeout):
+            pool.run(time.sleep, 3)
+        assert pool.stats()['timed_out'] == 1
+        # Half the workers are stuck, so the next job gets a fresh pool instead of waiting behind the sleeper
+        assert pool._executor is None
+        started = time.monotonic()
+        assert pool.run(sum, [1, 2], timeout=5) == 3
+        assert time.monotonic() - started < 2
+    finally:
+        pool.shutdown()
+
+
+def test_map_keeps_order_within_the_admission_limit():
+    pool = ParserPool(max_workers=2, max_queue=0, timeout=10)
+    try:
+        assert pool.map(abs, list(range(-10, 0))) == list(range(10, 0, -1))
+        assert pool.stats()['completed'] == 10 and pool.stats()['rejected'] == 0
+
+        with pytest.raises(JobTimeout):
+            pool.map(time.sleep, [0, 3, 3, 3], timeout=0.5)
+        # The jobs that never started were dropped instead of left in the queue
+        assert pool.stats()['timed_out'] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_extract_answers_503_when_the_pool_is_full(tiny_pool, monkeypatch):
+    monkeypatch.setattr(app_module, 'parser_pool', tiny_pool)
+    monkeypatch.setattr(app_module, 'PARSE_INLINE_MAX_BYTES', 0)
+    busy = tiny_pool.submit(time.sleep, 1)
+
+    response = app.test_client().post('/extract', data={'html_content': PAGE})
+    assert response.status_code == 503 and response.headers['Retry-After'] == '5'
+    busy.result()
+
+
+def test_extract_answers_504_when_the_parse_is_too_slow(tiny_pool, monkeypatch):
+    monkeypatch.setattr(app_module, 'parser_pool', tiny_pool)
+    monkeypatch.setattr(app_module, 'PARSE_INLINE_MAX_BYTES', 0)
+    monkeypatch.setattr(app_module, 'extract_shipping_report', slow_report)
+
+    response = app.test_client().post('/extract', data={'html_content': PAGE})
+    assert response.status_code == 504
+    assert 'did not finish within 0.3 seconds' in response.get_json()['error']
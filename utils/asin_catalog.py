@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+
+from utils.db import connect
+from utils.result_cache import ResultCache
+
+# ASINs per lookup query, well under SQLite's limit on bound parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+class AsinCatalog:
+    """
+    Every ASIN the advanced counter has seen, with its latest title, on disk.
+
+    Filled from advanced extractions and read by the basic counter and the
+    CSV downloads, which only have ASINs. Lookups take a whole list of ASINs:
+    recently used entries come from an in-process LRU cache and the rest from
+    a few chunked primary-key queries, never one query per row. A title
+    learned by another worker shows up here once the cached entry expires.
+    """
+
+    def __init__(self, path, cache_entries=10000, cache_ttl=300):
+        """
+        Args:
+            path (str): SQLite database file
+            cache_entries (int): ASINs kept in the in-process LRU cache
+            cache_ttl (float): Seconds a cached entry is trusted before it is read again
+        """
+        self.path = path
+        self._cache = ResultCache(max_entries=cache_entries, max_bytes=cache_entries * 1024, ttl=cache_ttl)
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS asin_catalog ("
+            " asin TEXT PRIMARY KEY, title TEXT NOT NULL, first_seen_at REAL NOT NULL, last_seen_at REAL NOT NULL,"
+            " times_seen INTEGER NOT NULL DEFAULT 1"
+            ") WITHOUT ROWID"
+        )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share one
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def record(self, titles):
+        """
+        Store the titles from an extraction; a newer title replaces the old one.
+
+        Args:
+            titles (dict): ASIN -> title; empty titles are ignored
+        """
+        now = time.time()
+        rows = [(asin, title, now, now) for asin, title in titles.items() if asin and title]
+        if not rows:
+            return
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO asin_catalog (asin, title, first_seen_at, last_seen_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (asin) DO UPDATE SET title = excluded.title, last_seen_at = excluded.last_seen_at,"
+                " times_seen = times_seen + 1",
+                rows
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        for asin, title, _, _ in rows:
+            self._cache.put(asin, {'title': title, 'last_seen_at': now})
+
+    def lookup(self, asins):
+        """
+        Look up many ASINs at once.
+
+        Args:
+            asins (iterable): ASINs; repeats and empty ones are ignored
+
+        Returns:
+            dict: ASIN -> {'title', 'last_seen_at'} for the ones in the catalog
+        """
+        found = {}
+        missing = []
+        for asin in dict.fromkeys(asins):
+            if not asin:
+                continue
+            entry = self._cache.get(asin)
+            if entry is None:
+                missing.append(asin)
+            else:
+                found[asin] = entry
+
+        connection = self._connection()
+        for start in range(0, len(missing), LOOKUP_CHUNK_SIZE):
+            chunk = missing[start:start + LOOKUP_CHUNK_SIZE]
+            rows = connection.execute(
+                f"SELECT asin, title, last_seen_at FROM asin_catalog WHERE asin IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for asin, title, last_seen_at in rows:
+                found[asin] = {'title': title, 'last_seen_at': last_seen_at}
+                self._cache.put(asin, found[asin])
+        return found
+
+    def titles(self, asins):
+        """
+        Returns:
+            dict: ASIN -> title for the given ASINs that are in the catalog
+        """
+        return {asin: entry['title'] for asin, entry in self.lookup(asins).items()}
+
+    def stats(self):
+        row = self._connection().execute("SELECT COUNT(*) FROM asin_catalog").fetchone()
+        return {'asins': row[0], 'cache': self._cache.stats()}
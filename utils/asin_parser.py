@@ -0,0 +1,283 @@
+import re
+import codecs
+from collections import Counter
+
+from bs4 import BeautifulSoup
+
+# Every product block on the order list starts with this label
+SALES_CHANNEL_ANCHOR = 'Sales channel:'
+
+# What must follow the anchor for the block to count, matched right after it
+AMAZON_CHANNEL_PATTERN = re.compile(r'[ \t]*Amazon\.com(?:\s*Business customer)?\s+')
+# An "ASIN:" label on its own, as opposed to the same text inside a product title
+ASIN_PATTERN = re.compile(r'\sASIN:\s+(\w+)\s')
+QUANTITY_PATTERN = re.compile(r'Quantity:\s+(\d+)')
+ORDER_ID_PATTERN = re.compile(r'\d{3}-\d{7}-\d{7}')
+
+# Characters of a block that are searched for its labels; real blocks are a few
+# hundred characters, so anything longer is a block whose labels are missing
+MAX_BLOCK_SCAN = 20000
+
+# Characters before an anchor searched for the order ID the block belongs to
+ORDER_ID_LOOKBACK = 2000
+
+# Characters of a malformed block shown back to the user
+EXCERPT_LENGTH = 80
+
+# Candidate ASINs for the simple counter: ten uppercase letters or digits standing alone
+ASIN_TOKEN_PATTERN = re.compile(r'\b[A-Z0-9]{10}\b')
+
+# Everything up to and including the last non-word character; one greedy match, no rescans
+_UP_TO_LAST_BREAK = re.compile(r'.*\W', re.DOTALL)
+
+# Saved web pages, as opposed to copied text
+HTML_DOCUMENT_PATTERN = re.compile(r'\s*(?:<!DOCTYPE|<html|<body|<div|<table)', re.IGNORECASE)
+
+# Bytes read from an uploaded file at a time
+TEXT_CHUNK_SIZE = 1024 * 1024
+
+
+def _excerpt(text, start, end):
+    return ' '.join(text[start:min(end, start + EXCERPT_LENGTH * 2)].split())[:EXCERPT_LENGTH]
+
+
+def parse_asin_blocks(order_text):
+    """
+    Split order list text on "Sales channel:" and parse each product block on its own.
+
+    Replaces one DOTALL regex over the whole paste, which could backtrack
+    across everything after a block without a Quantity line. Here every block
+    is searched only up to the next anchor (and at most MAX_BLOCK_SCAN
+    characters), so the work is linear in the length of the text, and a
+    block that is missing its labels is reported instead of being merged into
+    the block after it.
+
+    Blocks from another sales channel are skipped without being reported.
+
+    Args:
+        order_text (str): Text copied from the order list page
+
+    Returns:
+        dict: {'items': [{'order_id', 'title', 'asin', 'qty'}, ...] in page order,
+               'malformed': [{'line', 'reason', 'excerpt'}, ...]}
+    """
+    items = []
+    malformed = []
+
+    line = 1
+    counted_to = 0
+    # End of the last parsed block; the order ID for a block is looked for after it
+    consumed = 0
+
+    anchor = order_text.find(SALES_CHANNEL_ANCHOR)
+    while anchor != -1:
+        start = anchor + len(SALES_CHANNEL_ANCHOR)
+        next_anchor = order_text.find(SALES_CHANNEL_ANCHOR, start)
+        block_end = len(order_text) if next_anchor == -1 else next_anchor
+        scan_end = min(block_end, start + MAX_BLOCK_SCAN)
+
+        line += order_text.count('\n', counted_to, anchor)
+        counted_to = anchor
+
+        channel = AMAZON_CHANNEL_PATTERN.match(order_text, start, scan_end)
+        if channel is None:
+            # Another sales channel, not a broken block
+            anchor = next_anchor
+            continue
+
+        # The title runs from the channel line to the ASIN label. A title can
+        # itself contain "ASIN:", so the label is the last one before the
+        # Quantity line that follows the first. The search starts one character
+        # back, on the whitespace the channel line ends with, so a label right
+        # after the channel line is found and reported as having no title
+        title_start = channel.end()
+        asin = ASIN_PATTERN.search(order_text, title_start - 1, scan_end)
+        quantity = QUANTITY_PATTERN.search(order_text, asin.end(), scan_end) if asin else None
+        if quantity is not None:
+            for later in ASIN_PATTERN.finditer(order_text, asin.end() - 1, quantity.start()):
+                asin = later
+        title = order_text[title_start:asin.start()].strip() if asin else ''
+        if asin is None:
+            reason = "No ASIN found"
+        elif not title:
+            reason = "No product title before the ASIN"
+            quantity = None
+        else:
+            reason = "No Quantity found"
+
+        if quantity is None:
+            malformed.append({'line': line, 'reason': reason, 'excerpt': _excerpt(order_text, anchor, block_end)})
+        else:
+            # The order ID is the last one between the previous product and this block
+            order_ids = ORDER_ID_PATTERN.findall(order_text, max(consumed, anchor - ORDER_ID_LOOKBACK), anchor)
+            items.append({
+                'order_id': order_ids[-1] if order_ids else '',
+                'title': title,
+                'asin': asin.group(1),
+                'qty': int(quantity.group(1))
+            })
+            consumed = quantity.end()
+
+        anchor = next_anchor
+
+    return {'items': items, 'malformed': malformed}
+
+
+def add_asin_items(items, tally=None):
+    """
+    Add up quantities per ASIN, in the order ASINs first appear.
+
+    Args:
+        items (iterable): Items from parse_asin_blocks()
+        tally (dict): Running tally to add to; a new one if not given
+
+    Returns:
+        dict: ASIN -> {'title', 'qty'}; an ASIN keeps the last title seen for it
+    """
+    tally = {} if tally is None else tally
+    for item in items:
+        info = tally.get(item['asin'])
+        if info is None:
+            info = tally[item['asin']] = {"title": "", "qty": 0}
+        info['title'] = item['title']
+        info['qty'] += item['qty']
+    return tally
+
+
+def merge_asin_tallies(tallies):
+    """
+    Combine tallies as if their texts had been pasted one after the other.
+
+    Args:
+        tallies (iterable): Tallies from add_asin_items(), in paste order
+
+    Returns:
+        dict: The combined tally; quantities add up and later titles win
+    """
+    merged = {}
+    for tally in tallies:
+        for asin, info in tally.items():
+            total = merged.get(asin)
+            if total is None:
+                merged[asin] = dict(info)
+            else:
+                total['title'] = info['title']
+                total['qty'] += info['qty']
+    return merged
+
+
+def sort_asin_tally(tally):
+    """
+    Returns:
+        list: (asin, {'title', 'qty'}) pairs, highest quantity first; ties keep
+              the order the ASINs first appeared in
+    """
+    return sorted(tally.items(), key=lambda x: x[1]["qty"], reverse=True)
+
+
+def tally_asin_items(items):
+    """
+    Add up quantities per ASIN.
+
+    Args:
+        items (iterable): Items from parse_asin_blocks()
+
+    Returns:
+        list: (asin, {'title', 'qty'}) pairs, highest quantity first; an ASIN
+              keeps the last title seen for it
+    """
+    return sort_asin_tally(add_asin_items(items))
+
+
+def tally_asin_document(content):
+    """
+    Parse one uploaded order export and tally its products; runs in a worker process.
+
+    Args:
+        content (bytes or str): Text copied from the order list, or the saved HTML page
+
+    Returns:
+        dict: {'tally': add_asin_items() result, 'items': products found,
+               'malformed': parse_asin_blocks() malformed blocks}
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+    if HTML_DOCUMENT_PATTERN.match(content):
+        # One block label per line, as in text copied from the page
+        content = BeautifulSoup(content, 'html.parser').get_text('\n')
+
+    parsed = parse_asin_blocks(content)
+    return {'tally': add_asin_items(parsed['items']), 'items': len(parsed['items']), 'malformed': parsed['malformed']}
+
+
+def is_valid_asin(token):
+    """
+    Tell a real ASIN from other ten-character codes on the page.
+
+    Product ASINs start with "B0"; books use their ISBN-10, which must pass
+    its checksum. Order ID fragments, tracking numbers and SKUs fail both.
+
+    Args:
+        token (str): Ten uppercase letters or digits
+
+    Returns:
+        bool: Whether token is an ASIN
+    """
+    if token.startswith('B0'):
+        return True
+    if not token[:9].isdigit() or not (token[9].isdigit() or token[9] == 'X'):
+        return False
+    check = 10 if token[9] == 'X' else int(token[9])
+    return (sum((10 - i) * int(digit) for i, digit in enumerate(token[:9])) + check) % 11 == 0
+
+
+def count_asin_tokens(chunks, tally=None):
+    """
+    Count valid ASINs in text that arrives in pieces, in one pass.
+
+    Matches are validated and counted as they are found, without building a
+    list of them. Only the word still open at the end of a chunk (at most 11
+    characters; a longer word cannot be an ASIN) is carried into the next, so
+    memory does not grow with the text.
+
+    Args:
+        chunks (iterable): Pieces of text, split anywhere
+        tally (Counter): Counts to add to; a new Counter if not given. Anything
+                         with Counter's update(), like a SpaceSaving, works too
+
+    Returns:
+        Counter: ASIN -> occurrences (or the tally that was passed in)
+    """
+    tally = Counter() if tally is None else tally
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        last_break = _UP_TO_LAST_BREAK.match(text)
+        cut = last_break.end() if last_break else 0
+        # The text before cut ends in a non-word character, so no match there can run into the carry
+        tally.update(filter(is_valid_asin, (match.group() for match in ASIN_TOKEN_PATTERN.finditer(text, 0, cut))))
+        carry = text[cut:] if len(text) - cut <= 10 else text[-11:]
+
+    if carry:
+        tally.update(filter(is_valid_asin, (match.group() for match in ASIN_TOKEN_PATTERN.finditer(carry))))
+    return tally
+
+
+def read_text_chunks(stream, chunk_size=TEXT_CHUNK_SIZE):
+    """
+    Decode a binary stream (e.g. an uploaded file) as UTF-8, a chunk at a time.
+
+    Args:
+        stream: File-like object with read()
+        chunk_size (int): Bytes per read
+
+    Yields:
+        str: Decoded text; characters split across reads are joined up
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    yield decoder.decode(b'', final=True)
@@ -0,0 +1,237 @@
+import os
+import time
+import threading
+
+from utils.db import connect
+
+
+# Block keys per lookup query, well under SQLite's limit on bound parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+class AsinTallyStore:
+    """
+    Running ASIN tallies that grow paste by paste, kept in SQLite.
+
+    Every product block from a paste is stored as one row tagged with the
+    paste it came from, so adding a paste only writes its own blocks, undoing
+    one deletes them, and a block counted by an earlier paste (same order ID
+    and ASIN) is skipped instead of being counted twice. Per-ASIN running
+    totals are updated from the new blocks only, so showing the tally never
+    re-aggregates every block. Tallies untouched for ttl seconds are deleted.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        """
+        Args:
+            path (str): SQLite database file
+            ttl (float): Seconds a tally is kept after it was last changed
+        """
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        connection = self._connection()
+        # version goes up with every paste and undo, so callers can tell when a tally changed
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS asin_tallies ("
+            " id TEXT PRIMARY KEY, updated_at REAL NOT NULL, version INTEGER NOT NULL)"
+        )
+        # block_key is NULL for blocks without an order ID; those are never treated as repeats
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS asin_tally_blocks ("
+            " id INTEGER PRIMARY KEY, tally_id TEXT NOT NULL, paste INTEGER NOT NULL, block_key TEXT,"
+            " asin TEXT NOT NULL, title TEXT NOT NULL, qty INTEGER NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS asin_tally_blocks_paste ON asin_tally_blocks (tally_id, paste)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS asin_tally_blocks_key ON asin_tally_blocks (tally_id, block_key)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS asin_tally_blocks_asin ON asin_tally_blocks (tally_id, asin, id)"
+        )
+        # One row per ASIN: its total, the last title seen and the first and last block that counted it
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS asin_tally_totals ("
+            " tally_id TEXT NOT NULL, asin TEXT NOT NULL, qty INTEGER NOT NULL, title TEXT NOT NULL,"
+            " first_id INTEGER NOT NULL, last_id INTEGER NOT NULL, PRIMARY KEY (tally_id, asin)"
+            ") WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS asin_tally_totals_order"
+            " ON asin_tally_totals (tally_id, qty DESC, first_id, title)"
+        )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share one
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def add_paste(self, tally_id, items):
+        """
+        Add one paste's products to a tally, skipping blocks an earlier paste already counted.
+
+        A block repeated within the paste itself counts every time, as it would
+        in a single extraction.
+
+        Args:
+            tally_id (str): The tally; created if it doesn't exist
+            items (list): Items from parse_asin_blocks(), in page order
+
+        Returns:
+            dict: {'paste': number of this paste, 'added': blocks counted,
+                   'duplicates': blocks skipped as already counted}
+        """
+        self.prune()
+        keys = [f"{item['order_id']}:{item['asin']}" if item['order_id'] else None for item in items]
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._touch(connection, tally_id)
+            paste = connection.execute(
+                "SELECT COALESCE(MAX(paste), 0) + 1 FROM asin_tally_blocks WHERE tally_id = ?", (tally_id,)
+            ).fetchone()[0]
+            seen = self._known_keys(connection, tally_id, {key for key in keys if key})
+
+            # Number the new blocks ourselves; the write lock keeps the range free
+            next_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM asin_tally_blocks").fetchone()[0]
+            blocks = []
+            totals = {}
+            for item, key in zip(items, keys):
+                if key in seen:
+                    continue
+                block_id = next_id + len(blocks)
+                blocks.append((block_id, tally_id, paste, key, item['asin'], item['title'], item['qty']))
+                total = totals.get(item['asin'])
+                if total is None:
+                    totals[item['asin']] = [item['qty'], item['title'], block_id, block_id]
+                else:
+                    total[0] += item['qty']
+                    total[1] = item['title']
+                    total[3] = block_id
+
+            connection.executemany(
+                "INSERT INTO asin_tally_blocks (id, tally_id, paste, block_key, asin, title, qty)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", blocks
+            )
+            connection.executemany(
+                "INSERT INTO asin_tally_totals (tally_id, asin, qty, title, first_id, last_id)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (tally_id, asin) DO UPDATE SET qty = qty + excluded.qty,"
+                " title = excluded.title, last_id = excluded.last_id",
+                [(tally_id, asin, *total) for asin, total in totals.items()]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        return {'paste': paste, 'added': len(blocks), 'duplicates': len(items) - len(blocks)}
+
+    def _known_keys(self, connection, tally_id, keys):
+        # The block keys an earlier paste already counted
+        keys = list(keys)
+        known = set()
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+            known.update(key for key, in connection.execute(
+                f"SELECT block_key FROM asin_tally_blocks WHERE tally_id = ?"
+                f" AND block_key IN ({','.join('?' * len(chunk))})", [tally_id, *chunk]
+            ))
+        return known
+
+    def undo(self, tally_id):
+        """
+        Take the last paste back out of a tally.
+
+        Only the totals of the ASINs in that paste are worked out again.
+
+        Returns:
+            int: Blocks removed; 0 if the tally has no pastes
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._touch(connection, tally_id)
+            paste = connection.execute(
+                "SELECT MAX(paste) FROM asin_tally_blocks WHERE tally_id = ?", (tally_id,)
+            ).fetchone()[0]
+            asins = [asin for asin, in connection.execute(
+                "SELECT DISTINCT asin FROM asin_tally_blocks WHERE tally_id = ? AND paste = ?", (tally_id, paste)
+            )]
+            removed = connection.execute(
+                "DELETE FROM asin_tally_blocks WHERE tally_id = ? AND paste = ?", (tally_id, paste)
+            ).rowcount
+            connection.executemany(
+                "DELETE FROM asin_tally_totals WHERE tally_id = ? AND asin = ?", [(tally_id, asin) for asin in asins]
+            )
+            connection.executemany(
+                "INSERT INTO asin_tally_totals (tally_id, asin, qty, title, first_id, last_id)"
+                " SELECT totals.tally_id, totals.asin, totals.qty, last.title, totals.first_id, totals.last_id FROM ("
+                "  SELECT tally_id, asin, SUM(qty) AS qty, MIN(id) AS first_id, MAX(id) AS last_id"
+                "  FROM asin_tally_blocks WHERE tally_id = ? AND asin = ? GROUP BY tally_id, asin"
+                " ) AS totals JOIN asin_tally_blocks AS last ON last.id = totals.last_id",
+                [(tally_id, asin) for asin in asins]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def clear(self, tally_id):
+        """Delete a tally and everything in it."""
+        connection = self._connection()
+        connection.execute("DELETE FROM asin_tally_blocks WHERE tally_id = ?", (tally_id,))
+        connection.execute("DELETE FROM asin_tally_totals WHERE tally_id = ?", (tally_id,))
+        connection.execute("DELETE FROM asin_tallies WHERE id = ?", (tally_id,))
+
+    def summary(self, tally_id):
+        """
+        Returns:
+            dict: {'pastes': pastes still in the tally, 'blocks': product blocks counted,
+                   'version': changes made to the tally so far}
+        """
+        connection = self._connection()
+        pastes, blocks = connection.execute(
+            "SELECT COUNT(DISTINCT paste), COUNT(*) FROM asin_tally_blocks WHERE tally_id = ?", (tally_id,)
+        ).fetchone()
+        version = connection.execute("SELECT version FROM asin_tallies WHERE id = ?", (tally_id,)).fetchone()
+        return {'pastes': pastes, 'blocks': blocks, 'version': version[0] if version else 0}
+
+    def sorted_tally(self, tally_id):
+        """
+        The tally as the advanced counter shows it, read from the running totals.
+
+        Returns:
+            list: (asin, {'title', 'qty'}) pairs, highest quantity first, ties in
+                  first-seen order; an ASIN keeps the last title seen for it.
+                  The same as tally_asin_items() over every block in paste order
+        """
+        rows = self._connection().execute(
+            "SELECT asin, title, qty FROM asin_tally_totals WHERE tally_id = ? ORDER BY qty DESC, first_id",
+            (tally_id,)
+        )
+        return [(asin, {'title': title, 'qty': qty}) for asin, title, qty in rows]
+
+    def prune(self):
+        """Delete tallies that haven't changed for ttl seconds."""
+        connection = self._connection()
+        cutoff = time.time() - self.ttl
+        for table in ('asin_tally_blocks', 'asin_tally_totals'):
+            connection.execute(
+                f"DELETE FROM {table} WHERE tally_id IN (SELECT id FROM asin_tallies WHERE updated_at <= ?)",
+                (cutoff,)
+            )
+        connection.execute("DELETE FROM asin_tallies WHERE updated_at <= ?", (cutoff,))
+
+    def _touch(self, connection, tally_id):
+        connection.execute(
+            "INSERT INTO asin_tallies (id, updated_at, version) VALUES (?, ?, 1)"
+            " ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at, version = version + 1",
+            (tally_id, time.time())
+        )
@@ -0,0 +1,180 @@
+import io
+import logging
+import zipfile
+from functools import partial
+
+from utils.asin_parser import merge_asin_tallies, sort_asin_tally, tally_asin_document
+from utils.html_parser import extract_shipping_info
+from utils.shipping_address import AddressBatch
+
+# File types picked up from uploads and zip archives
+HTML_EXTENSIONS = ('.html', '.htm')
+# Order exports the ASIN counter reads: copied page text or saved pages
+ORDER_TEXT_EXTENSIONS = ('.txt', '.csv', '.tsv') + HTML_EXTENSIONS
+
+# Limits on what a single batch request may unpack
+MAX_BATCH_DOCUMENTS = 500
+MAX_BATCH_BYTES = 512 * 1024 * 1024
+
+
+class BatchError(ValueError):
+    """Raised when an uploaded batch cannot be accepted."""
+
+
+def read_uploaded_documents(files, extensions=HTML_EXTENSIONS):
+    """
+    Collect documents from uploaded files, expanding zip archives.
+
+    Args:
+        files (list): werkzeug FileStorage objects from request.files
+        extensions (tuple): File types taken from inside zip archives
+
+    Returns:
+        list: (name, content bytes) tuples in upload order
+
+    Raises:
+        BatchError: If the batch has too many documents or is too large
+    """
+    documents = []
+    total_bytes = 0
+
+    def add(name, content):
+        nonlocal total_bytes
+        total_bytes += len(content)
+        if len(documents) >= MAX_BATCH_DOCUMENTS:
+            raise BatchError(f"Too many documents in one batch (limit is {MAX_BATCH_DOCUMENTS})")
+        if total_bytes > MAX_BATCH_BYTES:
+            raise BatchError(f"Batch is too large (limit is {MAX_BATCH_BYTES // (1024 * 1024)} MB)")
+        documents.append((name, content))
+
+    for file in files:
+        name = file.filename or 'upload'
+        content = file.read()
+
+        if name.lower().endswith('.zip') or zipfile.is_zipfile(io.BytesIO(content)):
+            try:
+                with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                    for member in archive.infolist():
+                        if member.is_dir() or not member.filename.lower().endswith(extensions):
+                            continue
+                        # Check the declared size before inflating anything
+                        if total_bytes + member.file_size > MAX_BATCH_BYTES:
+                            raise BatchError(f"Batch is too large (limit is {MAX_BATCH_BYTES // (1024 * 1024)} MB)")
+                        add(f"{name}/{member.filename}", archive.read(member))
+            except zipfile.BadZipFile:
+                raise BatchError(f"{name} is not a valid zip file")
+        elif content.strip():
+            add(name, content)
+
+    return documents
+
+
+def extract_many(documents, pool, timeout=None, **budgets):
+    """
+    Run extract_shipping_info over many documents in the shared parser pool.
+
+    Args:
+        documents (list): (name, content) tuples
+        pool (ParserPool): The pool; the batch counts against its admission limit
+        timeout (float): Seconds for the whole batch; defaults to the pool's timeout
+        **budgets: time_budget and strategy_budget for each document
+
+    Returns:
+        list: extract_shipping_info results, in the same order as documents
+
+    Raises:
+        PoolBusy: If the pool is full
+        JobTimeout: If the batch didn't finish in time
+    """
+    return pool.map(partial(extract_shipping_info, **budgets), [content for _, content in documents], timeout=timeout)
+
+
+def tally_asins_many(documents, pool, timeout=None):
+    """
+    Run tally_asin_document over many order exports in the shared parser pool.
+
+    Args:
+        documents (list): (name, content) tuples
+        pool (ParserPool): The pool; the batch counts against its admission limit
+        timeout (float): Seconds for the whole batch; defaults to the pool's timeout
+
+    Returns:
+        list: tally_asin_document results, in the same order as documents
+
+    Raises:
+        PoolBusy: If the pool is full
+        JobTimeout: If the batch didn't finish in time
+    """
+    return pool.map(tally_asin_document, [content for _, content in documents], timeout=timeout)
+
+
+def merge_asin_results(documents, results):
+    """
+    Reduce per-document tallies into one shopping list.
+
+    The result is the same as pasting the documents one after the other into
+    the advanced counter: quantities add up, an ASIN keeps the title from the
+    last document that has it, and ties keep first-seen order.
+
+    Args:
+        documents (list): (name, content) tuples
+        results (list): tally_asin_document results for each document
+
+    Returns:
+        tuple: (sorted (asin, {'title', 'qty'}) list, per-document summary list,
+                malformed blocks with the document name added)
+    """
+    summary = []
+    malformed = []
+    for (name, _), result in zip(documents, results):
+        summary.append({'name': name, 'products': result['items'], 'malformed': len(result['malformed'])})
+        malformed.extend({**block, 'file': name} for block in result['malformed'])
+        if not result['items']:
+            logging.warning(f"No products found in {name}")
+
+    return sort_asin_tally(merge_asin_tallies(result['tally'] for result in results)), summary, malformed
+
+
+def merge_addresses(documents, results):
+    """
+    Flatten per-document results into one address list, dropping repeated orders.
+
+    Addresses are kept in document order. An order ID seen in an earlier
+    document wins; addresses without an order ID are always kept.
+
+    Args:
+        documents (list): (name, content) tuples
+        results (list): extract_shipping_info results for each document
+
+    Returns:
+        tuple: (merged AddressBatch, per-document summary list, duplicate count)
+    """
+    merged = AddressBatch()
+    summary = []
+    seen_order_ids = set()
+    duplicates = 0
+
+    for (name, _), result in zip(documents, results):
+        if result is None:
+            addresses = []
+        elif isinstance(result, list):
+            addresses = result
+        else:
+            addresses = [result]
+
+        kept = 0
+        for address in addresses:
+            order_id = address.get('order_id', '')
+            if order_id:
+                if order_id in seen_order_ids:
+                    duplicates += 1
+                    continue
+                seen_order_ids.add(order_id)
+            merged.append(address)
+            kept += 1
+
+        summary.append({'name': name, 'found': len(addresses), 'added': kept})
+        if not addresses:
+            logging.warning(f"No shipping information found in {name}")
+
+    return merged, summary, duplicates
@@ -0,0 +1,83 @@
+import io
+import csv
+
+# Columns of the shipping label CSV, in the order the label service expects them
+SHIPPING_CSV_COLUMNS = [
+    'No', 'FromName', 'PhoneFrom', 'Street1From', 'CompanyFrom', 'Street2From', 'CityFrom', 'StateFrom',
+    'PostalCodeFrom', 'ToName', 'PhoneTo', 'Street1To', 'CompanyTo', 'Street2To', 'CityTo', 'ZipTo', 'StateTo',
+    'Weight', 'length', 'width', 'height', 'description', 'Ref01', 'Ref02', 'optional_file_name',
+    'optional_amazon_order_id'
+]
+
+# Buffered CSV text sent per chunk of a streamed download
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(columns, rows, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Write rows as CSV and yield the output in chunks while the rows are walked.
+
+    Quoting and line endings match what DataFrame.to_csv(index=False,
+    quoting=csv.QUOTE_MINIMAL) produced, so downloads are byte-for-byte the same.
+
+    Args:
+        columns (list): Header row; also the keys looked up in each row
+        rows (iterable): Dicts mapping column names to values; missing keys are written empty
+        chunk_size (int): Approximate number of characters per yielded chunk
+
+    Yields:
+        bytes: UTF-8 encoded CSV text
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+    writer.writerow(columns)
+
+    for row in rows:
+        writer.writerow([row.get(column, '') for column in columns])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def shipping_csv_rows(addresses, ship_from, dimensions):
+    """
+    Turn addresses into shipping CSV rows one at a time.
+
+    Args:
+        addresses (iterable): Address dicts as returned by the parser
+        ship_from (dict): The From* columns shared by every row
+        dimensions (callable): Called with each address, returns its
+            (weight, length, width, height, description)
+
+    Yields:
+        dict: One row keyed by SHIPPING_CSV_COLUMNS
+    """
+    for address in addresses:
+        weight, length, width, height, description = dimensions(address)
+        row = {
+            'No': address.get('order_id', ''),
+            'ToName': address.get('ToName', ''),
+            'PhoneTo': address.get('PhoneTo', ''),
+            'Street1To': address.get('Street1To', ''),
+            'CompanyTo': address.get('CompanyTo', ''),
+            'Street2To': address.get('Street2To', ''),
+            'CityTo': address.get('CityTo', ''),
+            'ZipTo': address.get('ZipTo', ''),
+            'StateTo': address.get('StateTo', ''),
+            'Weight': weight,
+            'length': length,
+            'width': width,
+            'height': height,
+            'description': description
+        }
+        row.update(ship_from)
+        yield row
+
+
+def csv_download_headers(filename):
+    """Response headers for a CSV attachment."""
+    return {'Content-Disposition': f'attachment; filename={filename}'}
@@ -0,0 +1,42 @@
+import os
+import sqlite3
+
+# Seconds a connection waits for another worker's write lock before giving up
+BUSY_TIMEOUT = 5.0
+
+
+def data_path(app, filename):
+    """
+    Path of a data file kept outside the code, creating its directory if needed.
+
+    Files go in DATA_DIR when it is set, otherwise in the Flask instance folder.
+
+    Args:
+        app (Flask): The application
+        filename (str): File name inside the data directory
+
+    Returns:
+        str: Absolute path of the file
+    """
+    directory = os.environ.get("DATA_DIR") or app.instance_path
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def connect(path):
+    """
+    Open a SQLite connection that several gunicorn workers can share the file through.
+
+    WAL mode lets readers carry on while one worker writes, and the busy timeout
+    makes a second writer wait for the lock instead of failing straight away.
+
+    Args:
+        path (str): Database file
+
+    Returns:
+        sqlite3.Connection: Connection in autocommit mode
+    """
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
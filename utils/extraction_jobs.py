@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+from utils.db import connect
+from utils.html_parser import extract_shipping_report
+from utils.shipping_address import to_jsonable
+
+# Job states; the last three are final
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# Seconds between progress writes, and between checks for a cancel request
+PROGRESS_INTERVAL = 0.25
+
+
+class ExtractionJobs:
+    """
+    Runs extractions as background jobs in the parser pool and keeps their progress and results in SQLite.
+
+    The job table is shared by all workers, so a poll or cancel can land on any
+    of them. A job runs in a parser pool process like any other large parse,
+    so it neither holds the GIL of the web process nor gets past the pool's
+    admission limit. There it writes its progress at most every
+    PROGRESS_INTERVAL seconds, and a watcher thread reads the cancel flag
+    every PROGRESS_INTERVAL seconds and stops the parser at its next deadline
+    check. Finished jobs are kept for ttl seconds.
+    """
+
+    def __init__(self, path, pool, ttl=3600, time_budget=300, strategy_budget=120):
+        """
+        Args:
+            path (str): SQLite database file
+            pool (ParserPool): Pool the jobs run in; a full pool refuses new jobs with PoolBusy
+            ttl (float): Seconds a job and its result are kept after it was submitted
+            time_budget (float): Seconds a job may run in total
+            strategy_budget (float): Seconds a job may spend in each parser strategy
+        """
+        self.path = path
+        self.pool = pool
+        self.ttl = ttl
+        self.time_budget = time_budget
+        self.strategy_budget = strategy_budget
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS extraction_jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, rows_scanned INTEGER DEFAULT 0,"
+            " rows_total INTEGER DEFAULT 0, addresses_found INTEGER DEFAULT 0, result TEXT, skipped TEXT,"
+            " error TEXT, cancel_requested INTEGER DEFAULT 0, expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share one
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def submit(self, html_content, page=None):
+        """
+        Start extracting in the background.
+
+        Args:
+            html_content (str): The pasted HTML
+            page (dict): Result of classify_page() if the caller already has it
+
+        Returns:
+            str: The job ID to poll
+
+        Raises:
+            PoolBusy: If the parser pool is full
+        """
+        self.prune()
+        job_id = uuid.uuid4().hex
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO extraction_jobs (id, status, expires_at) VALUES (?, ?, ?)",
+            (job_id, JOB_QUEUED, time.time() + self.ttl)
+        )
+        try:
+            future = self.pool.submit(run_extraction_job, self.path, job_id, html_content, page,
+                                      self.time_budget, self.strategy_budget)
+        except Exception:
+            connection.execute("DELETE FROM extraction_jobs WHERE id = ?", (job_id,))
+            raise
+
+        future.add_done_callback(lambda future: self._job_ended(job_id, future))
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict: The job's status, progress and (once done) result, or None if it
+                  is unknown or has expired
+        """
+        row = self._connection().execute(
+            "SELECT status, stage, rows_scanned, rows_total, addresses_found, result, skipped, error"
+            " FROM extraction_jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+
+        status, stage, rows_scanned, rows_total, addresses_found, result, skipped, error = row
+        return {
+            'status': status,
+            'stage': stage,
+            'rows_scanned': rows_scanned,
+            'rows_total': rows_total,
+            'addresses_found': addresses_found,
+            'result': json.loads(result) if result else None,
+            'skipped_strategies': json.loads(skipped) if skipped else [],
+            'error': error
+        }
+
+    def cancel(self, job_id):
+        """
+        Ask a job to stop; it ends at the parser's next check.
+
+        Returns:
+            bool: False if the job is unknown or already finished
+        """
+        return self._connection().execute(
+            "UPDATE extraction_jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+            (job_id, JOB_QUEUED, JOB_RUNNING)
+        ).rowcount > 0
+
+    def prune(self):
+        """Delete expired jobs and their results."""
+        self._connection().execute("DELETE FROM extraction_jobs WHERE expires_at <= ?", (time.time(),))
+
+    def _job_ended(self, job_id, future):
+        # The job writes its own outcome; this only catches a job that never got to,
+        # because it was dropped from the queue or its worker died
+        error = "Extraction was cancelled" if future.cancelled() else future.exception()
+        if error is None:
+            return
+        logging.error(f"Extraction job {job_id} did not finish: {error}")
+        self._connection().execute(
+            "UPDATE extraction_jobs SET status = ?, error = ? WHERE id = ? AND status IN (?, ?)",
+            (JOB_FAILED, f"Error processing HTML: {error}", job_id, JOB_QUEUED, JOB_RUNNING)
+        )
+
+
+def run_extraction_job(path, job_id, html_content, page, time_budget, strategy_budget):
+    """
+    Run one extraction job and store its progress and outcome; runs in a parser pool process.
+
+    Args:
+        path (str): The jobs' SQLite database file
+        job_id (str): The job
+        html_content (str): The pasted HTML
+        page (dict): Result of classify_page(), or None
+        time_budget (float): Seconds the job may run in total
+        strategy_budget (float): Seconds the job may spend in each parser strategy
+    """
+    connection = connect(path)
+    cancel_event = threading.Event()
+    finished = threading.Event()
+    state = {'stage': None, 'rows_scanned': 0, 'rows_total': 0, 'addresses_found': 0}
+    last_write = 0.0
+
+    def watch_for_cancel():
+        # Own connection, so the parser's progress writes never wait on it
+        watcher = connect(path)
+        try:
+            while not finished.wait(PROGRESS_INTERVAL):
+                if _cancel_requested(watcher, job_id):
+                    cancel_event.set()
+                    return
+        finally:
+            watcher.close()
+
+    def write_progress(force=False):
+        nonlocal last_write
+        now = time.monotonic()
+        if not force and now - last_write < PROGRESS_INTERVAL:
+            return
+        last_write = now
+        connection.execute(
+            "UPDATE extraction_jobs SET status = ?, stage = ?, rows_scanned = ?, rows_total = ?,"
+            " addresses_found = ? WHERE id = ?",
+            (JOB_RUNNING, state['stage'], state['rows_scanned'], state['rows_total'], state['addresses_found'],
+             job_id)
+        )
+
+    def progress(**fields):
+        state.update(fields)
+        write_progress(force='stage' in fields)
+
+    # A job cancelled while it was still queued doesn't start parsing at all
+    if _cancel_requested(connection, job_id):
+        cancel_event.set()
+    watcher = threading.Thread(target=watch_for_cancel, daemon=True, name=f"extraction-job-{job_id[:8]}-cancel")
+    watcher.start()
+    try:
+        write_progress(force=True)
+        report = extract_shipping_report(
+            html_content, page=page, time_budget=time_budget, strategy_budget=strategy_budget,
+            cancel_event=cancel_event, progress=progress
+        )
+        if report['cancelled']:
+            status, error = JOB_CANCELLED, "Extraction was cancelled"
+        elif report['result']:
+            status, error = JOB_DONE, None
+        else:
+            status, error = JOB_FAILED, "Could not extract shipping information from the HTML"
+        _finish(connection, job_id, status, state, report['result'], report['skipped'], error)
+    except Exception as e:
+        logging.error(f"Extraction job {job_id} failed: {str(e)}")
+        _finish(connection, job_id, JOB_FAILED, state, None, [], f"Error processing HTML: {str(e)}")
+    finally:
+        finished.set()
+        watcher.join()
+        connection.close()
+
+
+def _cancel_requested(connection, job_id):
+    # A job that was pruned away counts as cancelled
+    row = connection.execute("SELECT cancel_requested FROM extraction_jobs WHERE id = ?", (job_id,)).fetchone()
+    return row is None or bool(row[0])
+
+
+def _finish(connection, job_id, status, state, result, skipped, error):
+    connection.execute(
+        "UPDATE extraction_jobs SET status = ?, stage = ?, rows_scanned = ?, rows_total = ?, addresses_found = ?,"
+        " result = ?, skipped = ?, error = ? WHERE id = ?",
+        (status, state['stage'], state['rows_scanned'], state['rows_total'], state['addresses_found'],
+         json.dumps(result, default=to_jsonable) if result else None, json.dumps(skipped), error, job_id)
+    )
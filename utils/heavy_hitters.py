@@ -0,0 +1,106 @@
+class SpaceSaving:
+    """
+    Approximate counts of the most frequent items in a stream, in fixed memory (Space-Saving).
+
+    At most capacity items are tracked. When a new item arrives and every
+    slot is taken, the item with the smallest count is evicted and the new
+    one takes over its count plus one, remembering that count as its error.
+    So a reported count is never below the true count, and never above it by
+    more than the item's error. Errors never exceed the smallest tracked
+    count, which is at most total / capacity, so every item that occurs more
+    often than that is guaranteed to be tracked.
+
+    Items are kept in buckets by count so that finding the smallest count and
+    moving an item up are O(1): once every slot is taken, the smallest count
+    only grows, one step at a time, when the last item in its bucket moves up.
+    """
+
+    __slots__ = ('capacity', 'total', 'evictions', '_counts', '_errors', '_buckets', '_min_count')
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity (int): Items tracked at once; memory stays proportional to it
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self.evictions = 0
+        self._counts = {}
+        self._errors = {}
+        # count -> items with that count, in the order they reached it
+        self._buckets = {}
+        self._min_count = 0
+
+    def add(self, item):
+        """Count one occurrence of item."""
+        self.total += 1
+        counts = self._counts
+        count = counts.get(item)
+
+        if count is None:
+            if len(counts) < self.capacity:
+                # A free slot; a new item has the smallest count there is
+                count = 0
+                self._errors[item] = 0
+                self._min_count = 1
+            else:
+                # Take over the slot of the item that reached the smallest count first
+                count = self._min_count
+                bucket = self._buckets[count]
+                evicted = next(iter(bucket))
+                del bucket[evicted], counts[evicted], self._errors[evicted]
+                self.evictions += 1
+                self._errors[item] = count
+                # Moved up out of this bucket below, like any other item
+                bucket[item] = None
+
+        if count:
+            bucket = self._buckets[count]
+            del bucket[item]
+            if not bucket:
+                del self._buckets[count]
+                if self._min_count == count:
+                    self._min_count = count + 1
+
+        counts[item] = count + 1
+        self._buckets.setdefault(count + 1, {})[item] = None
+
+    def update(self, items):
+        """
+        Count every item in an iterable, like Counter.update.
+
+        Args:
+            items (iterable): The items
+        """
+        add = self.add
+        for item in items:
+            add(item)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __bool__(self):
+        return bool(self._counts)
+
+    @property
+    def max_error(self):
+        """
+        int: The most any reported count can be above the true count, and the
+             most times an item that isn't tracked can have occurred; 0 while
+             the counts are exact
+        """
+        return self._min_count if self.evictions else 0
+
+    def most_common(self, n=None):
+        """
+        Args:
+            n (int): How many items to return; all tracked items if not given
+
+        Returns:
+            list: (item, count, error) tuples, highest count first; the true
+                  count is between count - error and count
+        """
+        ranked = sorted(self._counts.items(), key=lambda x: x[1], reverse=True)
+        return [(item, count, self._errors[item]) for item, count in ranked[:n]]
@@ -1,335 +1,814 @@
 import re
+import time
 import logging
-from bs4 import BeautifulSoup
+from itertools import chain
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from bs4.dammit import EncodingDetector
+from utils.result_cache import ResultCache, content_key
+from utils.shipping_address import ShippingAddress
 
-def extract_shipping_info(html_content):
+# data-test-id markers used by the Seller Central "Manage Orders" page
+BUYER_PO_TEST_ID = 'shipping-section-buyer-po'
+BUYER_ADDRESS_TEST_ID = 'shipping-section-buyer-address'
+
+ORDER_ID_PATTERN = re.compile(r'(\d{3}-\d{7}-\d{7})')
+CITY_STATE_ZIP_PATTERN = re.compile(r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)')
+
+# Pieces of CITY_STATE_ZIP_PATTERN used by search_city_state_zip() to find the
+# same match in linear time: the ", ST 12345" tail, and the city run read backwards
+STATE_ZIP_TAIL_PATTERN = re.compile(r',\s*[A-Z]{2}\s*\d{5}')
+CITY_RUN_PATTERN = re.compile(r'[A-Za-z\s]+')
+# Characters read back from a comma at first when looking for the start of the
+# city; doubled until the start is found, so a run of any length is read once
+CITY_SCAN_WINDOW = 256
+
+# A street starts at the first digit of a number; the lookbehind stops the
+# search from retrying every position inside a long run of digits
+STREET_PATTERN = re.compile(
+    r'(?<!\d)(\d+\s+[A-Za-z\s]+(?:(?:St|Street|Ave|Avenue|Rd|Road|Dr|Drive|Ln|Lane|Blvd|Boulevard|Pl|Place|Ct|Court|Way'
+    r'|Trl|Trail|Cir|Circle|Pkwy|Parkway))?)', re.IGNORECASE)
+
+# Raw-markup patterns used to find the order rows before parsing
+ORDER_ANCHOR_PATTERN = re.compile(r'data-test-id\s*=\s*["\']?shipping-section-', re.IGNORECASE)
+ROW_TAG_PATTERN = re.compile(r'<(/?)tr\b', re.IGNORECASE)
+BYTES_ORDER_ANCHOR_PATTERN = re.compile(ORDER_ANCHOR_PATTERN.pattern.encode(), re.IGNORECASE)
+BYTES_ROW_TAG_PATTERN = re.compile(ROW_TAG_PATTERN.pattern.encode(), re.IGNORECASE)
+# Comments and script/style bodies, whose row tags and markers the parser never sees as markup;
+# an end group that matched nothing means the span runs to the end of the page
+HIDDEN_MARKUP_PATTERN = re.compile(
+    r'<!--.*?(?P<comment_end>-->|\Z)|<(?P<tag>script|style)\b.*?(?P<tag_end></(?P=tag)\b|\Z)',
+    re.IGNORECASE | re.DOTALL)
+BYTES_HIDDEN_MARKUP_PATTERN = re.compile(HIDDEN_MARKUP_PATTERN.pattern.encode(), re.IGNORECASE | re.DOTALL)
+
+# Raw-markup signatures used by classify_page() to route or reject a paste
+FORM_FIELD_TAG_PATTERN = re.compile(r'<(?:input|textarea)\b', re.IGNORECASE)
+ZIP_CODE_PATTERN = re.compile(r'\b\d{5}(?:-\d{4})?\b')
+PRODUCT_PAGE_PATTERN = re.compile(r'id\s*=\s*["\']?(?:productTitle|add-to-cart-button|buy-now-button)\b')
+CART_PAGE_PATTERN = re.compile(
+    r'id\s*=\s*["\']?(?:sc-active-cart|activeCartViewForm|sc-empty-cart)\b|Your Amazon Cart is empty')
+
+# Page kinds reported by classify_page()
+PAGE_ORDER_ROWS = 'order_rows'
+PAGE_FORM = 'form'
+PAGE_ADDRESS_TEXT = 'address_text'
+PAGE_PRODUCT = 'product'
+PAGE_CART = 'cart'
+PAGE_UNKNOWN = 'unknown'
+
+PAGE_ERRORS = {
+    PAGE_PRODUCT: "This looks like a product page, not an order page. Paste the HTML from the Manage Orders page.",
+    PAGE_CART: "This looks like a shopping cart page, not an order page. Paste the HTML from the Manage Orders page.",
+    PAGE_UNKNOWN: "No order rows, shipping form, order IDs or ZIP codes were found in the pasted HTML. "
+                  "Make sure you copied the whole order page.",
+}
+
+# Form field id patterns, in the order the form strategy applies them
+FORM_FIELD_PATTERNS = [
+    ('ToName', re.compile(r'ToName|to[-_]?name|receiver[-_]?name', re.IGNORECASE)),
+    ('Street1To', re.compile(r'Street1To|street[-_]?1|address[-_]?1', re.IGNORECASE)),
+    ('CityTo', re.compile(r'CityTo|city', re.IGNORECASE)),
+    ('StateTo', re.compile(r'StateTo|state', re.IGNORECASE)),
+    ('ZipTo', re.compile(r'ZipTo|zip|postal[-_]?code', re.IGNORECASE)),
+    ('PhoneTo', re.compile(r'PhoneTo|phone|tel', re.IGNORECASE)),
+    ('CompanyTo', re.compile(r'CompanyTo|company', re.IGNORECASE)),
+    ('Street2To', re.compile(r'Street2To|street[-_]?2|address[-_]?2', re.IGNORECASE)),
+    ('order_id', re.compile(r'order[-_]?id|orderId', re.IGNORECASE)),
+]
+
+
+class BudgetExceeded(Exception):
+    """Raised inside the parser when a time budget runs out or the extraction is cancelled."""
+
+
+class Deadline:
     """
-    Extract customer shipping information from the HTML content.
-    
+    Cooperative time budget for an extraction, checked between units of work.
+
+    A child deadline never outlives its parent, and setting the cancel event
+    ends the parent and every child at their next check.
+    """
+
+    def __init__(self, seconds=None, cancel_event=None, parent=None):
+        """
+        Args:
+            seconds (float): Budget in seconds; None for no limit
+            cancel_event (threading.Event): Set it to cancel the extraction
+            parent (Deadline): Deadline this one is nested in
+        """
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.cancel_event = cancel_event
+        if parent is not None:
+            if parent.expires_at is not None and (self.expires_at is None or parent.expires_at < self.expires_at):
+                self.expires_at = parent.expires_at
+            self.cancel_event = self.cancel_event or parent.cancel_event
+
+    def child(self, seconds):
+        return Deadline(seconds, parent=self)
+
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def expired(self):
+        return self.cancelled() or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    def check(self):
+        if self.expired():
+            raise BudgetExceeded()
+
+
+# Deadline with no limit, for callers that don't set a budget
+NO_DEADLINE = Deadline()
+
+# Tree nodes visited between deadline checks while collecting candidates
+NODES_PER_DEADLINE_CHECK = 4096
+
+
+class ExtractionCandidates:
+    """
+    Everything the extraction strategies look at, gathered in a single walk of the tree.
+
+    Each strategy used to run its own find_all() over the whole document. Collecting
+    the candidates up front means a miss on the first strategy no longer costs
+    another full traversal for every fallback.
+    """
+
+    def __init__(self):
+        self.buyer_spans = []      # <span data-test-id="shipping-section-buyer-po">
+        self.address_divs = []     # <div data-test-id="shipping-section-buyer-address">
+        self.rows = []             # every <tr>, in document order
+        self.form_fields = []      # <input>/<textarea> elements with an id
+        self.text_parts = []       # strings that make up soup.get_text()
+        self.order_links = []      # <a> elements whose href points at an order page
+        self.first_address_div = {}  # id(tag) -> first address div below that tag
+        self.order_ids = {}        # id(tag) -> order ID of the first order link below that tag
+
+    def rows_with_address(self):
+        """Rows that contain an address div, in document order."""
+        return [row for row in self.rows if id(row) in self.first_address_div]
+
+    def order_id_for(self, tag):
+        """Order ID from the first /order/ link inside tag, or an empty string."""
+        return self.order_ids.get(id(tag), "")
+
+    def has_order_link(self, tag):
+        return id(tag) in self.order_ids
+
+    def full_text(self):
+        """Equivalent of soup.get_text() without another traversal."""
+        return ''.join(self.text_parts)
+
+
+def collect_candidates(root, deadline=NO_DEADLINE):
+    """
+    Walk the parsed tree once and collect the candidates for every strategy.
+
     Args:
-        html_content (str): The HTML content containing shipping information
-        
+        root (Tag): The BeautifulSoup object (or any tag) to walk
+        deadline (Deadline): Checked every few thousand nodes
+
     Returns:
-        dict or list: A dictionary with extracted shipping details or a list of dictionaries 
-                     if multiple addresses are found
+        ExtractionCandidates: The collected candidates
+    """
+    candidates = ExtractionCandidates()
+    text_types = getattr(root, 'interesting_string_types', None) or (NavigableString, CData)
+
+    # The root itself counts too, so a single parsed <tr> is seen as a row
+    for count, node in enumerate(chain((root,), root.descendants)):
+        if count % NODES_PER_DEADLINE_CHECK == 0:
+            deadline.check()
+        if isinstance(node, Tag):
+            name = node.name
+            if name == 'span':
+                if node.get('data-test-id') == BUYER_PO_TEST_ID:
+                    candidates.buyer_spans.append(node)
+            elif name == 'div':
+                if node.get('data-test-id') == BUYER_ADDRESS_TEST_ID:
+                    candidates.address_divs.append(node)
+            elif name == 'tr':
+                candidates.rows.append(node)
+            elif name == 'a':
+                href = node.get('href')
+                if href and '/order/' in href:
+                    candidates.order_links.append(node)
+            elif name in ('input', 'textarea'):
+                if node.get('id') is not None:
+                    candidates.form_fields.append(node)
+        elif type(node) in text_types:
+            candidates.text_parts.append(node)
+
+    # Record the first address div below each ancestor, which is what
+    # row.find('div', ...) and span.find('div', ...) would have returned.
+    # An ancestor that is already recorded has all of its own ancestors
+    # recorded too, so each walk stops there.
+    for address_div in candidates.address_divs:
+        for parent in address_div.parents:
+            if id(parent) in candidates.first_address_div:
+                break
+            candidates.first_address_div[id(parent)] = address_div
+
+    # Index the order ID of the first order link below each ancestor, so the
+    # strategies can look up a row's order without searching its subtree
+    for link in candidates.order_links:
+        order_id = None
+        for parent in link.parents:
+            if id(parent) in candidates.order_ids:
+                break
+            if order_id is None:
+                order_id_match = ORDER_ID_PATTERN.search(link.get_text())
+                order_id = order_id_match.group(1) if order_id_match else ""
+            candidates.order_ids[id(parent)] = order_id
+
+    return candidates
+
+
+def _empty_shipping_info(order_id=''):
+    return ShippingAddress(
+        ToName='',
+        PhoneTo='',
+        Street1To='',
+        CompanyTo='',
+        Street2To='',
+        CityTo='',
+        ZipTo='',
+        StateTo='',
+        order_id=order_id
+    )
+
+
+def _has_required_fields(shipping_info):
+    return all([shipping_info['ToName'], shipping_info['Street1To'],
+                shipping_info['CityTo'], shipping_info['StateTo'], shipping_info['ZipTo']])
+
+
+def _parse_address_spans(address_div, order_id):
+    """
+    Build a shipping record from the spans of a buyer address div.
+
+    Args:
+        address_div (Tag): The shipping-section-buyer-address div
+        order_id (str): Order ID found for the enclosing row
+
+    Returns:
+        dict: The shipping record, or None if an essential field is missing
+    """
+    shipping_info = _empty_shipping_info(order_id)
+
+    # Find all spans in the address div (name, street, city, state, zip)
+    span_texts = []
+    for span in address_div.find_all('span'):
+        text = span.get_text().strip()
+        if text:
+            # Remove <br> tag
+            span_texts.append(text.replace('<br>', ''))
+
+    # First span is usually the name
+    if len(span_texts) >= 1:
+        shipping_info['ToName'] = span_texts[0]
+
+    # Second span is usually the street address
+    if len(span_texts) >= 2:
+        shipping_info['Street1To'] = span_texts[1]
+
+    # Remaining spans usually have city, state, zip
+    city_state_zip_text = " ".join(span_texts[2:]) if len(span_texts) > 2 else ""
+    city_state_zip_match = search_city_state_zip(city_state_zip_text)
+
+    if city_state_zip_match:
+        shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
+        shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
+        shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
+
+    # Only keep it if we have all the essential shipping info
+    if _has_required_fields(shipping_info):
+        return shipping_info
+    return None
+
+
+def _extract_from_buyer_spans(candidates, deadline=NO_DEADLINE):
+    """Strategy 1: shipping-section-buyer-po spans with the order link in the parent row."""
+    shipping_addresses = []
+
+    for buyer_span in candidates.buyer_spans:
+        deadline.check()
+        # Go up the DOM tree to find the parent row which contains the order link
+        current = buyer_span
+        order_id = ""
+        for _ in range(8):  # Limit the depth of parent search
+            if not current or current.name == 'tr':
+                break
+            current = current.parent
+
+        if current and current.name == 'tr':
+            order_id = candidates.order_id_for(current)
+
+        # Find the address div within this buyer span
+        address_div = candidates.first_address_div.get(id(buyer_span))
+        if address_div:
+            shipping_info = _parse_address_spans(address_div, order_id)
+            if shipping_info:
+                shipping_addresses.append(shipping_info)
+
+    return shipping_addresses
+
+
+def _extract_from_table_rows(candidates, deadline=NO_DEADLINE):
+    """Strategy 2: any table row holding a buyer address div."""
+    shipping_addresses = []
+
+    for row in candidates.rows_with_address():
+        deadline.check()
+        order_id = candidates.order_id_for(row)
+        shipping_info = _parse_address_spans(candidates.first_address_div[id(row)], order_id)
+        if shipping_info:
+            shipping_addresses.append(shipping_info)
+
+    return shipping_addresses
+
+
+def _extract_from_form_fields(candidates, deadline=NO_DEADLINE):
+    """Strategy 3: input/textarea elements whose ids look like shipping fields."""
+    form_fields = {}
+    for field_name, id_pattern in FORM_FIELD_PATTERNS:
+        deadline.check()
+        form_fields[field_name] = next(
+            (field for field in candidates.form_fields if id_pattern.search(field['id'])), None)
+
+    # Check if we found form fields
+    if not any(field for field in form_fields.values()):
+        return []
+
+    address_info = _empty_shipping_info()
+
+    # Extract values from form fields
+    for field_name, field_element in form_fields.items():
+        if field_element:
+            value = field_element.get('value', '')
+            if value:
+                # Special handling for fields that might contain combined information
+                if field_name == 'ToName' and (re.search(r'\d+\s+[A-Za-z]+', value) or ',' in value):
+                    # This looks like it contains address info, not just a name
+                    parts = parse_combined_field(value)
+                    if parts.get('name'):
+                        address_info['ToName'] = parts['name']
+                    if parts.get('street'):
+                        address_info['Street1To'] = parts['street']
+                    if parts.get('city'):
+                        address_info['CityTo'] = parts['city']
+                    if parts.get('state'):
+                        address_info['StateTo'] = parts['state']
+                    if parts.get('zip'):
+                        address_info['ZipTo'] = parts['zip']
+                elif field_name == 'Street1To' and (re.search(r'[A-Z][a-z]+\s+[A-Z][a-z]+', value) or ',' in value):
+                    # This might contain name and street combined
+                    parts = parse_combined_field(value)
+                    if parts.get('name') and not address_info['ToName']:
+                        address_info['ToName'] = parts['name']
+                    if parts.get('street'):
+                        address_info['Street1To'] = parts['street']
+                    if parts.get('city'):
+                        address_info['CityTo'] = parts['city']
+                    if parts.get('state'):
+                        address_info['StateTo'] = parts['state']
+                    if parts.get('zip'):
+                        address_info['ZipTo'] = parts['zip']
+                else:
+                    # Regular field
+                    address_info[field_name] = value
+
+    # Check if we have the essential info
+    if address_info['ToName'] or address_info['Street1To']:
+        return [address_info]
+    return []
+
+
+def _extract_from_address_divs(candidates, deadline=NO_DEADLINE):
+    """Strategy 4: buyer address divs outside of the table layout."""
+    shipping_addresses = []
+
+    for address_div in candidates.address_divs:
+        deadline.check()
+        shipping_info = _empty_shipping_info()
+
+        # Extract text content from the address div
+        address_text = address_div.get_text()
+
+        # Find the name (first line) and street address (second line)
+        try:
+            spans = address_div.find_all('span', class_='')
+            if spans and len(spans) >= 1:
+                shipping_info['ToName'] = spans[0].get_text().strip().rstrip('<br>')
+
+            if spans and len(spans) >= 2:
+                shipping_info['Street1To'] = spans[1].get_text().strip().rstrip('<br>')
+        except (AttributeError, TypeError):
+            logging.warning("Could not extract spans from address div")
+
+        # Extract city, state, zip from the last part
+        city_state_zip_match = search_city_state_zip(address_text)
+
+        if city_state_zip_match:
+            shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
+            shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
+            shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
+
+        # Look for the order ID in the nearest parent element holding an order link
+        current = address_div
+        for _ in range(5):  # limit the search depth
+            if not current.parent:
+                break
+            current = current.parent
+            if candidates.has_order_link(current):
+                shipping_info['order_id'] = candidates.order_id_for(current)
+                break
+
+        # Only add if we have the essential shipping info
+        if _has_required_fields(shipping_info):
+            shipping_addresses.append(shipping_info)
+
+    return shipping_addresses
+
+
+def _extract_from_text(candidates, deadline=NO_DEADLINE):
+    """Strategy 5: regex over the plain text of the whole page."""
+    deadline.check()
+    addr_components = extract_address_components(candidates.full_text())
+
+    if addr_components and addr_components['ToName'] and addr_components['Street1To']:
+        return [addr_components]
+    return []
+
+
+# Name of the last-resort strategy that searches the page text
+TEXT_STRATEGY = 'text'
+
+# Strategies in priority order; the first one that yields addresses wins
+STRATEGIES = [
+    ('buyer_spans', _extract_from_buyer_spans),
+    ('table_rows', _extract_from_table_rows),
+    ('form_fields', _extract_from_form_fields),
+    ('address_divs', _extract_from_address_divs),
+    (TEXT_STRATEGY, _extract_from_text),
+]
+
+# Strategies that only ever look inside the order rows, so they can run on a
+# tree built from just those rows
+ROW_STRATEGIES = ('buyer_spans', 'table_rows')
+
+# Row strategy results per order row, keyed by a hash of the row's raw markup.
+# Overlapping pastes only pay for the rows that are new.
+row_cache = ResultCache(max_entries=20000, max_bytes=32 * 1024 * 1024, ttl=3600)
+
+
+def _as_result(shipping_addresses):
+    return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
+
+
+def find_order_regions(html_content):
+    """
+    Locate the table rows holding shipping sections by scanning the raw markup.
+
+    Only <tr> tags and data-test-id="shipping-section-*" markers are looked at,
+    so this costs a few regex scans instead of a full parse. Tags and markers
+    inside comments and script or style bodies are skipped, as the parser
+    treats them as text. Regions are the outermost rows around each marker,
+    which keeps every row the row strategies would visit, including layout
+    rows wrapping the orders table.
+
+    Args:
+        html_content (str or bytes): The raw HTML content
+
+    Returns:
+        list: (start, end) offsets of each region in document order, or None if
+              there are no markers, a marker is not inside a closed row, or a
+              comment, script or style is never closed
     """
+    if isinstance(html_content, bytes):
+        anchor_pattern, row_pattern, hidden_pattern, tag_end = (
+            BYTES_ORDER_ANCHOR_PATTERN, BYTES_ROW_TAG_PATTERN, BYTES_HIDDEN_MARKUP_PATTERN, b'>')
+    else:
+        anchor_pattern, row_pattern, hidden_pattern, tag_end = (
+            ORDER_ANCHOR_PATTERN, ROW_TAG_PATTERN, HIDDEN_MARKUP_PATTERN, '>')
+
+    hidden = []
+    for match in hidden_pattern.finditer(html_content):
+        end_group = 'comment_end' if match.group('tag') is None else 'tag_end'
+        if not match.group(end_group):
+            # How the parser ends an unclosed comment or script is its own business
+            return None
+        hidden.append(match.span())
+
+    def visible(matches):
+        # Matches and hidden spans both come in document order, so one pass skips them
+        next_hidden = 0
+        for match in matches:
+            position = match.start()
+            while next_hidden < len(hidden) and hidden[next_hidden][1] <= position:
+                next_hidden += 1
+            if next_hidden == len(hidden) or position < hidden[next_hidden][0]:
+                yield match
+
+    anchors = [match.start() for match in visible(anchor_pattern.finditer(html_content))]
+    if not anchors:
+        return None
+
+    regions = []
+    open_rows = []
+    region_start = None
+    next_anchor = 0
+
+    for match in visible(row_pattern.finditer(html_content)):
+        position = match.start()
+
+        # Markers before this tag belong to the rows that are open right now
+        while next_anchor < len(anchors) and anchors[next_anchor] < position:
+            if not open_rows:
+                return None
+            if region_start is None:
+                region_start = open_rows[0]
+            next_anchor += 1
+
+        if not match.group(1):
+            open_rows.append(position)
+        elif open_rows:
+            open_rows.pop()
+            if not open_rows and region_start is not None:
+                end = html_content.find(tag_end, match.end())
+                if end == -1:
+                    return None
+                regions.append((region_start, end + 1))
+                region_start = None
+
+    # Markers after the last row tag, or inside a row that never closes
+    if next_anchor < len(anchors) or region_start is not None:
+        return None
+
+    return regions
+
+
+def classify_page(html_content):
+    """
+    Classify a paste from cheap scans of the raw markup, before any parsing.
+
+    Decides which strategies could possibly find something, so the parser can
+    skip the rest, and rejects pages that are clearly not order pages.
+
+    Args:
+        html_content (str or bytes): The raw HTML content
+
+    Returns:
+        dict: 'kind' (one of the PAGE_* values), 'strategies' (names of the
+              strategies worth running, in priority order) and 'error' (a
+              message for rejected pages, otherwise None)
+    """
+    if isinstance(html_content, bytes):
+        # Every marker is ASCII, and latin-1 maps bytes one-to-one
+        html_content = html_content.decode('latin-1')
+
+    has_markers = ORDER_ANCHOR_PATTERN.search(html_content) is not None
+    has_form_fields = FORM_FIELD_TAG_PATTERN.search(html_content) is not None
+
+    if has_markers:
+        kind = PAGE_ORDER_ROWS
+    elif PRODUCT_PAGE_PATTERN.search(html_content):
+        kind = PAGE_PRODUCT
+    elif CART_PAGE_PATTERN.search(html_content):
+        kind = PAGE_CART
+    elif has_form_fields:
+        kind = PAGE_FORM
+    elif ORDER_ID_PATTERN.search(html_content) or ZIP_CODE_PATTERN.search(html_content):
+        kind = PAGE_ADDRESS_TEXT
+    else:
+        kind = PAGE_UNKNOWN
+
+    error = PAGE_ERRORS.get(kind)
+    if error:
+        return {'kind': kind, 'strategies': [], 'error': error}
+
+    # Every strategy except the form and text ones needs a shipping-section marker
+    possible = {'form_fields': has_form_fields, TEXT_STRATEGY: True}
+    strategies = [name for name, _ in STRATEGIES if possible.get(name, has_markers)]
+    return {'kind': kind, 'strategies': strategies, 'error': None}
+
+
+def parse_order_regions(html_content, regions):
+    """
+    Build a tree from only the given regions of the page.
+
+    Args:
+        html_content (str or bytes): The raw HTML content
+        regions (list): (start, end) offsets from find_order_regions()
+
+    Returns:
+        BeautifulSoup: The parsed fragment
+    """
+    if isinstance(html_content, bytes):
+        fragment = b''.join(html_content[start:end] for start, end in regions)
+        # The fragment loses the page's <meta charset>, so carry it over
+        from_encoding = EncodingDetector.find_declared_encoding(html_content, is_html=True)
+        return BeautifulSoup(fragment, 'html.parser', from_encoding=from_encoding)
+
+    fragment = ''.join(html_content[start:end] for start, end in regions)
+    return BeautifulSoup(fragment, 'html.parser')
+
+
+def _parse_rows(html_content, regions):
+    """Parse the given regions in one go and return the top-level row of each."""
+    rows = [child for child in parse_order_regions(html_content, regions).contents if isinstance(child, Tag)]
+    if len(rows) == len(regions):
+        return rows
+
+    # Stray markup split or merged rows; parse them one at a time instead
+    rows = []
+    for region in regions:
+        fragment = parse_order_regions(html_content, [region])
+        rows.append(next(child for child in fragment.contents if isinstance(child, Tag)))
+    return rows
+
+
+def _no_progress(**fields):
+    pass
+
+
+def extract_order_rows(html_content, regions, deadline=NO_DEADLINE, progress=_no_progress):
+    """
+    Run the row strategies on each order row, reusing cached results for rows seen before.
+
+    Args:
+        html_content (str or bytes): The raw HTML content
+        regions (list): (start, end) offsets from find_order_regions()
+        deadline (Deadline): Checked between rows; rows finished before it
+            expires are still cached
+        progress (callable): Called with rows_scanned and rows_total as rows are done
+
+    Returns:
+        list: One dict per region mapping each row strategy name to its addresses
+    """
+    keys = [content_key(html_content[start:end]) for start, end in regions]
+    row_results = [row_cache.get(key) for key in keys]
+
+    unseen = [index for index, result in enumerate(row_results) if result is None]
+    progress(rows_scanned=len(regions) - len(unseen), rows_total=len(regions))
+    if unseen:
+        rows = _parse_rows(html_content, [regions[index] for index in unseen])
+        for done, (index, row) in enumerate(zip(unseen, rows), 1):
+            candidates = collect_candidates(row, deadline)
+            result = {name: strategy(candidates, deadline) for name, strategy in STRATEGIES if name in ROW_STRATEGIES}
+            row_cache.put(keys[index], result)
+            row_results[index] = result
+            progress(rows_scanned=len(regions) - len(unseen) + done, rows_total=len(regions))
+
+    return row_results
+
+
+def extract_shipping_report(html_content, region_limited=True, page=None, time_budget=None,
+                            strategy_budget=None, cancel_event=None, progress=_no_progress):
+    """
+    Extract shipping information and report how the result was reached.
+
+    Args:
+        html_content (str or bytes): The HTML content containing shipping information
+        region_limited (bool): Parse only the order rows first when the page has
+            shipping-section markers, falling back to the full page if they yield nothing.
+            Rows already seen in an earlier paste are answered from the row cache.
+        page (dict): Result of classify_page() if the caller already has it
+        time_budget (float): Seconds for the whole extraction; None for no limit
+        strategy_budget (float): Seconds for each strategy; one that runs out is
+            skipped and the next one is tried
+        cancel_event (threading.Event): Set it to stop the extraction early
+        progress (callable): Called with keyword updates as the extraction goes on:
+            stage, rows_scanned, rows_total and addresses_found
+
+    Returns:
+        dict: 'result' (what extract_shipping_info returns), 'strategy' (name of
+              the strategy that produced it), 'skipped' (strategies that ran out
+              of time or were never reached before the overall budget ran out)
+              and 'cancelled' (True if cancel_event stopped the extraction)
+    """
+    report = {'result': None, 'strategy': None, 'skipped': [], 'cancelled': False}
+    deadline = Deadline(time_budget, cancel_event)
+    pending = []
+
+    def run_strategy(name, strategy, candidates):
+        # Returns the strategy's addresses, or None if it ran out of time
+        pending.remove(name)
+        try:
+            return strategy(candidates, deadline.child(strategy_budget))
+        except BudgetExceeded:
+            if deadline.expired():
+                raise
+            logging.warning(f"Extraction strategy {name} ran out of time and was skipped")
+            report['skipped'].append(name)
+            return None
+
     try:
-        # Parse HTML with BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Initialize shipping addresses list
-        shipping_addresses = []
-        
-        # First look for all shipping-section-buyer-po spans which contain the address
-        # This is the specific format you mentioned in your example
-        buyer_spans = soup.find_all('span', attrs={'data-test-id': 'shipping-section-buyer-po'})
-        
-        if buyer_spans:
-            # For each buyer span, try to find the address div and order ID
-            for span_index, buyer_span in enumerate(buyer_spans):
-                # Find the parent row to get the order ID
-                current = buyer_span
-                order_id = ""
-                
-                # Go up the DOM tree to find the parent row which contains the order link
-                for _ in range(8):  # Limit the depth of parent search
-                    if not current or current.name == 'tr':
-                        break
-                    current = current.parent
-                
-                if current and current.name == 'tr':
-                    # Try to find the order link
-                    order_links = current.find_all('a', href=lambda href: href and '/order/' in href)
-                    if order_links:
-                        order_id_match = re.search(r'(\d{3}-\d{7}-\d{7})', order_links[0].text.strip())
-                        if order_id_match:
-                            order_id = order_id_match.group(1)
-                
-                # Find the address div within this buyer span
-                address_div = buyer_span.find('div', attrs={'data-test-id': 'shipping-section-buyer-address'})
-                
-                if address_div:
-                    shipping_info = {
-                        'ToName': '',
-                        'PhoneTo': '',
-                        'Street1To': '',
-                        'CompanyTo': '',
-                        'Street2To': '',
-                        'CityTo': '',
-                        'ZipTo': '',
-                        'StateTo': '',
-                        'order_id': order_id
-                    }
-                    
-                    # Find all spans in the address div (name, street, city, state, zip)
-                    spans = address_div.find_all('span')
-                    
-                    # Get text from each span
-                    span_texts = []
-                    for span in spans:
-                        text = span.get_text().strip()
-                        if text:
-                            # Remove <br> tag
-                            text = text.replace('<br>', '')
-                            span_texts.append(text)
-                    
-                    # First span is usually the name
-                    if len(span_texts) >= 1:
-                        shipping_info['ToName'] = span_texts[0]
-                    
-                    # Second span is usually the street address
-                    if len(span_texts) >= 2:
-                        shipping_info['Street1To'] = span_texts[1]
-                    
-                    # Check remaining spans for city, state, zip
-                    city_state_zip_text = " ".join(span_texts[2:]) if len(span_texts) > 2 else ""
-                    
-                    # Extract city, state, zip from combined text
-                    city_state_zip_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
-                    city_state_zip_match = re.search(city_state_zip_pattern, city_state_zip_text)
-                    
-                    if city_state_zip_match:
-                        shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
-                        shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
-                        shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
-                    
-                    # Only add if we have all the essential shipping info
-                    if all([shipping_info['ToName'], shipping_info['Street1To'], 
-                          shipping_info['CityTo'], shipping_info['StateTo'], shipping_info['ZipTo']]):
-                        shipping_addresses.append(shipping_info)
-        
-        # If we found addresses from the spans, return them
-        if shipping_addresses:
-            return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
-            
-        # If no spans found, try with table row approach
-        shipping_rows = soup.find_all('tr')
-        
-        for row in shipping_rows:
-            # Look for the order ID in this row
-            order_id = ""
-            order_links = row.find_all('a', href=lambda href: href and '/order/' in href)
-            if order_links:
-                order_id_match = re.search(r'(\d{3}-\d{7}-\d{7})', order_links[0].text.strip())
-                if order_id_match:
-                    order_id = order_id_match.group(1)
-            
-            # Look for address div in this row
-            address_div = row.find('div', attrs={'data-test-id': 'shipping-section-buyer-address'})
-            
-            if address_div:
-                shipping_info = {
-                    'ToName': '',
-                    'PhoneTo': '',
-                    'Street1To': '',
-                    'CompanyTo': '',
-                    'Street2To': '',
-                    'CityTo': '',
-                    'ZipTo': '',
-                    'StateTo': '',
-                    'order_id': order_id
-                }
-                
-                # Find all spans in the address div (name, street, city, state, zip)
-                spans = address_div.find_all('span')
-                span_texts = []
-                
-                # Extract text from each span
-                for span in spans:
-                    text = span.get_text().strip()
-                    if text:
-                        span_texts.append(text.replace('<br>', ''))
-                
-                # First span is usually the name
-                if len(span_texts) >= 1:
-                    shipping_info['ToName'] = span_texts[0]
-                
-                # Second span is usually the street address
-                if len(span_texts) >= 2:
-                    shipping_info['Street1To'] = span_texts[1]
-                
-                # Last spans usually have city, state, zip
-                city_state_zip_text = ""
-                if len(span_texts) >= 3:
-                    # Combine the remaining spans which might have city, state, zip
-                    city_state_zip_text = " ".join(span_texts[2:])
-                
-                # Extract city, state, zip from combined text
-                city_state_zip_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
-                city_state_zip_match = re.search(city_state_zip_pattern, city_state_zip_text)
-                
-                if city_state_zip_match:
-                    shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
-                    shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
-                    shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
-                
-                # Only add if we have all the essential shipping info
-                if all([shipping_info['ToName'], shipping_info['Street1To'], 
-                       shipping_info['CityTo'], shipping_info['StateTo'], shipping_info['ZipTo']]):
-                    shipping_addresses.append(shipping_info)
-        
-        # If we found addresses from any method, return them
-        if shipping_addresses:
-            return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
-        
-        # If we couldn't find addresses in the table format, try other methods
-        
-        # Try to find form fields with labels like "To Name", "Street 1", etc.
-        form_fields = {
-            'ToName': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'ToName|to[-_]?name|receiver[-_]?name', re.IGNORECASE)}),
-            'Street1To': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'Street1To|street[-_]?1|address[-_]?1', re.IGNORECASE)}),
-            'CityTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'CityTo|city', re.IGNORECASE)}),
-            'StateTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'StateTo|state', re.IGNORECASE)}),
-            'ZipTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'ZipTo|zip|postal[-_]?code', re.IGNORECASE)}),
-            'PhoneTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'PhoneTo|phone|tel', re.IGNORECASE)}),
-            'CompanyTo': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'CompanyTo|company', re.IGNORECASE)}),
-            'Street2To': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'Street2To|street[-_]?2|address[-_]?2', re.IGNORECASE)}),
-            'order_id': soup.find(['input', 'textarea'], attrs={'id': re.compile(r'order[-_]?id|orderId', re.IGNORECASE)})
-        }
-        
-        # Check if we found form fields
-        if any(field for field in form_fields.values()):
-            address_info = {
-                'ToName': '',
-                'PhoneTo': '',
-                'Street1To': '',
-                'CompanyTo': '',
-                'Street2To': '',
-                'CityTo': '',
-                'ZipTo': '',
-                'StateTo': '',
-                'order_id': ''
-            }
-            
-            # Extract values from form fields
-            for field_name, field_element in form_fields.items():
-                if field_element:
-                    value = field_element.get('value', '')
-                    if value:
-                        # Special handling for fields that might contain combined information
-                        if field_name == 'ToName' and (re.search(r'\d+\s+[A-Za-z]+', value) or ',' in value):
-                            # This looks like it contains address info, not just a name
-                            parts = parse_combined_field(value)
-                            if parts.get('name'):
-                                address_info['ToName'] = parts['name']
-                            if parts.get('street'):
-                                address_info['Street1To'] = parts['street']
-                            if parts.get('city'):
-                                address_info['CityTo'] = parts['city']
-                            if parts.get('state'):
-                                address_info['StateTo'] = parts['state']
-                            if parts.get('zip'):
-                                address_info['ZipTo'] = parts['zip']
-                        elif field_name == 'Street1To' and (re.search(r'[A-Z][a-z]+\s+[A-Z][a-z]+', value) or ',' in value):
-                            # This might contain name and street combined
-                            parts = parse_combined_field(value)
-                            if parts.get('name') and not address_info['ToName']:
-                                address_info['ToName'] = parts['name']
-                            if parts.get('street'):
-                                address_info['Street1To'] = parts['street']
-                            if parts.get('city'):
-                                address_info['CityTo'] = parts['city']
-                            if parts.get('state'):
-                                address_info['StateTo'] = parts['state']
-                            if parts.get('zip'):
-                                address_info['ZipTo'] = parts['zip']
-                        else:
-                            # Regular field
-                            address_info[field_name] = value
-            
-            # Check if we have the essential info and add to addresses
-            if address_info['ToName'] or address_info['Street1To']:
-                shipping_addresses.append(address_info)
-            
-            # Return form field addresses if found
-            if shipping_addresses:
-                return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
-        
-        # Look for general Amazon-specific address elements (if not in table format)
-        amazon_addresses = soup.find_all('div', attrs={'data-test-id': 'shipping-section-buyer-address'})
-        
-        # If we found Amazon address format but not in the table format we tried earlier
-        if amazon_addresses and not shipping_addresses:
-            for address_div in amazon_addresses:
-                shipping_info = {
-                    'ToName': '',
-                    'PhoneTo': '',
-                    'Street1To': '',
-                    'CompanyTo': '',
-                    'Street2To': '',
-                    'CityTo': '',
-                    'ZipTo': '',
-                    'StateTo': '',
-                    'order_id': ''
-                }
-                
-                # Extract text content from the address div
-                address_text = address_div.get_text()
-                
-                # Find the name (first line) and street address (second line)
+        # Skip the strategies that cannot match and reject pages that are not order pages
+        page = page or classify_page(html_content)
+        if page['error']:
+            return report
+
+        strategies = [entry for entry in STRATEGIES if entry[0] in page['strategies']]
+        pending.extend(name for name, _ in strategies)
+
+        if region_limited and page['kind'] == PAGE_ORDER_ROWS:
+            regions = find_order_regions(html_content)
+            if regions:
+                progress(stage='rows')
                 try:
-                    spans = address_div.find_all('span', class_='')
-                    if spans and len(spans) >= 1:
-                        shipping_info['ToName'] = spans[0].get_text().strip().rstrip('<br>')
-                    
-                    if spans and len(spans) >= 2:
-                        shipping_info['Street1To'] = spans[1].get_text().strip().rstrip('<br>')
-                except (AttributeError, TypeError):
-                    logging.warning("Could not extract spans from address div")
-                
-                # Extract city, state, zip from the last part
-                city_state_zip_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
-                city_state_zip_match = re.search(city_state_zip_pattern, address_text)
-                
-                if city_state_zip_match:
-                    shipping_info['CityTo'] = city_state_zip_match.group(1).strip()
-                    shipping_info['StateTo'] = city_state_zip_match.group(2).strip()
-                    shipping_info['ZipTo'] = city_state_zip_match.group(3).strip()
-                
-                # Try to find order ID near this address
-                order_element = None
-                current = address_div
-                
-                # Look for order ID in parent elements
-                for _ in range(5):  # limit the search depth
-                    if not current.parent:
-                        break
-                    current = current.parent
-                    try:
-                        order_links = current.find_all('a', href=re.compile(r'/order/'))
-                        if order_links:
-                            order_element = order_links[0]
-                            break
-                    except (AttributeError, TypeError):
+                    row_results = extract_order_rows(html_content, regions, deadline.child(strategy_budget), progress)
+                except BudgetExceeded:
+                    if deadline.expired():
+                        raise
+                    logging.warning("Order row extraction ran out of time and was skipped")
+                    row_results = None
+
+                for name in ROW_STRATEGIES:
+                    pending.remove(name)
+                    if row_results is None:
+                        report['skipped'].append(name)
                         continue
-                
-                # Extract order ID if found
-                if order_element:
-                    order_id_match = re.search(r'(\d{3}-\d{7}-\d{7})', order_element.get_text())
-                    if order_id_match:
-                        shipping_info['order_id'] = order_id_match.group(1)
-                
-                # Only add if we have the essential shipping info
-                if shipping_info['ToName'] and shipping_info['Street1To'] and shipping_info['CityTo'] and shipping_info['StateTo'] and shipping_info['ZipTo']:
-                    shipping_addresses.append(shipping_info)
-        
-        # Return addresses if found through any method
-        if shipping_addresses:
-            return shipping_addresses[0] if len(shipping_addresses) == 1 else shipping_addresses
-        
-        # If no structured addresses found, try to extract from text content as last resort
-        full_text = soup.get_text()
-        addr_components = extract_address_components(full_text)
-        
-        if addr_components and addr_components['ToName'] and addr_components['Street1To']:
-            return addr_components
-        
-        # If we still couldn't find any addresses, return None
-        return None
-        
+                    shipping_addresses = [address for result in row_results for address in result[name]]
+                    if shipping_addresses:
+                        progress(addresses_found=len(shipping_addresses))
+                        report.update(result=_as_result(shipping_addresses), strategy=name)
+                        return report
+
+                # The rows held nothing usable; the full page only needs the other strategies
+                strategies = [entry for entry in strategies if entry[0] not in ROW_STRATEGIES]
+
+        # Parse HTML with BeautifulSoup and gather every strategy's candidates in one pass
+        progress(stage='parsing')
+        soup = BeautifulSoup(html_content, 'html.parser')
+        candidates = collect_candidates(soup, deadline)
+
+        for name, strategy in strategies:
+            progress(stage=name)
+            shipping_addresses = run_strategy(name, strategy, candidates)
+            if shipping_addresses:
+                progress(addresses_found=len(shipping_addresses))
+                report.update(result=_as_result(shipping_addresses), strategy=name)
+                return report
+
+    except BudgetExceeded:
+        # The whole extraction ran out of time; nothing after this point was tried
+        report['cancelled'] = deadline.cancelled()
+        report['skipped'].extend(pending)
+        logging.warning(f"Extraction stopped early, skipped strategies: {report['skipped']}")
+
     except Exception as e:
         logging.error(f"Error parsing HTML: {str(e)}")
-        return None
+
+    return report
+
+
+def extract_shipping_info(html_content, region_limited=True, page=None, time_budget=None, strategy_budget=None):
+    """
+    Extract customer shipping information from the HTML content.
+    
+    Args:
+        html_content (str or bytes): The HTML content containing shipping information
+        region_limited (bool): Parse only the order rows first when the page has
+            shipping-section markers, falling back to the full page if they yield nothing
+        page (dict): Result of classify_page() if the caller already has it
+        time_budget (float): Seconds for the whole extraction; None for no limit
+        strategy_budget (float): Seconds for each strategy
+        
+    Returns:
+        ShippingAddress or list: The extracted shipping details, or a list of them
+                     if multiple addresses are found
+    """
+    return extract_shipping_report(html_content, region_limited=region_limited, page=page,
+                                   time_budget=time_budget, strategy_budget=strategy_budget)['result']
+
+
+def search_city_state_zip(text):
+    """
+    Find the same match as CITY_STATE_ZIP_PATTERN.search(text) in linear time.
+
+    The plain pattern retries its leading [A-Za-z\\s]+ from every letter of a
+    long run of words, which goes quadratic over a whole page of text. Instead
+    this finds each ", ST 12345" tail, reads the city backwards from its comma
+    to the start of its run of letters and spaces, and matches the pattern from
+    there. Only runs that end in a tail are read, and each of them once.
+
+    Args:
+        text (str): The text to search
+
+    Returns:
+        re.Match: The match, or None
+    """
+    for tail in STATE_ZIP_TAIL_PATTERN.finditer(text):
+        comma = tail.start()
+        window = CITY_SCAN_WINDOW
+        while True:
+            window_start = max(0, comma - window)
+            city_run = CITY_RUN_PATTERN.match(text[window_start:comma][::-1])
+            # Done unless the run fills the whole window and there is more text before it
+            if city_run is None or city_run.end() < comma - window_start or window_start == 0:
+                break
+            window *= 2
+        if city_run:
+            return CITY_STATE_ZIP_PATTERN.match(text, comma - city_run.end())
+    return None
 
 def parse_combined_field(text):
     """
@@ -350,7 +829,7 @@ def parse_combined_field(text):
     }
     
     # Try to extract city, state, zip first
-    city_state_zip = re.search(r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)', text)
+    city_state_zip = search_city_state_zip(text)
     if city_state_zip:
         result['city'] = city_state_zip.group(1).strip()
         result['state'] = city_state_zip.group(2).strip()
@@ -360,7 +839,7 @@ def parse_combined_field(text):
         text = text[:city_state_zip.start()].strip()
     
     # Try to identify street address (contains numbers)
-    street_match = re.search(r'\d+\s+[A-Za-z\s]+(?:(?:St|Street|Ave|Avenue|Rd|Road|Dr|Drive|Ln|Lane|Blvd|Boulevard|Pl|Place|Ct|Court|Way|Trl|Trail|Cir|Circle|Pkwy|Parkway))?', text, re.IGNORECASE)
+    street_match = STREET_PATTERN.search(text)
     if street_match:
         result['street'] = street_match.group(0).strip()
         
@@ -417,19 +896,18 @@ def extract_address_components(text):
         text (str): The text to extract from
         
     Returns:
-        dict: Dictionary with address components
+        ShippingAddress: The address components
     """
-    result = {
-        'ToName': '',
-        'PhoneTo': '',
-        'Street1To': '',
-        'CompanyTo': '',
-        'Street2To': '',
-        'CityTo': '',
-        'StateTo': '',
-        'ZipTo': '',
-        'PhoneTo': ''
-    }
+    result = ShippingAddress(
+        ToName='',
+        PhoneTo='',
+        Street1To='',
+        CompanyTo='',
+        Street2To='',
+        CityTo='',
+        StateTo='',
+        ZipTo=''
+    )
     
     # Find name patterns
     name_pattern = r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,3})'
@@ -440,14 +918,12 @@ def extract_address_components(text):
             result['ToName'] = name_match.group(1)
     
     # Find street address pattern
-    street_pattern = r'(\d+\s+[A-Za-z\s]+(?:(?:St|Street|Ave|Avenue|Rd|Road|Dr|Drive|Ln|Lane|Blvd|Boulevard|Pl|Place|Ct|Court|Way|Trl|Trail|Cir|Circle|Pkwy|Parkway))?)'
-    street_match = re.search(street_pattern, text, re.IGNORECASE)
+    street_match = STREET_PATTERN.search(text)
     if street_match:
         result['Street1To'] = street_match.group(1)
     
     # Find city, state, zip pattern
-    csz_pattern = r'([A-Za-z\s]+),\s*([A-Z]{2})\s*(\d{5}(?:-\d{4})?)'
-    csz_match = re.search(csz_pattern, text)
+    csz_match = search_city_state_zip(text)
     if csz_match:
         result['CityTo'] = csz_match.group(1).strip()
         result['StateTo'] = csz_match.group(2)
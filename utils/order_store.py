@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+
+from utils.db import connect
+
+# Order IDs per lookup query, well under SQLite's limit on bound parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+class OrderStore:
+    """
+    Every order the app has extracted, keyed on order_id, and when it was last exported.
+
+    Used to catch orders that show up on more than one paste so they are not
+    shipped twice. Lookups go through the primary key in chunks, so checking a
+    paste stays fast with hundreds of thousands of stored orders.
+
+    Each export also notes the dataset (one extraction) it came from, so building
+    the CSV again for the same extraction does not count as a second shipment.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " order_id TEXT PRIMARY KEY, to_name TEXT, zip TEXT, first_seen_at REAL NOT NULL,"
+            " last_seen_at REAL NOT NULL, exported_at REAL, export_count INTEGER NOT NULL DEFAULT 0"
+            ") WITHOUT ROWID"
+        )
+        # A separate table rather than a new column, so databases from before it need no migration
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS order_exports ("
+            " order_id TEXT NOT NULL, dataset_id TEXT NOT NULL, exported_at REAL NOT NULL,"
+            " PRIMARY KEY (order_id, dataset_id)"
+            ") WITHOUT ROWID"
+        )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share one
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def lookup(self, order_ids):
+        """
+        Look up many orders at once.
+
+        Args:
+            order_ids (iterable): Order IDs; empty ones are ignored
+
+        Returns:
+            dict: order_id -> {'first_seen_at', 'exported_at', 'export_count'} for the stored ones
+        """
+        order_ids = list(dict.fromkeys(order_id for order_id in order_ids if order_id))
+        found = {}
+        connection = self._connection()
+        for start in range(0, len(order_ids), LOOKUP_CHUNK_SIZE):
+            chunk = order_ids[start:start + LOOKUP_CHUNK_SIZE]
+            rows = connection.execute(
+                f"SELECT order_id, first_seen_at, exported_at, export_count FROM orders"
+                f" WHERE order_id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for order_id, first_seen_at, exported_at, export_count in rows:
+                found[order_id] = {'first_seen_at': first_seen_at, 'exported_at': exported_at,
+                                   'export_count': export_count}
+        return found
+
+    def record(self, addresses):
+        """
+        Store newly extracted orders and report which were exported before.
+
+        Args:
+            addresses (list): Address dicts from the parser; ones without an order_id are skipped
+
+        Returns:
+            set: Order IDs among the addresses that were already exported
+        """
+        addresses = [address for address in addresses if address.get('order_id')]
+        if not addresses:
+            return set()
+
+        previous = self.lookup(address['order_id'] for address in addresses)
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO orders (order_id, to_name, zip, first_seen_at, last_seen_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (order_id) DO UPDATE SET last_seen_at = excluded.last_seen_at,"
+                " to_name = excluded.to_name, zip = excluded.zip",
+                [(address['order_id'], address.get('ToName', ''), address.get('ZipTo', ''), now, now)
+                 for address in addresses]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        return {order_id for order_id, info in previous.items() if info['exported_at'] is not None}
+
+    def exported_elsewhere(self, order_ids, dataset_id=None):
+        """
+        Find the orders that already went out in a CSV built from a different dataset.
+
+        Exports recorded without a dataset (orders typed in by hand, or exported
+        before datasets were tracked) always count.
+
+        Args:
+            order_ids (iterable): Order IDs; empty ones are ignored
+            dataset_id (str): The dataset the new CSV is built from, or None
+
+        Returns:
+            set: The order IDs exported before outside this dataset
+        """
+        order_ids = list(dict.fromkeys(order_id for order_id in order_ids if order_id))
+        found = set()
+        connection = self._connection()
+        for start in range(0, len(order_ids), LOOKUP_CHUNK_SIZE):
+            chunk = order_ids[start:start + LOOKUP_CHUNK_SIZE]
+            rows = connection.execute(
+                f"SELECT order_id FROM orders o WHERE order_id IN ({','.join('?' * len(chunk))})"
+                f" AND exported_at IS NOT NULL AND ("
+                f"  NOT EXISTS (SELECT 1 FROM order_exports e WHERE e.order_id = o.order_id)"
+                f"  OR EXISTS (SELECT 1 FROM order_exports e WHERE e.order_id = o.order_id"
+                f"   AND (e.dataset_id != ? OR e.dataset_id = '')))",
+                chunk + [dataset_id or '']
+            )
+            found.update(order_id for order_id, in rows)
+        return found
+
+    def mark_exported(self, order_ids, dataset_id=None):
+        """
+        Record that these orders went out in a shipping CSV.
+
+        Args:
+            order_ids (iterable): Order IDs; empty ones are ignored
+            dataset_id (str): The dataset the CSV was built from, or None for orders typed in by hand
+        """
+        now = time.time()
+        rows = [(now, now, now, order_id) for order_id in dict.fromkeys(order_ids) if order_id]
+        if not rows:
+            return
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Orders typed in by hand were never extracted, so insert them as needed
+            connection.executemany(
+                "INSERT INTO orders (exported_at, first_seen_at, last_seen_at, order_id, export_count)"
+                " VALUES (?, ?, ?, ?, 1)"
+                " ON CONFLICT (order_id) DO UPDATE SET exported_at = excluded.exported_at,"
+                " export_count = export_count + 1",
+                rows
+            )
+            connection.executemany(
+                "INSERT INTO order_exports (exported_at, order_id, dataset_id) VALUES (?, ?, ?)"
+                " ON CONFLICT (order_id, dataset_id) DO UPDATE SET exported_at = excluded.exported_at",
+                [(now, row[-1], dataset_id or '') for row in rows]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*), COUNT(exported_at) FROM orders"
+        ).fetchone()
+        return {'orders': row[0], 'exported': row[1]}
@@ -0,0 +1,148 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_key(content):
+    """
+    Hash pasted content into a cache key.
+
+    Leading/trailing whitespace and Windows line endings are normalized first so
+    the same page pasted from a different browser or OS maps to the same key.
+
+    Args:
+        content (str or bytes): The pasted content
+
+    Returns:
+        str: Hex SHA-256 digest of the normalized content
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    normalized = content.strip().replace(b'\r\n', b'\n')
+    return hashlib.sha256(normalized).hexdigest()
+
+
+def _estimate_size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with entry-count, size and TTL limits.
+
+    Values are deep-copied in and out, so callers can freely modify what they
+    get back without corrupting the cached copy.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=16 * 1024 * 1024, ttl=900):
+        """
+        Args:
+            max_entries (int): Maximum number of cached results
+            max_bytes (int): Maximum total size of cached results, measured as JSON
+            ttl (float): Seconds a result stays valid; None or 0 disables expiry
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        Args:
+            key (str): Cache key, usually from content_key()
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, key, value):
+        """
+        Store a result, evicting expired and least recently used entries as needed.
+
+        Args:
+            key (str): Cache key, usually from content_key()
+            value: JSON-serializable result to cache
+        """
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (expires_at, size, value)
+            self._total_bytes += size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss/eviction counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def _evict(self):
+        # Trim from the least recently used end while over a limit or expired.
+        # Expired entries further in are dropped lazily by get().
+        now = time.monotonic()
+        while self._entries:
+            key = next(iter(self._entries))
+            expires_at = self._entries[key][0]
+            over_limit = len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+            if not over_limit and (expires_at is None or expires_at > now):
+                break
+            self._remove(key)
+            self.evictions += 1
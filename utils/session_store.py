@@ -0,0 +1,169 @@
+import os
+import time
+import uuid
+import logging
+import threading
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from utils.db import connect
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session whose data lives in the store; only its signed ID goes in the cookie."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+
+
+class SqliteSessionInterface(SessionInterface):
+    """
+    Flask session interface backed by a SQLite file shared by all workers.
+
+    Sessions expire ttl seconds after they were last used. Every prune_every
+    writes, expired sessions are deleted and the least recently used ones are
+    dropped until the store is under max_sessions and max_bytes.
+    """
+
+    salt = 'server-side-session'
+
+    def __init__(self, path, ttl=24 * 3600, max_sessions=5000, max_bytes=256 * 1024 * 1024, prune_every=100,
+                 serializer=None):
+        """
+        Args:
+            path (str): SQLite database file
+            ttl (float): Seconds a session lives after it was last used
+            max_sessions (int): Sessions kept before the least recently used are dropped
+            max_bytes (int): Total serialized session data kept, likewise
+            prune_every (int): Session writes between eviction passes
+            serializer (TaggedJSONSerializer): Encodes session data; Flask's default if None
+        """
+        self.path = path
+        self.serializer = serializer or TaggedJSONSerializer()
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+        self._create_table()
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share one
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_table(self):
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection().execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+
+        signed_sid = request.cookies.get(self.get_cookie_name(app))
+        if signed_sid:
+            try:
+                sid = self._signer(app).unsign(signed_sid).decode('utf-8')
+            except BadSignature:
+                sid = None
+
+            if sid:
+                row = self._connection().execute(
+                    "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?", (sid, time.time())
+                ).fetchone()
+                if row:
+                    try:
+                        return ServerSideSession(self.serializer.loads(row[0]), sid=sid, expires_at=row[1])
+                    except ValueError:
+                        logging.warning("Discarding unreadable session data")
+
+        return ServerSideSession(sid=uuid.uuid4().hex, new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        connection = self._connection()
+
+        # An emptied session is removed from the store along with its cookie
+        if not session:
+            if session.modified:
+                connection.execute("DELETE FROM sessions WHERE id = ?", (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        if session.modified or session.new:
+            data = self.serializer.dumps(dict(session))
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, size, expires_at) VALUES (?, ?, ?, ?)",
+                (session.sid, data, len(data), now + self.ttl)
+            )
+            self._count_write(connection)
+        elif session.expires_at is not None and session.expires_at - now < self.ttl / 2:
+            # Keep a session that is only being read alive without rewriting its data every request
+            connection.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (now + self.ttl, session.sid))
+        elif not session.new:
+            return
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            max_age=int(self.ttl),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            httponly=self.get_cookie_httponly(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def _count_write(self, connection):
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune(connection)
+
+    def prune(self, connection=None):
+        """
+        Delete expired sessions, then the least recently used ones over the count or size limit.
+
+        Returns:
+            int: Number of sessions deleted
+        """
+        connection = connection or self._connection()
+        deleted = connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+        # Sessions expire a fixed time after their last use, so the soonest to expire is the least recently used
+        deleted += connection.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            " SELECT id FROM ("
+            "  SELECT id, ROW_NUMBER() OVER newest AS position, SUM(size) OVER newest AS running_bytes"
+            "  FROM sessions WINDOW newest AS (ORDER BY expires_at DESC))"
+            " WHERE position > ? OR running_bytes > ?)",
+            (self.max_sessions, self.max_bytes)
+        ).rowcount
+        if deleted:
+            logging.info(f"Pruned {deleted} sessions")
+        return deleted
+
+    def stats(self):
+        row = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        return {'sessions': row[0], 'bytes': row[1]}
@@ -0,0 +1,239 @@
+from operator import attrgetter
+from collections.abc import MutableMapping
+
+from flask.json.provider import DefaultJSONProvider
+from flask.json.tag import JSONTag, TaggedJSONSerializer
+
+# Every field an address can carry, in the order they are serialized
+ADDRESS_FIELDS = (
+    'ToName', 'PhoneTo', 'Street1To', 'CompanyTo', 'Street2To', 'CityTo', 'ZipTo', 'StateTo', 'order_id',
+    'Weight', 'length', 'width', 'height', 'description', 'current_address'
+)
+_FIELD_SET = frozenset(ADDRESS_FIELDS)
+_get_all = attrgetter(*ADDRESS_FIELDS)
+
+
+class _Missing:
+    """Marks a field that was never set, so it is left out like a missing dict key."""
+
+    def __repr__(self):
+        return '<missing>'
+
+
+_MISSING = _Missing()
+
+
+class ShippingAddress(MutableMapping):
+    """
+    One shipping address, stored in slots instead of a per-address dict.
+
+    It behaves like the dicts the parser used to return: fields are read and
+    written with address['ToName'], fields that were never set are absent,
+    and it compares equal to a dict with the same items. Only ADDRESS_FIELDS
+    can be set.
+    """
+
+    __slots__ = ADDRESS_FIELDS
+
+    def __init__(self, data=None, **fields):
+        """
+        Args:
+            data (Mapping): Initial fields, e.g. a parsed JSON object
+            **fields: More fields; these win over data
+
+        Raises:
+            KeyError: If a field is not in ADDRESS_FIELDS
+        """
+        if fields:
+            data = {**data, **fields} if data else fields
+        elif data is None:
+            data = {}
+        if not _FIELD_SET.issuperset(data):
+            raise KeyError(f"Unknown address fields {sorted(set(data) - _FIELD_SET)}")
+
+        get = data.get
+        for name in ADDRESS_FIELDS:
+            object.__setattr__(self, name, get(name, _MISSING))
+
+    def __getitem__(self, key):
+        value = getattr(self, key, _MISSING) if key in _FIELD_SET else _MISSING
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in _FIELD_SET:
+            raise KeyError(f"Unknown address field {key!r}")
+        object.__setattr__(self, key, value)
+
+    def __delitem__(self, key):
+        self[key]
+        object.__setattr__(self, key, _MISSING)
+
+    def __iter__(self):
+        return (name for name, value in zip(ADDRESS_FIELDS, _get_all(self)) if value is not _MISSING)
+
+    def __len__(self):
+        return sum(value is not _MISSING for value in _get_all(self))
+
+    def __contains__(self, key):
+        return key in _FIELD_SET and getattr(self, key) is not _MISSING
+
+    def __repr__(self):
+        return f"ShippingAddress({self.to_dict()!r})"
+
+    # Pickle (process pools) and deepcopy (caches) go through the plain dict
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The fields that are set, in ADDRESS_FIELDS order
+        """
+        return {name: value for name, value in zip(ADDRESS_FIELDS, _get_all(self)) if value is not _MISSING}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Args:
+            data (dict): Address fields, e.g. from JSON
+
+        Returns:
+            ShippingAddress: The address
+
+        Raises:
+            KeyError: If data has a field that is not in ADDRESS_FIELDS
+        """
+        return cls(data)
+
+
+class AddressBatch:
+    """
+    Many addresses stored column by column, one list per field.
+
+    Used for large merged batches: a batch of n addresses holds one list per
+    field rather than n objects. Indexing and iterating give ShippingAddress
+    records.
+    """
+
+    __slots__ = ('_columns', '_length')
+
+    def __init__(self, addresses=()):
+        self._columns = {name: [] for name in ADDRESS_FIELDS}
+        self._length = 0
+        self.extend(addresses)
+
+    def append(self, address):
+        """
+        Args:
+            address (Mapping): A ShippingAddress or address dict
+
+        Raises:
+            KeyError: If the address has a field that is not in ADDRESS_FIELDS
+        """
+        unknown = set(address) - _FIELD_SET
+        if unknown:
+            raise KeyError(f"Unknown address fields {sorted(unknown)}")
+        for name, column in self._columns.items():
+            column.append(address.get(name, _MISSING))
+        self._length += 1
+
+    def extend(self, addresses):
+        for address in addresses:
+            self.append(address)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('address index out of range')
+        address = ShippingAddress()
+        for name, column in self._columns.items():
+            object.__setattr__(address, name, column[index])
+        return address
+
+    def __iter__(self):
+        return (self[index] for index in range(self._length))
+
+    def column(self, name):
+        """
+        Args:
+            name (str): A field from ADDRESS_FIELDS
+
+        Returns:
+            list: The field's values, '' where an address doesn't have it
+        """
+        return [('' if value is _MISSING else value) for value in self._columns[name]]
+
+    def to_records(self):
+        """
+        Returns:
+            list: One dict per address, like ShippingAddress.to_dict()
+        """
+        names = list(self._columns)
+        return [
+            {name: value for name, value in zip(names, values) if value is not _MISSING}
+            for values in zip(*self._columns.values())
+        ]
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(records)
+
+
+def to_jsonable(value):
+    """
+    json.dumps default= hook for addresses and batches.
+
+    Raises:
+        TypeError: For any other type, like json.dumps does
+    """
+    if isinstance(value, ShippingAddress):
+        return value.to_dict()
+    if isinstance(value, AddressBatch):
+        return value.to_records()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class AddressJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes ShippingAddress and AddressBatch."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (ShippingAddress, AddressBatch)):
+            return to_jsonable(o)
+        return DefaultJSONProvider.default(o)
+
+
+class ShippingAddressTag(JSONTag):
+    """Session serializer tag that loads stored addresses back as ShippingAddress records."""
+
+    __slots__ = ()
+    key = ' sa'
+
+    def check(self, value):
+        return isinstance(value, ShippingAddress)
+
+    def to_json(self, value):
+        # Address fields are plain strings, so they need no tags of their own
+        return value.to_dict()
+
+    def to_python(self, value):
+        return ShippingAddress(value)
+
+
+def session_serializer():
+    """
+    Returns:
+        TaggedJSONSerializer: Flask's session serializer, plus ShippingAddressTag
+    """
+    serializer = TaggedJSONSerializer()
+    serializer.register(ShippingAddressTag)
+    return serializer
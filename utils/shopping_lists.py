@@ -0,0 +1,252 @@
+import os
+import time
+import uuid
+import threading
+
+from utils.db import connect
+
+# Fields of a row the operator can change
+SHOPPING_LIST_EDIT_FIELDS = ('title', 'qty', 'removed')
+
+
+class ShoppingListConflict(Exception):
+    """Raised when changes were made against an older version of a list."""
+
+    def __init__(self, version):
+        super().__init__(f"The shopping list has changed; it is now at version {version}")
+        self.version = version
+
+
+def row_change_errors(changes):
+    """
+    Check one row's changes before they are stored.
+
+    Args:
+        changes: Field -> new value, as decoded from JSON
+
+    Returns:
+        list: What is wrong with them; empty if they can be stored
+    """
+    if not isinstance(changes, dict) or not changes:
+        return ["expected an object of changed fields"]
+    errors = []
+    unknown = set(changes) - set(SHOPPING_LIST_EDIT_FIELDS)
+    if unknown:
+        errors.append(f"unknown fields: {', '.join(sorted(unknown))}")
+    if 'title' in changes and not isinstance(changes['title'], str):
+        errors.append("title must be a string")
+    if 'qty' in changes and (type(changes['qty']) is not int or changes['qty'] < 1):
+        errors.append("qty must be a whole number of at least 1")
+    if 'removed' in changes and not isinstance(changes['removed'], bool):
+        errors.append("removed must be true or false")
+    return errors
+
+
+def validate_list_rows(rows):
+    """
+    Check a whole shopping list sent as compact rows, in one pass.
+
+    Every row is checked, so the caller can report all the problems at once
+    instead of stopping at the first.
+
+    Args:
+        rows: [asin, title, qty] arrays, as decoded from JSON
+
+    Returns:
+        tuple: ([(asin, title, qty), ...], ["row N: problem", ...]); the rows
+               are only complete if there are no errors
+    """
+    if not isinstance(rows, list) or not rows:
+        return [], ["rows must be a non-empty array of [asin, title, qty]"]
+
+    valid = []
+    errors = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, list) or len(row) != 3:
+            errors.append(f"row {i}: expected [asin, title, qty]")
+            continue
+        asin, title, qty = row
+        if not isinstance(asin, str) or not asin.strip():
+            errors.append(f"row {i}: asin must be a non-empty string")
+        elif not isinstance(title, str):
+            errors.append(f"row {i}: title must be a string")
+        elif type(qty) is not int or qty < 1:
+            errors.append(f"row {i}: qty must be a whole number of at least 1")
+        else:
+            valid.append((asin.strip(), title, qty))
+    return valid, errors
+
+
+class ShoppingListStore:
+    """
+    Editable shopping lists from the advanced ASIN counter, kept in SQLite row by row.
+
+    The page only ever holds one window of rows, so it keeps its edits and
+    sends just the changed rows, against the version it loaded, instead of
+    posting the whole list back in a form. Rows keep the position they were
+    created at; removing a row only marks it. Every save bumps the list's
+    version. Lists untouched for ttl seconds are deleted.
+    """
+
+    def __init__(self, path, ttl=24 * 3600):
+        """
+        Args:
+            path (str): SQLite database file
+            ttl (float): Seconds a list is kept after it was last changed
+        """
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS shopping_lists ("
+            " id TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS shopping_list_rows ("
+            " list_id TEXT NOT NULL, position INTEGER NOT NULL, asin TEXT NOT NULL, title TEXT NOT NULL,"
+            " qty INTEGER NOT NULL, removed INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (list_id, position)"
+            ") WITHOUT ROWID"
+        )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share one
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def create(self, sorted_data):
+        """
+        Store a new list.
+
+        Args:
+            sorted_data (list): (asin, {'title', 'qty'}) pairs, in display order
+
+        Returns:
+            str: The list ID
+        """
+        self.prune()
+        list_id = uuid.uuid4().hex
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO shopping_lists (id, version, updated_at) VALUES (?, 1, ?)", (list_id, time.time())
+            )
+            connection.executemany(
+                "INSERT INTO shopping_list_rows (list_id, position, asin, title, qty) VALUES (?, ?, ?, ?, ?)",
+                [(list_id, position, asin, info['title'], info['qty'])
+                 for position, (asin, info) in enumerate(sorted_data)]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return list_id
+
+    def window(self, list_id, offset=0, limit=100):
+        """
+        One page of the rows still on a list.
+
+        Args:
+            list_id (str): The list
+            offset (int): Rows to skip
+            limit (int): Rows to return
+
+        Returns:
+            dict: {'version', 'total', 'offset', 'rows': [{'index', 'asin', 'title', 'qty'}, ...]},
+                  or None if the list is unknown or has expired. 'index' is the
+                  row's position, used to edit it
+        """
+        connection = self._connection()
+        row = connection.execute("SELECT version FROM shopping_lists WHERE id = ?", (list_id,)).fetchone()
+        if row is None:
+            return None
+
+        total = connection.execute(
+            "SELECT COUNT(*) FROM shopping_list_rows WHERE list_id = ? AND removed = 0", (list_id,)
+        ).fetchone()[0]
+        rows = connection.execute(
+            "SELECT position, asin, title, qty FROM shopping_list_rows WHERE list_id = ? AND removed = 0"
+            " ORDER BY position LIMIT ? OFFSET ?", (list_id, limit, offset)
+        )
+        return {
+            'version': row[0],
+            'total': total,
+            'offset': offset,
+            'rows': [{'index': position, 'asin': asin, 'title': title, 'qty': qty}
+                     for position, asin, title, qty in rows]
+        }
+
+    def apply_changes(self, list_id, version, changes):
+        """
+        Change many rows at once, only if nobody changed the list since version.
+
+        All the changes are stored in one transaction and bump the version
+        once; if any row doesn't exist, none of them are stored.
+
+        Args:
+            list_id (str): The list
+            version (int): The version the changes were made against
+            changes (list): (index, changes) pairs, each already checked with row_change_errors()
+
+        Returns:
+            int: The list's new version (unchanged if there were no changes),
+                 or None if the list doesn't exist
+
+        Raises:
+            ShoppingListConflict: If the list is no longer at version
+            ValueError: If a row doesn't exist
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT version FROM shopping_lists WHERE id = ?", (list_id,)).fetchone()
+            if row is None:
+                version = None
+            elif row[0] != version:
+                raise ShoppingListConflict(row[0])
+            elif changes:
+                # One statement for every row; fields a change leaves out keep their value
+                updated = connection.executemany(
+                    "UPDATE shopping_list_rows SET title = COALESCE(?, title), qty = COALESCE(?, qty),"
+                    " removed = COALESCE(?, removed) WHERE list_id = ? AND position = ?",
+                    [(change.get('title'), change.get('qty'), change.get('removed'), list_id, index)
+                     for index, change in changes]
+                ).rowcount
+                if updated != len(changes):
+                    raise ValueError("Some of the changed rows are not on the list")
+                version = self._bump(connection, list_id)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return version
+
+    def rows(self, list_id):
+        """
+        Yields:
+            tuple: (asin, title, qty) for every row still on the list, in order
+        """
+        yield from self._connection().execute(
+            "SELECT asin, title, qty FROM shopping_list_rows WHERE list_id = ? AND removed = 0 ORDER BY position",
+            (list_id,)
+        )
+
+    def prune(self):
+        """Delete lists that haven't changed for ttl seconds."""
+        connection = self._connection()
+        cutoff = time.time() - self.ttl
+        connection.execute(
+            "DELETE FROM shopping_list_rows WHERE list_id IN (SELECT id FROM shopping_lists WHERE updated_at <= ?)",
+            (cutoff,)
+        )
+        connection.execute("DELETE FROM shopping_lists WHERE updated_at <= ?", (cutoff,))
+
+    def _bump(self, connection, list_id):
+        connection.execute(
+            "UPDATE shopping_lists SET version = version + 1, updated_at = ? WHERE id = ?", (time.time(), list_id)
+        )
+        return connection.execute("SELECT version FROM shopping_lists WHERE id = ?", (list_id,)).fetchone()[0]
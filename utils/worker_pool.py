@@ -0,0 +1,220 @@
+import sys
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolBusy(RuntimeError):
+    """Raised when the pool's queue is full and a job cannot be accepted."""
+
+
+class JobTimeout(TimeoutError):
+    """Raised when a job does not finish within its timeout."""
+
+
+def _warm_worker():
+    # Import the parser (and with it bs4 and the compiled patterns) once per
+    # worker, so the first job a fresh worker runs doesn't pay for it
+    import utils.html_parser
+    utils.html_parser.collect_candidates(utils.html_parser.BeautifulSoup('<table><tr></tr></table>', 'html.parser'))
+
+
+def _noop():
+    return None
+
+
+class ParserPool:
+    """
+    Pre-warmed process pool for CPU-bound parsing off the request thread.
+
+    Jobs are admitted up to max_workers + max_queue at a time; past that,
+    submit() raises PoolBusy so the caller can answer 503 instead of letting
+    requests pile up. Workers are replaced after max_tasks_per_child jobs, and
+    the whole pool is replaced if timed-out jobs start to hold up the workers.
+    The pool starts lazily, so processes are never forked in a gunicorn master.
+    """
+
+    def __init__(self, max_workers=2, max_queue=8, timeout=30, max_tasks_per_child=200):
+        """
+        Args:
+            max_workers (int): Worker processes
+            max_queue (int): Jobs allowed to wait for a free worker
+            timeout (float): Default seconds to wait for a job
+            max_tasks_per_child (int): Jobs a worker runs before it is replaced
+                (Python 3.11+; ignored on older versions)
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stuck_jobs = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                kwargs = {'max_workers': self.max_workers, 'initializer': _warm_worker}
+                if sys.version_info >= (3, 11) and self.max_tasks_per_child:
+                    kwargs['max_tasks_per_child'] = self.max_tasks_per_child
+                self._executor = ProcessPoolExecutor(**kwargs)
+                self._stuck_jobs = 0
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a job without waiting for it.
+
+        Returns:
+            concurrent.futures.Future: The job's future
+
+        Raises:
+            PoolBusy: If the pool already holds as many jobs as it admits
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PoolBusy("The server is busy with other extractions. Please try again in a moment.")
+        return self._start(fn, args, kwargs)
+
+    def _start(self, fn, args, kwargs):
+        # The caller holds a slot for this job; it is released when the job ends
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(self._job_done)
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Run a job in the pool and wait for its result.
+
+        Args:
+            fn: Picklable, module-level function to call
+            timeout (float): Seconds to wait; defaults to the pool's timeout
+
+        Returns:
+            The job's return value
+
+        Raises:
+            PoolBusy: If the queue is full
+            JobTimeout: If the job didn't finish in time
+        """
+        future = self.submit(fn, *args, **kwargs)
+        timeout = timeout or self.timeout
+        return self._wait(deque([future]), time.monotonic() + timeout, timeout)
+
+    def map(self, fn, items, timeout=None):
+        """
+        Run fn over many items in the pool and wait for all the results.
+
+        The items share the pool's admission limit with every other job: at
+        most max_workers of them are in the pool at once, and when the pool is
+        full the next item waits for one of this call's own jobs to finish.
+        Only if none of them is in the pool yet is the call turned away.
+
+        Args:
+            fn: Picklable, module-level function of one item
+            items (list): The items
+            timeout (float): Seconds for the whole call; defaults to the pool's timeout
+
+        Returns:
+            list: fn's results, in the same order as items
+
+        Raises:
+            PoolBusy: If the pool is full before the first item gets in
+            JobTimeout: If the items didn't all finish in time; the unfinished ones are dropped
+        """
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        results = []
+        in_flight = deque()
+        for item in items:
+            # Wait for this call's oldest job whenever it already has a job per worker or the pool is full
+            while len(in_flight) >= self.max_workers or not self._slots.acquire(blocking=False):
+                if not in_flight:
+                    self.rejected += 1
+                    raise PoolBusy("The server is busy with other extractions. Please try again in a moment.")
+                results.append(self._wait(in_flight, deadline, timeout))
+            in_flight.append(self._start(fn, (item,), {}))
+        while in_flight:
+            results.append(self._wait(in_flight, deadline, timeout))
+        return results
+
+    def _wait(self, futures, deadline, timeout):
+        # Result of the first job in the futures deque; on failure the rest are given up too
+        future = futures.popleft()
+        try:
+            return future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            self.timed_out += 1
+            for job in [future, *futures]:
+                if not job.cancel():
+                    self._job_stuck()
+            raise JobTimeout(f"Extraction did not finish within {timeout} seconds")
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory); start over with a fresh pool next time
+            logging.error("Parser pool is broken, replacing it")
+            self.shutdown()
+            raise
+        except BaseException:
+            for job in futures:
+                job.cancel()
+            raise
+
+    def warm(self):
+        """
+        Start the workers now rather than on the first job, e.g. from a gunicorn
+        post_fork hook, so the first large paste doesn't wait for process start-up.
+        """
+        executor = self._get_executor()
+        for future in [executor.submit(_noop) for _ in range(self.max_workers)]:
+            future.result()
+
+    def stats(self):
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _job_done(self, future):
+        self._slots.release()
+        if not future.cancelled():
+            self.completed += 1
+
+    def _job_stuck(self):
+        # A timed-out job is still running and holding a worker. Once half the
+        # workers are tied up like that, start a fresh pool; the old workers
+        # exit as soon as their current job ends.
+        with self._lock:
+            self._stuck_jobs += 1
+            if self._executor is not None and self._stuck_jobs * 2 >= self.max_workers:
+                logging.warning("Recycling parser pool after %d stuck jobs", self._stuck_jobs)
+                self._executor.shutdown(wait=False, cancel_futures=False)
+                self._executor = None
+
+
+def create_parser_pool(**kwargs):
+    """Create a ParserPool that is shut down when the interpreter exits."""
+    pool = ParserPool(**kwargs)
+    atexit.register(pool.shutdown)
+    return pool